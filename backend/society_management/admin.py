@@ -129,3 +129,23 @@ class AdBannerAdmin(admin.ModelAdmin):
     list_display = ('title', 'placement_location', 'is_active', 'start_date', 'end_date')
     list_filter = ('placement_location', 'is_active')
     search_fields = ('title',)
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'queue', 'priority', 'status', 'attempts', 'run_at', 'duration_ms', 'finished_at')
+    list_filter = ('status', 'queue', 'task')
+    search_fields = ('task',)
+    readonly_fields = ('created_at', 'started_at', 'heartbeat_at', 'finished_at', 'duration_ms', 'locked_by')
+
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'task', 'interval_seconds', 'next_run_at', 'last_enqueued_at')
+
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    list_display = ('jti', 'revoked_at', 'expires_at')
+    search_fields = ('jti',)
+    readonly_fields = ('jti', 'revoked_at', 'expires_at')
@@ -0,0 +1,90 @@
+"""
+Annotated aggregate serializer fields.
+
+Instead of a ``SerializerMethodField`` that runs ``obj.<relation>.count()`` for every
+row, a serializer declares the aggregate and the viewset queryset receives a single
+``annotate(Count(..., filter=Q(...)))``::
+
+    available_flats = AnnotatedCountField('flats', filter={'is_available': True})
+
+``filter`` holds lookups relative to the related model. The relation planner adds the
+annotation (named after the serializer field) to querysets served through
+``RelationPlannerMixin``; instances that were not loaded through such a queryset, e.g.
+the object returned from create/update, fall back to one query per field.
+"""
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+
+class AnnotatedAggregateField:
+    """Behaviour shared by the annotated aggregate fields"""
+
+    def __init__(self, relation, filter=None, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)  # type: ignore
+        self.relation = relation
+        self.filter = dict(filter or {})
+
+    def get_filter_q(self):
+        if not self.filter:
+            return None
+        return Q(**{f'{self.relation}__{lookup}': value for lookup, value in self.filter.items()})
+
+    def get_annotation(self, distinct=False):
+        raise NotImplementedError
+
+    def related_queryset(self, instance):
+        queryset = getattr(instance, self.relation).all()
+        if self.filter:
+            queryset = queryset.filter(**self.filter)
+        return queryset
+
+    def compute(self, instance):
+        raise NotImplementedError
+
+    def get_attribute(self, instance):
+        name = self.field_name  # type: ignore
+        if name in instance.__dict__:
+            return instance.__dict__[name]
+        return self.compute(instance)
+
+
+class AnnotatedCountField(AnnotatedAggregateField, serializers.IntegerField):
+    """Number of related rows, optionally filtered"""
+
+    def get_annotation(self, distinct=False):
+        return Count(self.relation, filter=self.get_filter_q(), distinct=distinct)
+
+    def compute(self, instance):
+        return self.related_queryset(instance).count()
+
+
+class AnnotatedSumField(AnnotatedAggregateField, serializers.DecimalField):
+    """Sum of a decimal column over related rows, zero when there are none"""
+
+    def __init__(self, relation, column, filter=None, max_digits=12, decimal_places=2, **kwargs):
+        self.column = column
+        super().__init__(relation, filter=filter, max_digits=max_digits,
+                         decimal_places=decimal_places, **kwargs)
+
+    def get_annotation(self, distinct=False):
+        output_field = DecimalField(max_digits=self.max_digits, decimal_places=self.decimal_places)
+        return Coalesce(
+            Sum(f'{self.relation}__{self.column}', filter=self.get_filter_q(), output_field=output_field),
+            Value(0),
+            output_field=output_field,
+        )
+
+    def compute(self, instance):
+        return self.related_queryset(instance).aggregate(total=Sum(self.column))['total'] or 0
+
+
+def build_annotations(fields):
+    """Annotation expressions for aggregate fields keyed by serializer field name"""
+    relations = {field.relation for field in fields.values()}
+    if len(relations) > 1 and any(isinstance(f, AnnotatedSumField) for f in fields.values()):
+        # Joining several to-many relations multiplies rows; sums would be inflated
+        raise ValueError('AnnotatedSumField cannot be combined with aggregates over other relations')
+    distinct = len(relations) > 1
+    return {name: field.get_annotation(distinct=distinct) for name, field in fields.items()}
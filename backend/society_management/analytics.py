@@ -0,0 +1,262 @@
+"""
+Daily analytics rollups.
+
+``rollup_daily_stats`` materializes per-society, per-day facts into three compact
+tables, so reports over a month or a year read a few hundred summary rows instead of
+scanning bills, complaints, gate logs and bookings:
+
+* ``SocietyDailyStats`` - bills raised, paid and gone overdue (count and amount, over
+  maintenance bills and non-draft enhanced bills) and complaints opened and resolved
+* ``GateDailyStats`` - visitor, vehicle and denied entries per gate
+* ``AmenityDailyStats`` - booking requests per amenity and how they were decided
+
+Each fact is dated by the event it counts: a bill is raised on ``created_at``, paid on
+``paid_date`` and overdue on its ``due_date`` when it was not paid by then; complaints
+by ``created_at``/``resolved_at``, gate traffic by ``timestamp`` and bookings by
+``created_at``. Days are rebuilt whole, one grouped query per source per window of
+``WINDOW_DAYS``, and only days with activity get a row, so re-running a range is
+idempotent. The nightly run re-rolls the last ``ANALYTICS_ROLLUP_LOOKBACK_DAYS`` days to
+pick up late status changes.
+"""
+import datetime
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncDay, TruncMonth, TruncYear
+from django.utils import timezone
+
+
+WINDOW_DAYS = 31
+
+GROUPINGS = {
+    'day': TruncDay,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+SOCIETY_FIELDS = ('bills_raised', 'amount_billed', 'bills_paid', 'amount_collected', 'bills_overdue',
+                  'amount_overdue', 'complaints_opened', 'complaints_resolved')
+GATE_FIELDS = ('visitor_entries', 'visitor_exits', 'vehicle_entries', 'vehicle_exits', 'denied_entries')
+AMENITY_FIELDS = ('bookings', 'approved_bookings', 'rejected_bookings')
+
+AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+CENTS = Decimal('0.01')
+
+
+def lookback_days():
+    return getattr(settings, 'ANALYTICS_ROLLUP_LOOKBACK_DAYS', 7)
+
+
+def _day_bounds(start, end):
+    """Aware datetimes covering local days ``start`` to ``end`` inclusive"""
+    def midnight(day):
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return midnight(start), midnight(end + datetime.timedelta(days=1))
+
+
+def _grouped(queryset, society_path, day_expression, extra=(), **aggregates):
+    """Rows of ``(society_id, day, *extra, {aggregate: value})`` for one source"""
+    rows = (
+        queryset.order_by()
+        .annotate(rollup_society=F(society_path), rollup_day=day_expression)
+        .values('rollup_society', 'rollup_day', *extra)
+        .annotate(**aggregates)
+    )
+    for row in rows:
+        key = (row.pop('rollup_society'), row.pop('rollup_day')) + tuple(row.pop(name) for name in extra)
+        yield key, row
+
+
+def _society_facts(start, end, society_filter):
+    from .models import Complaint, EnhancedBill, MaintenanceBill
+
+    since, until = _day_bounds(start, end)
+    # A bill due today is not overdue until tomorrow
+    overdue_until = min(end, timezone.localdate() - datetime.timedelta(days=1))
+    unpaid_on_time = Q(paid_date__isnull=True) | Q(paid_date__date__gt=F('due_date'))
+
+    maintenance = MaintenanceBill.objects.filter(**society_filter('flat__society_id'))  # type: ignore
+    enhanced = EnhancedBill.objects.filter(**society_filter('society_id')).exclude(  # type: ignore
+        status__in=['DRAFT', 'CANCELLED']
+    )
+    complaints = Complaint.objects.filter(**society_filter('flat__society_id'))  # type: ignore
+
+    sources = [
+        (maintenance.filter(created_at__gte=since, created_at__lt=until), 'flat__society_id',
+         TruncDate('created_at'), {'bills_raised': Count('pk'), 'amount_billed': Sum('amount')}),
+        (maintenance.filter(status='PAID', paid_date__gte=since, paid_date__lt=until), 'flat__society_id',
+         TruncDate('paid_date'), {'bills_paid': Count('pk'),
+                                  'amount_collected': Sum(F('amount') + F('late_fee'), output_field=AMOUNT)}),
+        (maintenance.filter(unpaid_on_time, due_date__gte=start, due_date__lte=overdue_until), 'flat__society_id',
+         F('due_date'), {'bills_overdue': Count('pk'), 'amount_overdue': Sum('amount')}),
+        (enhanced.filter(created_at__gte=since, created_at__lt=until), 'society_id',
+         TruncDate('created_at'), {'bills_raised': Count('pk'), 'amount_billed': Sum('total_amount')}),
+        (enhanced.filter(status='PAID', paid_date__gte=since, paid_date__lt=until), 'society_id',
+         TruncDate('paid_date'), {'bills_paid': Count('pk'), 'amount_collected': Sum('paid_amount')}),
+        (enhanced.filter(unpaid_on_time, due_date__gte=start, due_date__lte=overdue_until), 'society_id',
+         F('due_date'), {'bills_overdue': Count('pk'), 'amount_overdue': Sum('total_amount')}),
+        (complaints.filter(created_at__gte=since, created_at__lt=until), 'flat__society_id',
+         TruncDate('created_at'), {'complaints_opened': Count('pk')}),
+        (complaints.filter(resolved_at__gte=since, resolved_at__lt=until), 'flat__society_id',
+         TruncDate('resolved_at'), {'complaints_resolved': Count('pk')}),
+    ]
+    facts = {}
+    for queryset, society_path, day_expression, aggregates in sources:
+        for key, values in _grouped(queryset, society_path, day_expression, **aggregates):
+            row = facts.setdefault(key, dict.fromkeys(SOCIETY_FIELDS, 0))
+            for field, value in values.items():
+                row[field] += value or 0
+    return facts
+
+
+def _gate_facts(start, end, society_filter):
+    from .models import GateUpdateLog
+
+    since, until = _day_bounds(start, end)
+    logs = GateUpdateLog.objects.filter(  # type: ignore
+        timestamp__gte=since, timestamp__lt=until, **society_filter('society_id')
+    )
+    return dict(_grouped(
+        logs, 'society_id', TruncDate('timestamp'), extra=('gate_number',),
+        visitor_entries=Count('pk', filter=Q(update_type='VISITOR_ENTRY')),
+        visitor_exits=Count('pk', filter=Q(update_type='VISITOR_EXIT')),
+        vehicle_entries=Count('pk', filter=Q(update_type='VEHICLE_ENTRY')),
+        vehicle_exits=Count('pk', filter=Q(update_type='VEHICLE_EXIT')),
+        denied_entries=Count('pk', filter=Q(update_type='DENIED_ENTRY')),
+    ))
+
+
+def _amenity_facts(start, end, society_filter):
+    from .models import AmenityBooking
+
+    since, until = _day_bounds(start, end)
+    bookings = AmenityBooking.objects.filter(  # type: ignore
+        created_at__gte=since, created_at__lt=until, **society_filter('amenity__society_id')
+    )
+    return dict(_grouped(
+        bookings, 'amenity__society_id', TruncDate('created_at'), extra=('amenity_id',),
+        bookings=Count('pk'),
+        approved_bookings=Count('pk', filter=Q(status='APPROVED')),
+        rejected_bookings=Count('pk', filter=Q(status='REJECTED')),
+    ))
+
+
+def _replace_window(start, end, society_ids):
+    from .models import AmenityDailyStats, GateDailyStats, SocietyDailyStats
+
+    def society_filter(path):
+        return {f'{path}__in': society_ids} if society_ids is not None else {}
+
+    society_facts = _society_facts(start, end, society_filter)
+    gate_facts = _gate_facts(start, end, society_filter)
+    amenity_facts = _amenity_facts(start, end, society_filter)
+
+    rows = 0
+    with transaction.atomic():
+        for model in (SocietyDailyStats, GateDailyStats, AmenityDailyStats):
+            model.objects.filter(date__gte=start, date__lte=end, **society_filter('society_id')).delete()  # type: ignore
+        rows += len(SocietyDailyStats.objects.bulk_create([  # type: ignore
+            SocietyDailyStats(society_id=society_id, date=day, **values)
+            for (society_id, day), values in society_facts.items()
+        ], batch_size=1000))
+        rows += len(GateDailyStats.objects.bulk_create([  # type: ignore
+            GateDailyStats(society_id=society_id, date=day, gate_number=gate_number, **values)
+            for (society_id, day, gate_number), values in gate_facts.items()
+        ], batch_size=1000))
+        rows += len(AmenityDailyStats.objects.bulk_create([  # type: ignore
+            AmenityDailyStats(society_id=society_id, date=day, amenity_id=amenity_id, **values)
+            for (society_id, day, amenity_id), values in amenity_facts.items()
+        ], batch_size=1000))
+    return rows
+
+
+def rollup_daily_stats(start=None, end=None, society_ids=None):
+    """
+    Rebuild the daily rollups for ``start``..``end`` (local dates, inclusive).
+
+    Defaults to the last ``ANALYTICS_ROLLUP_LOOKBACK_DAYS`` days up to today, which is
+    what the nightly run uses. ``society_ids`` limits the rebuild to some societies.
+    """
+    started = time.monotonic()
+    end = end or timezone.localdate()
+    start = start or end - datetime.timedelta(days=lookback_days() - 1)
+    if start > end:
+        raise ValueError('The rollup start date is after its end date')
+    if society_ids is not None:
+        society_ids = list(society_ids)
+
+    rows = windows = 0
+    window_start = start
+    while window_start <= end:
+        window_end = min(end, window_start + datetime.timedelta(days=WINDOW_DAYS - 1))
+        rows += _replace_window(window_start, window_end, society_ids)
+        windows += 1
+        window_start = window_end + datetime.timedelta(days=1)
+
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'windows': windows,
+        'rows': rows,
+        'duration_seconds': round(time.monotonic() - started, 3),
+    }
+
+
+def _report(model, society_id, start, end, group_by, fields, extra=()):
+    period = GROUPINGS[group_by]('date')
+    rows = (
+        model.objects.filter(society_id=society_id, date__gte=start, date__lte=end)  # type: ignore
+        .annotate(period=period)
+        .values('period', *extra)
+        .annotate(**{field: Sum(field) for field in fields})
+        .order_by('period', *extra)
+    )
+    return list(rows)
+
+
+def _finish(rows, fields, group_by):
+    """Format periods, sum the totals, and render amounts as strings like the serializers do"""
+    totals = dict.fromkeys(fields, 0)
+    for row in rows:
+        period = row['period']
+        if isinstance(period, datetime.datetime):
+            period = period.date()
+        row['period'] = {'month': period.strftime('%Y-%m'), 'year': period.strftime('%Y')}.get(group_by, period.isoformat())
+        for field in fields:
+            totals[field] += row[field] or 0
+            if isinstance(row[field], Decimal):
+                row[field] = str(row[field].quantize(CENTS))
+    for field in fields:
+        if isinstance(totals[field], Decimal):
+            totals[field] = str(totals[field].quantize(CENTS))
+    return {'rows': rows, 'totals': totals}
+
+
+def billing_report(society_id, start, end, group_by='day'):
+    """Bills and complaints per period, from SocietyDailyStats"""
+    from .models import SocietyDailyStats
+
+    rows = _report(SocietyDailyStats, society_id, start, end, group_by, SOCIETY_FIELDS)
+    return _finish(rows, SOCIETY_FIELDS, group_by)
+
+
+def gate_report(society_id, start, end, group_by='day'):
+    """Gate traffic per period and gate, from GateDailyStats"""
+    from .models import GateDailyStats
+
+    rows = _report(GateDailyStats, society_id, start, end, group_by, GATE_FIELDS, extra=('gate_number',))
+    return _finish(rows, GATE_FIELDS, group_by)
+
+
+def amenity_report(society_id, start, end, group_by='day'):
+    """Bookings per period and amenity, from AmenityDailyStats"""
+    from .models import AmenityDailyStats
+
+    rows = _report(AmenityDailyStats, society_id, start, end, group_by, AMENITY_FIELDS,
+                   extra=('amenity', 'amenity__name'))
+    for row in rows:
+        row['amenity_name'] = row.pop('amenity__name')
+    return _finish(rows, AMENITY_FIELDS, group_by)
@@ -0,0 +1,474 @@
+"""
+Monthly maintenance bill runs.
+
+A run creates one ``MaintenanceBill`` per flat of a society for a calendar month.
+The amount comes from the society's active ``FeeStructure`` for the flat type, or
+``SocietySettings.default_maintenance_amount`` when the type has none; the due date
+is ``SocietySettings.maintenance_due_day`` of the billed month.
+
+Flats are processed in id order and in batches, one transaction and one
+``bulk_create`` (plus the matching ledger charges) per batch. Flats already billed for
+the period are skipped and the ``(flat, billing_period_start)`` unique constraint
+fails a batch that a concurrent run has written first, so a period can safely be
+re-run (e.g. after adding flats).
+
+``sweep_overdue_bills`` moves unpaid bills past their due date to OVERDUE and charges
+``SocietySettings.late_fee_percentage`` on the way.
+
+Recurring ``EnhancedBill`` templates (``is_recurring`` with no ``parent_bill``) are
+materialized by ``materialize_recurring_bills``: every occurrence whose due date has
+been reached becomes a child bill and the template's ``next_due_date`` moves on by
+``BillType.recurrence_period``.
+"""
+import calendar
+import datetime
+import time
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from . import counters, ledger
+
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_DUE_DAY = 5
+
+
+def parse_period(value):
+    """'YYYY-MM' -> first day of that month"""
+    try:
+        year, month = (int(part) for part in value.split('-'))
+        return datetime.date(year, month, 1)
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError(f'Invalid billing period "{value}", expected YYYY-MM')
+
+
+def period_bounds(period_start):
+    last_day = calendar.monthrange(period_start.year, period_start.month)[1]
+    return period_start, period_start.replace(day=last_day)
+
+
+def due_date_for(period_start, due_day):
+    last_day = calendar.monthrange(period_start.year, period_start.month)[1]
+    return period_start.replace(day=min(max(due_day, 1), last_day))
+
+
+def add_months(value, months, day=None):
+    """Shift a date by whole months, keeping ``day`` (or its own day) where the month allows"""
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    last_day = calendar.monthrange(year, month)[1]
+    return datetime.date(year, month, min(day or value.day, last_day))
+
+
+class BillRunResult:
+    """Outcome of one society's bill run"""
+
+    def __init__(self, society_id, period_start, dry_run=False):
+        self.society_id = society_id
+        self.period_start = period_start
+        self.dry_run = dry_run
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+        self.duration = 0.0
+
+    @property
+    def throughput(self):
+        return self.created / self.duration if self.duration else 0.0
+
+    def as_dict(self):
+        return {
+            'society': self.society_id,
+            'period': self.period_start.strftime('%Y-%m'),
+            'dry_run': self.dry_run,
+            'created': self.created,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'duration_seconds': round(self.duration, 3),
+            'bills_per_second': round(self.throughput, 1),
+        }
+
+
+def _resolve_pricing(society):
+    from .models import FeeStructure, SocietySettings
+
+    amounts = dict(
+        FeeStructure.objects.filter(society=society, is_active=True)  # type: ignore
+        .values_list('flat_type', 'maintenance_amount')
+    )
+    settings_row = (
+        SocietySettings.objects.filter(society=society)  # type: ignore
+        .values('default_maintenance_amount', 'maintenance_due_day').first()
+    )
+    if settings_row:
+        return amounts, settings_row['default_maintenance_amount'], settings_row['maintenance_due_day']
+    return amounts, Decimal('0'), DEFAULT_DUE_DAY
+
+
+def _billed_flat_ids(flat_ids, period_start):
+    from .models import MaintenanceBill
+
+    return set(
+        MaintenanceBill.objects.filter(  # type: ignore
+            flat_id__in=flat_ids, billing_period_start=period_start
+        ).values_list('flat_id', flat=True)
+    )
+
+
+def _write_maintenance_bills(society_id, bills):
+    from .models import MaintenanceBill
+
+    with transaction.atomic():
+        MaintenanceBill.objects.bulk_create(bills)  # type: ignore
+        ledger.post([
+            ledger.entry(bill.flat_id, ledger.CHARGE, bill.amount, ledger.MAINTENANCE_BILL,
+                         bill.pk, ledger.maintenance_bill_description(bill))
+            for bill in bills
+        ])
+        counters.adjust({society_id: {'pending_bills': len(bills)}})
+
+
+def generate_maintenance_bills(society, period_start, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Bill every flat of a society for the month starting at period_start"""
+    from .models import Flat, MaintenanceBill
+
+    started = time.monotonic()
+    society_id = getattr(society, 'pk', society)
+    result = BillRunResult(society_id, period_start, dry_run)
+    start, end = period_bounds(period_start)
+    amounts, default_amount, due_day = _resolve_pricing(society_id)
+    due_date = due_date_for(start, due_day)
+
+    flats = Flat.objects.filter(society_id=society_id).order_by('id').values_list('id', 'type')  # type: ignore
+    last_id = 0
+    while True:
+        batch = list(flats.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        billed = _billed_flat_ids([flat_id for flat_id, _ in batch], start)
+        bills = []
+        for flat_id, flat_type in batch:
+            if flat_id in billed:
+                result.skipped += 1
+                continue
+            amount = amounts.get(flat_type, default_amount)
+            if not amount or amount <= 0:
+                result.errors.append({
+                    'flat': flat_id,
+                    'error': f'No maintenance amount configured for flat type "{flat_type}"'
+                })
+                continue
+            bills.append(MaintenanceBill(
+                flat_id=flat_id, amount=amount, due_date=due_date,
+                billing_period_start=start, billing_period_end=end,
+            ))
+
+        if bills and not dry_run:
+            try:
+                _write_maintenance_bills(society_id, bills)
+            except IntegrityError:
+                # A concurrent run billed some of these flats first; bill the rest
+                billed = _billed_flat_ids([bill.flat_id for bill in bills], start)
+                result.skipped += len(billed)
+                bills = [bill for bill in bills if bill.flat_id not in billed]
+                _write_maintenance_bills(society_id, bills)
+        result.created += len(bills)
+
+    result.duration = time.monotonic() - started
+    return result
+
+
+RECURRENCE_MONTHS = {
+    'monthly': 1,
+    'quarterly': 3,
+    'yearly': 12,
+}
+
+# Occurrences generated per template per batch; long-overdue templates catch up over
+# several batches
+MAX_OCCURRENCES_PER_TEMPLATE = 12
+
+
+def _recurrence_months(template):
+    period = (template.bill_type.recurrence_period or 'monthly').strip().lower()
+    return RECURRENCE_MONTHS.get(period)
+
+
+def _occurrence(template, due_date, bill_number):
+    from .models import EnhancedBill
+
+    return EnhancedBill(
+        society_id=template.society_id,
+        bill_type_id=template.bill_type_id,
+        bill_number=bill_number,
+        title=template.title,
+        description=template.description,
+        amount=template.amount,
+        tax_amount=template.tax_amount,
+        total_amount=template.amount + template.tax_amount,
+        outstanding_amount=template.amount + template.tax_amount,
+        payment_details=template.payment_details,
+        attachments=template.attachments,
+        due_date=due_date,
+        parent_bill_id=template.pk,
+        status='PENDING',
+        created_by_id=template.created_by_id,
+    )
+
+
+def _due_dates(template, as_of):
+    """Occurrence due dates of ``template`` up to ``as_of`` and the next due date after them"""
+    months = _recurrence_months(template)
+    due_dates = []
+    next_due = template.next_due_date
+    while next_due <= as_of and len(due_dates) < MAX_OCCURRENCES_PER_TEMPLATE:
+        due_dates.append(next_due)
+        next_due = add_months(next_due, months, day=template.due_date.day)
+    return due_dates, next_due
+
+
+def _reserve_bill_numbers(templates, as_of):
+    """
+    Bill numbers for the due occurrences of ``templates``, ``{prefix: [number, ...]}``.
+
+    Reserved before the templates are locked, one short transaction per prefix in sorted
+    order, so batches never hold a prefix's counter row while waiting on another and
+    interactive bill saves are not held up for a whole batch. Numbers reserved for a
+    template another worker got to first are left unused.
+    """
+    from .models import EnhancedBill
+
+    needed = {}
+    for template in templates:
+        if _recurrence_months(template) is not None:
+            prefix = EnhancedBill.bill_number_prefix(template.society)
+            needed[prefix] = needed.get(prefix, 0) + len(_due_dates(template, as_of)[0])
+    return {
+        prefix: list(EnhancedBill.allocate_prefixed_bill_numbers(prefix, needed[prefix]))
+        for prefix in sorted(needed) if needed[prefix]
+    }
+
+
+def _materialize_batch(template_ids, as_of, errors):
+    """Generate due occurrences for a batch of templates; returns bills created"""
+    from .models import EnhancedBill
+
+    candidates = EnhancedBill.objects.select_related('society', 'bill_type').filter(  # type: ignore
+        id__in=template_ids, next_due_date__lte=as_of
+    )
+    reserved = _reserve_bill_numbers(candidates, as_of)
+
+    with transaction.atomic():
+        # Templates another worker is already processing are skipped, not waited on
+        templates = list(candidates.select_for_update(skip_locked=True, of=('self',)))
+        bills, advanced = [], []
+        for template in templates:
+            if _recurrence_months(template) is None:
+                errors.append({
+                    'bill': template.pk,
+                    'error': f'Unknown recurrence period "{template.bill_type.recurrence_period}"'
+                })
+                continue
+            due_dates, next_due = _due_dates(template, as_of)
+            numbers = reserved.get(EnhancedBill.bill_number_prefix(template.society), [])
+            if len(numbers) < len(due_dates):
+                # Changed since the numbers were reserved; left for the next run
+                continue
+            bills.extend(_occurrence(template, due, numbers.pop(0)) for due in due_dates)
+            template.next_due_date = next_due
+            advanced.append(template)
+
+        EnhancedBill.objects.bulk_create(bills)  # type: ignore
+        EnhancedBill.objects.bulk_update(advanced, ['next_due_date'])  # type: ignore
+    return len(bills)
+
+
+def materialize_recurring_bills(as_of=None, batch_size=200):
+    """
+    Create every recurring bill occurrence due on or before ``as_of`` (default today).
+
+    Each batch of templates is claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` and
+    committed together with the advanced ``next_due_date``s, so concurrent or repeated
+    runs never generate an occurrence twice; the ``(parent_bill, due_date)`` unique
+    constraint backs this up on databases without row locks.
+    """
+    from .models import EnhancedBill
+
+    started = time.monotonic()
+    as_of = as_of or timezone.localdate()
+    result = {'as_of': as_of.isoformat(), 'templates': 0, 'created': 0, 'errors': []}
+
+    due_templates = EnhancedBill.objects.filter(  # type: ignore
+        is_recurring=True, next_due_date__lte=as_of, parent_bill__isnull=True
+    ).exclude(status='CANCELLED').order_by('next_due_date', 'id')
+
+    skipped = set()
+    while True:
+        template_ids = list(due_templates.exclude(id__in=skipped).values_list('id', flat=True)[:batch_size])
+        if not template_ids:
+            break
+        errors_before = len(result['errors'])
+        try:
+            created = _materialize_batch(template_ids, as_of, result['errors'])
+        except IntegrityError:
+            # An occurrence already exists (e.g. written by another worker without row
+            # locks); the batch was rolled back and is left for the next run
+            skipped.update(template_ids)
+            result['errors'].append({'bills': template_ids, 'error': 'Occurrence already exists'})
+            continue
+        failed = {error['bill'] for error in result['errors'][errors_before:]}
+        skipped.update(failed)
+        result['templates'] += len(set(template_ids) - failed)
+        result['created'] += created
+        if not created and not failed:
+            # Everything in the batch is locked by other workers
+            skipped.update(template_ids)
+
+    result['duration_seconds'] = round(time.monotonic() - started, 3)
+    return result
+
+
+DEFAULT_SWEEP_CHUNK_SIZE = 5000
+
+
+def _late_fee(settings_queryset):
+    """Amount * the society's late fee percentage, as an expression over the bill row"""
+    percentage = Coalesce(
+        Subquery(settings_queryset.values('late_fee_percentage')[:1]),
+        Value(Decimal('0')),
+        output_field=DecimalField(max_digits=5, decimal_places=2),
+    )
+    return Round(F('amount') * percentage / Value(Decimal('100')), 2,
+                 output_field=DecimalField(max_digits=8, decimal_places=2))
+
+
+def _post_maintenance_late_fees(chunk, late_fee):
+    fees = chunk.select_for_update().annotate(fee=late_fee).values_list('pk', 'flat_id', 'fee')
+    ledger.post([
+        ledger.entry(flat_id, ledger.LATE_FEE, fee, ledger.MAINTENANCE_BILL, pk, 'Late fee')
+        for pk, flat_id, fee in fees if fee
+    ])
+
+
+def _spread_late_fees(chunk, late_fee):
+    """
+    Add each split bill's late fee to its unpaid shares, in proportion to what each
+    still owes, so the shares keep adding up to the bill's total
+    """
+    from .models import BillDistribution
+    from .splitting import allocate
+
+    fees = dict(chunk.select_for_update().annotate(fee=late_fee).filter(fee__gt=0).values_list('pk', 'fee'))
+    if not fees:
+        return
+    shares = {}
+    for share in (
+        BillDistribution.objects.select_for_update()  # type: ignore
+        .filter(bill_id__in=list(fees), paid_amount__lt=F('allocated_amount')).order_by('id')
+    ):
+        shares.setdefault(share.bill_id, []).append(share)
+
+    charged = []
+    for bill_id, bill_shares in shares.items():
+        allocation = allocate(fees[bill_id], [(share.pk, share.allocated_amount - share.paid_amount)
+                                              for share in bill_shares])
+        for share in bill_shares:
+            share.allocated_amount += allocation[share.pk]
+            charged.append((share, allocation[share.pk]))
+    BillDistribution.objects.bulk_update([share for share, _ in charged], ['allocated_amount'])  # type: ignore
+
+    flat_ids = ledger.legacy_flat_ids(share.flat_id for share, _ in charged)
+    ledger.post([
+        ledger.entry(flat_ids[share.flat_id], ledger.LATE_FEE, fee, ledger.BILL_DISTRIBUTION, share.pk, 'Late fee')
+        for share, fee in charged if share.flat_id in flat_ids
+    ])
+
+
+def _overdue_targets(as_of):
+    """
+    (label, pending-past-due queryset, UPDATE assignments, late fee expression, function
+    charging the late fees of a locked chunk before it is updated) per bill table
+    """
+    from .models import BillDistribution, EnhancedBill, MaintenanceBill, SocietySettings
+
+    maintenance_fee = _late_fee(SocietySettings.objects.filter(society__flats=OuterRef('flat_id')))  # type: ignore
+    enhanced_fee = _late_fee(SocietySettings.objects.filter(society_id=OuterRef('society_id')))  # type: ignore
+    return [
+        (
+            'maintenance_bills',
+            MaintenanceBill.objects.filter(status='PENDING', due_date__lt=as_of),  # type: ignore
+            {'status': 'OVERDUE', 'late_fee': maintenance_fee},
+            maintenance_fee,
+            _post_maintenance_late_fees,
+        ),
+        (
+            'enhanced_bills',
+            # Recurring templates stay as they are; their generated occurrences go overdue
+            EnhancedBill.objects.filter(status='PENDING', due_date__lt=as_of, is_recurring=False),  # type: ignore
+            {
+                'status': 'OVERDUE',
+                'late_fee': enhanced_fee,
+                'total_amount': F('amount') + F('tax_amount') + enhanced_fee,
+                'outstanding_amount': F('amount') + F('tax_amount') + enhanced_fee - F('paid_amount'),
+            },
+            enhanced_fee,
+            # A bill split across flats is paid through its shares, which carry the fee
+            _spread_late_fees,
+        ),
+        (
+            'bill_distributions',
+            BillDistribution.objects.filter(status='PENDING', bill__due_date__lt=as_of),  # type: ignore
+            {'status': 'OVERDUE'},
+            None,
+            None,
+        ),
+    ]
+
+
+def sweep_overdue_bills(as_of=None, chunk_size=DEFAULT_SWEEP_CHUNK_SIZE, dry_run=False):
+    """
+    Mark PENDING bills due before ``as_of`` (default today) OVERDUE and apply late fees.
+
+    Each table is walked in primary key ranges of ``chunk_size`` with one UPDATE per
+    range, committed on its own, so no statement holds locks over the whole table.
+    Only PENDING rows are touched, which makes the sweep safe to repeat: a bill is
+    charged its late fee once, when it becomes overdue, and the fee is posted to the
+    flat ledger in the same transaction. The late fee of a split ``EnhancedBill`` is
+    also spread over its unpaid ``BillDistribution``s. With ``dry_run`` the same
+    ranges are counted (and late fees summed) instead of updated.
+    """
+    started = time.monotonic()
+    as_of = as_of or timezone.localdate()
+    report = {'as_of': as_of.isoformat(), 'dry_run': dry_run}
+
+    for label, queryset, assignments, late_fee, charge_late_fees in _overdue_targets(as_of):
+        stats = {'rows': 0}
+        if dry_run and late_fee is not None:
+            stats['late_fees'] = Decimal('0')
+        bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+        low = bounds['low']
+        while low is not None and low <= bounds['high']:
+            chunk = queryset.filter(pk__gte=low, pk__lt=low + chunk_size)
+            if dry_run:
+                if late_fee is None:
+                    stats['rows'] += chunk.count()
+                else:
+                    totals = chunk.aggregate(rows=Count('pk'), late_fees=Sum(late_fee))
+                    stats['rows'] += totals['rows']
+                    stats['late_fees'] += totals['late_fees'] or 0
+            else:
+                with transaction.atomic():
+                    if charge_late_fees:
+                        charge_late_fees(chunk, late_fee)
+                    stats['rows'] += chunk.update(**assignments)
+            low += chunk_size
+        report[label] = stats
+
+    report['duration_seconds'] = round(time.monotonic() - started, 3)
+    return report
@@ -0,0 +1,320 @@
+"""
+Background bulk operations on a society's users: EXPORT, BULK_DELETE and ROLE_CHANGE.
+
+An operation walks the selected users in primary-key order, ``BULK_OPERATION_CHUNK_SIZE``
+at a time (``pk > last id ORDER BY pk``, so every chunk is an index range scan). After
+each chunk the last id, the counts and ``heartbeat_at`` are written to the operation
+row; for deletes and role changes this happens in the same transaction as the chunk's
+writes, so a chunk is applied exactly once. Operations run as ``run_bulk_operation`` jobs (see
+``tasks.py``). A worker that dies leaves the operation PROCESSING with a stale
+heartbeat, and the scheduled ``resume_bulk_operations`` job (or ``manage.py
+run_bulk_operations``) carries on from the checkpoint instead of starting over.
+
+* EXPORT appends CSV/NDJSON rows to a file in local media storage. The checkpoint also
+  records the file size after the chunk, and a resumed export truncates the file back
+  to it before continuing.
+* BULK_DELETE deactivates users, as deleting a member does in ``MemberViewSet``.
+* ROLE_CHANGE updates roles with one UPDATE per chunk and records an APPROVED
+  ``UserRoleTransition`` per changed user with ``bulk_create``.
+
+The initiating user is never deactivated or moved to another role by their own
+operation, and deletes and role changes only touch users whose current role the
+initiator may manage (``MANAGEABLE_ROLES``); requested users left out for their role are
+listed in the operation's ``error_log``.
+"""
+import datetime
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from . import counters, exports, jobs
+from .token_auth import bump_token_versions
+
+
+EXPORT = 'EXPORT'
+BULK_DELETE = 'BULK_DELETE'
+ROLE_CHANGE = 'ROLE_CHANGE'
+RESUMABLE = (EXPORT, BULK_DELETE, ROLE_CHANGE)
+
+EXPORT_COLUMNS = (
+    ('id', 'id'), ('first_name', 'first_name'), ('last_name', 'last_name'), ('phone_number', 'phone_number'),
+    ('email', 'email'), ('role', 'role'), ('ownership_type', 'ownership_type'), ('occupation', 'occupation'),
+    ('emergency_contact_name', 'emergency_contact_name'), ('emergency_contact_phone', 'emergency_contact_phone'),
+    ('is_approved', 'is_approved'), ('is_active', 'is_active'), ('date_joined', 'date_joined'),
+)
+
+# Roles each initiator may hand out with a role change
+ASSIGNABLE_ROLES = {
+    'ADMIN': ('SUB_ADMIN', 'MEMBER', 'STAFF'),
+    'SUB_ADMIN': ('MEMBER', 'STAFF'),
+}
+
+# Current roles of the users each initiator may deactivate or move to another role
+MANAGEABLE_ROLES = {
+    'ADMIN': ('SUB_ADMIN', 'MEMBER', 'STAFF'),
+    'SUB_ADMIN': ('MEMBER', 'STAFF'),
+}
+
+MAX_LOGGED_ERRORS = 1000
+
+
+def chunk_size():
+    return getattr(settings, 'BULK_OPERATION_CHUNK_SIZE', 500)
+
+
+def stale_seconds():
+    return getattr(settings, 'BULK_OPERATION_STALE_SECONDS', 300)
+
+
+def _requested_users(operation):
+    from .models import User
+
+    users = User.objects.filter(society_id=operation.society_id)  # type: ignore
+    parameters = operation.parameters
+    if parameters.get('role'):
+        users = users.filter(role=parameters['role'])
+    if operation.operation_type != EXPORT:
+        users = users.exclude(pk=operation.initiated_by_id)
+    return users
+
+
+def _manageable_roles(operation):
+    return MANAGEABLE_ROLES.get(operation.initiated_by.role, ())
+
+
+def selected_users(operation):
+    """The users an operation applies to, before checkpointing"""
+    users = _requested_users(operation)
+    if operation.operation_type != EXPORT:
+        users = users.filter(role__in=_manageable_roles(operation))
+    return users
+
+
+def unmanageable_user_ids(operation):
+    """Requested users a delete or role change leaves out because of their current role"""
+    if operation.operation_type == EXPORT:
+        return []
+    users = _requested_users(operation).exclude(role__in=_manageable_roles(operation))
+    if operation.parameters.get('user_ids'):
+        users = users.filter(pk__in=set(operation.parameters['user_ids']))
+    return list(users.order_by('pk').values_list('pk', flat=True)[:MAX_LOGGED_ERRORS])
+
+
+def _next_chunk(operation, users, last_id, size):
+    """``(ids, new_last_id)`` of the next chunk after ``last_id``"""
+    user_ids = operation.parameters.get('user_ids')
+    if user_ids:
+        candidates = [pk for pk in sorted(set(user_ids)) if pk > last_id][:size]
+        if not candidates:
+            return [], last_id
+        found = set(users.filter(pk__in=candidates).values_list('pk', flat=True))
+        return [pk for pk in candidates if pk in found], candidates[-1]
+    ids = list(users.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:size])
+    return ids, ids[-1] if ids else last_id
+
+
+def _checkpoint(operation, checkpoint, successful, errors):
+    """Record a chunk's progress on the operation row"""
+    from .models import BulkUserOperation
+
+    updates = {
+        'checkpoint': checkpoint,
+        'heartbeat_at': timezone.now(),
+        'successful_records': F('successful_records') + successful,
+        'failed_records': F('failed_records') + len(errors),
+    }
+    logged = errors[:max(0, MAX_LOGGED_ERRORS - checkpoint.get('logged_errors', 0))]
+    checkpoint['logged_errors'] = checkpoint.get('logged_errors', 0) + len(logged)
+    if logged:
+        updates['error_log'] = Concat(F('error_log'), Value(''.join(f'{line}\n' for line in logged)))
+    BulkUserOperation.objects.filter(pk=operation.pk).update(**updates)  # type: ignore
+    jobs.heartbeat()
+
+
+def _deactivate(operation, ids):
+    from .models import User
+
+    User.objects.filter(pk__in=ids, is_active=True).update(is_active=False)  # type: ignore
+    bump_token_versions(ids)
+    return len(ids), []
+
+
+def _change_roles(operation, ids):
+    from .models import User, UserRoleTransition
+
+    to_role = operation.parameters['to_role']
+    reason = operation.parameters.get('reason') or 'Bulk role change'
+    current = dict(User.objects.filter(pk__in=ids).values_list('pk', 'role'))  # type: ignore
+    changed = [pk for pk in ids if current.get(pk) != to_role]
+    errors = [f'User {pk} already has role {to_role}' for pk in ids if current.get(pk) == to_role]
+    if not changed:
+        return 0, errors
+
+    User.objects.filter(pk__in=changed).update(role=to_role)  # type: ignore
+    bump_token_versions(changed)
+    now = timezone.now()
+    UserRoleTransition.objects.bulk_create([  # type: ignore
+        UserRoleTransition(
+            user_id=pk, from_role=current[pk], to_role=to_role, requested_by_id=operation.initiated_by_id,
+            approved_by_id=operation.initiated_by_id, reason=reason, status='APPROVED', processed_at=now,
+        )
+        for pk in changed
+    ])
+    # update() bypasses the counter signals
+    deltas = {'members': 0, 'staff': 0}
+    for role, field in (('MEMBER', 'members'), ('STAFF', 'staff')):
+        deltas[field] += sum(1 for pk in changed if to_role == role) - sum(1 for pk in changed if current[pk] == role)
+    counters.adjust({operation.society_id: deltas})
+    return len(changed), errors
+
+
+APPLY = {
+    BULK_DELETE: _deactivate,
+    ROLE_CHANGE: _change_roles,
+}
+
+
+def export_path(operation):
+    export_format = operation.parameters.get('format', exports.CSV)
+    return f'bulk_exports/{operation.society_id}/{operation.pk}-users.{export_format}'
+
+
+def _run_export(operation, users, checkpoint, size):
+    export_format = operation.parameters.get('format', exports.CSV)
+    path = default_storage.path(operation.file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a+', encoding='utf-8', newline='') as artifact:
+        # Drop whatever a crashed worker wrote after its last checkpoint
+        artifact.truncate(checkpoint.get('offset', 0))
+        artifact.seek(checkpoint.get('offset', 0))
+        while True:
+            ids, last_id = _next_chunk(operation, users, checkpoint.get('last_id', 0), size)
+            if last_id == checkpoint.get('last_id', 0):
+                return
+            rows = users.filter(pk__in=ids).order_by('pk').values_list(*[lookup for _, lookup in EXPORT_COLUMNS])
+            for text in exports.render_chunks(rows, EXPORT_COLUMNS, export_format, size,
+                                              header=not checkpoint.get('offset')):
+                artifact.write(text)
+            artifact.flush()
+            os.fsync(artifact.fileno())
+            checkpoint.update(last_id=last_id, offset=artifact.tell())
+            _checkpoint(operation, checkpoint, len(ids), [])
+
+
+def _run_updates(operation, users, checkpoint, size):
+    apply = APPLY[operation.operation_type]
+    while True:
+        with transaction.atomic():
+            ids, last_id = _next_chunk(operation, users, checkpoint.get('last_id', 0), size)
+            if last_id == checkpoint.get('last_id', 0):
+                return
+            successful, errors = apply(operation, ids) if ids else (0, [])
+            checkpoint['last_id'] = last_id
+            _checkpoint(operation, checkpoint, successful, errors)
+
+
+def claim(operation_id):
+    """
+    Mark an operation as being run by this worker; False if someone else is running it.
+
+    PENDING and FAILED operations can be claimed, and PROCESSING ones whose heartbeat
+    is older than ``BULK_OPERATION_STALE_SECONDS``.
+    """
+    from .models import BulkUserOperation
+
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=stale_seconds())
+    return bool(BulkUserOperation.objects.filter(  # type: ignore
+        Q(status__in=['PENDING', 'FAILED']) | Q(status='PROCESSING', heartbeat_at__lt=stale)
+        | Q(status='PROCESSING', heartbeat_at__isnull=True),
+        pk=operation_id, operation_type__in=RESUMABLE,
+    ).update(status='PROCESSING', heartbeat_at=now))
+
+
+def run_operation(operation_id, size=None):
+    """Run or resume an EXPORT, BULK_DELETE or ROLE_CHANGE operation; returns it when done"""
+    from .models import BulkUserOperation
+
+    if not claim(operation_id):
+        raise ValueError(f'Operation {operation_id} cannot be run now')
+    operation = BulkUserOperation.objects.get(pk=operation_id)  # type: ignore
+    if operation.operation_type == EXPORT and not operation.file_path:
+        operation.file_path = export_path(operation)
+        BulkUserOperation.objects.filter(pk=operation_id).update(file_path=operation.file_path)  # type: ignore
+    users = selected_users(operation)
+    checkpoint = dict(operation.checkpoint)
+    if not checkpoint:
+        if operation.parameters.get('user_ids'):
+            users_total = users.filter(pk__in=set(operation.parameters['user_ids'])).count()
+        else:
+            users_total = users.count()
+        updates = {'total_records': users_total}
+        excluded = unmanageable_user_ids(operation)
+        if excluded:
+            updates['error_log'] = Concat(F('error_log'), Value(
+                f'Skipped users whose role you cannot manage: {", ".join(map(str, excluded))}\n'
+            ))
+        BulkUserOperation.objects.filter(pk=operation_id).update(**updates)  # type: ignore
+
+    try:
+        if operation.operation_type == EXPORT:
+            _run_export(operation, users, checkpoint, size or chunk_size())
+        else:
+            _run_updates(operation, users, checkpoint, size or chunk_size())
+    except Exception as e:
+        BulkUserOperation.objects.filter(pk=operation_id).update(  # type: ignore
+            status='FAILED', error_log=Concat(F('error_log'), Value(f'Stopped, can be resumed: {e}\n'))
+        )
+        raise
+    BulkUserOperation.objects.filter(pk=operation_id).update(  # type: ignore
+        status='COMPLETED', completed_at=timezone.now()
+    )
+    operation.refresh_from_db()
+    return operation
+
+
+def start_operation(operation):
+    """Queue a freshly created operation for a background worker"""
+    from .tasks import run_bulk_operation
+
+    return run_bulk_operation.delay(operation.pk)
+
+
+def stalled_operations():
+    """
+    Ids of operations abandoned by a worker: PROCESSING with a stale heartbeat, or
+    PENDING without a queued or running job, e.g. because queueing it failed.
+    """
+    from .models import BackgroundJob, BulkUserOperation
+    from .tasks import run_bulk_operation
+
+    stale = timezone.now() - datetime.timedelta(seconds=stale_seconds())
+    waiting = {
+        args[0] for args in BackgroundJob.objects.filter(  # type: ignore
+            task=run_bulk_operation.name, status__in=[jobs.QUEUED, jobs.RUNNING]
+        ).values_list('args', flat=True) if args
+    }
+    stalled = BulkUserOperation.objects.filter(  # type: ignore
+        Q(status='PROCESSING', heartbeat_at__lt=stale) | Q(status='PROCESSING', heartbeat_at__isnull=True)
+        | Q(status='PENDING'),
+        operation_type__in=RESUMABLE,
+    ).order_by('pk').values_list('pk', 'status')
+    return [pk for pk, status in stalled if status != 'PENDING' or pk not in waiting]
+
+
+def resume_stalled():
+    """Run every operation abandoned by a worker here; returns their ids"""
+    resumed = []
+    for operation_id in stalled_operations():
+        try:
+            run_operation(operation_id)
+        except ValueError:
+            # Claimed by another worker in the meantime
+            continue
+        resumed.append(operation_id)
+    return resumed
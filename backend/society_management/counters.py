@@ -0,0 +1,226 @@
+"""
+Per-society dashboard counters.
+
+``SocietyCounters`` holds one row of figures per society (users, members, staff,
+flats, complaints, open complaints and unpaid maintenance bills), so a dashboard is
+a cache hit or a primary-key lookup instead of a COUNT per figure.
+
+Rows are maintained incrementally. The handlers in ``signals.py`` compare what a user,
+flat, complaint or maintenance bill counted for before and after a save or delete and
+apply the difference with ``F()`` updates. "Before" is taken from the row the instance
+was loaded from, so a save that leaves the counted fields alone costs no query; bulk writers
+(bill runs, statement reconciliation, bulk user updates) call ``adjust`` or ``recount`` themselves. A row is
+recounted from the tables when it is missing or older than ``SOCIETY_COUNTERS_MAX_AGE``
+seconds, which bounds drift from writes that bypass both. Rows are cached for
+``SOCIETY_COUNTERS_CACHE_TIMEOUT`` seconds and dropped from the cache when they change.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Func, IntegerField, Q, Subquery
+from django.utils import timezone
+
+
+FIELDS = ('users', 'members', 'staff', 'flats', 'complaints', 'open_complaints', 'pending_bills')
+
+CACHE_KEY = 'society_management:counters:{society_id}'
+
+UNPAID_BILL_STATUSES = ('PENDING', 'OVERDUE')
+
+
+def _cache_timeout():
+    return getattr(settings, 'SOCIETY_COUNTERS_CACHE_TIMEOUT', 60)
+
+
+def _max_age():
+    return getattr(settings, 'SOCIETY_COUNTERS_MAX_AGE', 3600)
+
+
+def count_subquery(queryset):
+    """Scalar subquery counting the rows of ``queryset``, e.g. for a per-user figure"""
+    counted = queryset.order_by().annotate(row_count=Func(F('pk'), function='COUNT')).values('row_count')
+    return Subquery(counted, output_field=IntegerField())
+
+
+def _tracked():
+    """Counted model -> (fields read from a row, function giving its counts)"""
+    from .models import Complaint, Flat, MaintenanceBill, User
+
+    return {
+        User: (('society_id', 'role'), lambda row: {
+            'users': 1, 'members': int(row['role'] == 'MEMBER'), 'staff': int(row['role'] == 'STAFF'),
+        }),
+        Flat: (('society_id',), lambda row: {'flats': 1}),
+        Complaint: (('flat_id', 'status'), lambda row: {
+            'complaints': 1, 'open_complaints': int(row['status'] == 'OPEN'),
+        }),
+        MaintenanceBill: (('flat_id', 'status'), lambda row: {
+            'pending_bills': int(row['status'] in UNPAID_BILL_STATUSES),
+        }),
+    }
+
+
+def affects(model, update_fields):
+    """Whether a save limited to ``update_fields`` can change what the row counts for"""
+    if update_fields is None:
+        return True
+    fields, _ = _tracked()[model]
+    return any(field in fields or f'{field}_id' in fields for field in update_fields)
+
+
+# ``state_before_save`` result for a save that leaves the counted fields as loaded
+UNCHANGED = object()
+
+
+def remember_saved(instance):
+    """Record that the row now holds the counted fields of ``instance``"""
+    fields, _ = _tracked()[type(instance)]
+    instance._loaded_row = (fields, [getattr(instance, field) for field in fields])
+
+
+def snapshot(instance):
+    """What the stored row of ``instance`` currently counts for: ``(society_id, counts, flat_id)``"""
+    fields, _ = _tracked()[type(instance)]
+    row = type(instance).objects.filter(pk=instance.pk).values(*fields).first()  # type: ignore
+    return _counted(type(instance), row)
+
+
+def state_before_save(instance):
+    """
+    What an existing row counted for before this save, from the row it was loaded from
+    (kept by ``LoadedRowMixin``); ``UNCHANGED`` when the counted fields still hold those
+    values. Instances loaded without the counted fields fall back to reading the row.
+    """
+    fields, _ = _tracked()[type(instance)]
+    row = getattr(instance, '_loaded_row', None)
+    loaded = dict(zip(*row)) if row else {}
+    if not all(field in loaded for field in fields):
+        return snapshot(instance)
+    if all(getattr(instance, field) == loaded[field] for field in fields):
+        return UNCHANGED
+    return _counted(type(instance), {field: loaded[field] for field in fields})
+
+
+def counted(instance, previous=None):
+    """What ``instance`` as it is in memory counts for"""
+    fields, _ = _tracked()[type(instance)]
+    row = {field: getattr(instance, field) for field in fields}
+    return _counted(type(instance), row, previous)
+
+
+def _counted(model, row, previous=None):
+    if row is None:
+        return None
+    _, counts = _tracked()[model]
+    if 'society_id' in row:
+        society_id = row['society_id']
+    elif previous is not None and previous[2] == row['flat_id']:
+        society_id = previous[0]
+    else:
+        from .models import Flat
+        society_id = Flat.objects.filter(pk=row['flat_id']).values_list('society_id', flat=True).first()  # type: ignore
+    return society_id, counts(row), row.get('flat_id')
+
+
+def changes(before, after):
+    """Counter deltas per society between two ``counted``/``snapshot`` results"""
+    deltas = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None or state[0] is None:
+            continue
+        society_deltas = deltas.setdefault(state[0], {})
+        for field, value in state[1].items():
+            society_deltas[field] = society_deltas.get(field, 0) + sign * value
+    return deltas
+
+
+def invalidate(society_ids):
+    keys = [CACHE_KEY.format(society_id=society_id) for society_id in society_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def adjust(deltas):
+    """
+    Apply ``{society_id: {field: delta}}`` to the counter rows.
+
+    Societies without a row are left alone; the row is counted from scratch the
+    first time it is read.
+    """
+    from .models import SocietyCounters
+
+    changed = []
+    for society_id, fields in deltas.items():
+        fields = {field: F(field) + delta for field, delta in fields.items() if delta}
+        if fields:
+            SocietyCounters.objects.filter(pk=society_id).update(**fields)  # type: ignore
+            changed.append(society_id)
+    invalidate(changed)
+
+
+def recount(society_ids):
+    """Count the given societies from the tables, one grouped query per table"""
+    from .models import Complaint, Flat, MaintenanceBill, SocietyCounters, User
+
+    society_ids = sorted({society_id for society_id in society_ids if society_id is not None})
+    if not society_ids:
+        return {}
+    totals = {society_id: dict.fromkeys(FIELDS, 0) for society_id in society_ids}
+    sources = [
+        (User.objects.all(), 'society_id', {  # type: ignore
+            'users': Count('pk'),
+            'members': Count('pk', filter=Q(role='MEMBER')),
+            'staff': Count('pk', filter=Q(role='STAFF')),
+        }),
+        (Flat.objects.all(), 'society_id', {'flats': Count('pk')}),  # type: ignore
+        (Complaint.objects.all(), 'flat__society_id', {  # type: ignore
+            'complaints': Count('pk'),
+            'open_complaints': Count('pk', filter=Q(status='OPEN')),
+        }),
+        (MaintenanceBill.objects.filter(status__in=UNPAID_BILL_STATUSES), 'flat__society_id', {  # type: ignore
+            'pending_bills': Count('pk'),
+        }),
+    ]
+    for queryset, society_path, aggregates in sources:
+        rows = queryset.filter(**{f'{society_path}__in': society_ids}).order_by().values(society_path).annotate(**aggregates)
+        for row in rows:
+            society_totals = totals[row.pop(society_path)]
+            society_totals.update(row)
+
+    now = timezone.now()
+    SocietyCounters.objects.bulk_create(  # type: ignore
+        [SocietyCounters(society_id=society_id, refreshed_at=now, **fields) for society_id, fields in totals.items()],
+        update_conflicts=True, unique_fields=['society'], update_fields=list(FIELDS) + ['refreshed_at'],
+    )
+    invalidate(society_ids)
+    return totals
+
+
+def get_counters(society_ids):
+    """``{society_id: {field: value}}`` from the cache, the counter rows, or a recount"""
+    from .models import SocietyCounters
+
+    keys = {society_id: CACHE_KEY.format(society_id=society_id) for society_id in society_ids}
+    cached = cache.get_many(list(keys.values()))
+    result = {society_id: cached[key] for society_id, key in keys.items() if key in cached}
+
+    missing = [society_id for society_id in keys if society_id not in result]
+    if missing:
+        fresh_since = timezone.now() - datetime.timedelta(seconds=_max_age())
+        rows = SocietyCounters.objects.filter(pk__in=missing, refreshed_at__gte=fresh_since).values('pk', *FIELDS)  # type: ignore
+        loaded = {row.pop('pk'): row for row in rows}
+        loaded.update(recount(set(missing) - set(loaded)))
+        cache.set_many({keys[society_id]: fields for society_id, fields in loaded.items()}, _cache_timeout())
+        result.update(loaded)
+    return result
+
+
+def totals(society_ids):
+    """Counters summed over several societies"""
+    summed = dict.fromkeys(FIELDS, 0)
+    for fields in get_counters(society_ids).values():
+        for field in FIELDS:
+            summed[field] += fields[field]
+    return summed
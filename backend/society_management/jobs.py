@@ -0,0 +1,431 @@
+"""
+Background jobs.
+
+Slow work is declared as a task and queued instead of being run inside a request::
+
+    @task(queue='bulk', max_attempts=3)
+    def run_bulk_operation(operation_id):
+        ...
+
+    run_bulk_operation.delay(operation.pk)
+
+Every call is recorded as a ``BackgroundJob`` row: arguments, queue, priority (0 runs
+first), attempts, result or last error, and when it was queued, started and finished.
+The row is written in the caller's transaction, so a job queued by a request that
+rolls back never runs. ``TASK_BACKEND`` picks what carries jobs to workers:
+
+* ``database`` (default) - ``manage.py run_jobs`` worker processes poll the table for
+  ready jobs, ``SELECT ... FOR UPDATE SKIP LOCKED`` on PostgreSQL plus a conditional
+  claim so two workers never run the same job. Suits single-node installs.
+* ``celery`` - the job id is sent to Celery (``society_platform/celery.py``) with the
+  job's queue, priority and ETA when the transaction commits; the Celery task runs the
+  same bookkeeping, so the table stays the record of status and timings.
+* ``immediate`` - jobs run in-process as soon as the transaction commits, for tests
+  and development without a worker.
+
+A failing job is queued again after ``TASK_RETRY_BACKOFF * 2 ** (attempt - 1)`` seconds
+(capped at ``TASK_RETRY_BACKOFF_MAX``) until it has used ``max_attempts``. A running job
+has a ``heartbeat_at``, set when it is claimed and refreshed by long tasks calling
+``heartbeat()`` as they make progress; a job whose heartbeat is ``TASK_JOB_TIMEOUT``
+seconds old is taken to have lost its worker and is queued again. A worker only records
+the outcome of its own claim, so a run that turns out to be merely slow cannot overwrite
+the attempt that replaced it.
+
+``TASK_SCHEDULE`` lists beat-style jobs, ``{name: {'task': ..., 'interval': seconds}}``.
+Their next due time lives in ``ScheduledJob``, claimed with a conditional update, so
+any number of schedulers queue each run exactly once.
+"""
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Avg, Count, F, Max, Min, Q
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'QUEUED'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+
+DEFAULT_QUEUE = 'default'
+DEFAULT_PRIORITY = 5
+
+_registry = {}
+_backends = {}
+_running = threading.local()
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Task:
+    """A function that can be queued; calling it directly runs it inline"""
+
+    def __init__(self, function, name, queue, priority, max_attempts):
+        self.function = function
+        self.name = name
+        self.queue = queue
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.__doc__ = function.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def delay(self, *args, **kwargs):
+        return self.enqueue(args, kwargs)
+
+    def enqueue(self, args=(), kwargs=None, queue=None, priority=None, countdown=None, eta=None):
+        """Queue a call; returns its ``BackgroundJob``"""
+        if eta is None:
+            eta = timezone.now() + datetime.timedelta(seconds=countdown or 0)
+        return get_backend().enqueue(
+            self, list(args), kwargs or {}, queue or self.queue,
+            self.priority if priority is None else priority, eta,
+        )
+
+
+def task(name=None, queue=DEFAULT_QUEUE, priority=DEFAULT_PRIORITY, max_attempts=3):
+    """Register a function as a task, named ``society_management.<function>`` by default"""
+    def register(function):
+        registered = Task(function, name or f'society_management.{function.__name__}', queue, priority, max_attempts)
+        _registry[registered.name] = registered
+        return registered
+    return register
+
+
+def get_task(name):
+    return _registry.get(name)
+
+
+# Backends
+class DatabaseBackend:
+    """Jobs wait in the BackgroundJob table for ``run_jobs`` workers"""
+
+    def create(self, registered, args, kwargs, queue, priority, eta):
+        from .models import BackgroundJob
+
+        return BackgroundJob.objects.create(  # type: ignore
+            task=registered.name, args=args, kwargs=kwargs, queue=queue, priority=priority,
+            run_at=eta, max_attempts=registered.max_attempts,
+        )
+
+    def enqueue(self, registered, args, kwargs, queue, priority, eta):
+        return self.create(registered, args, kwargs, queue, priority, eta)
+
+    def retry(self, job):
+        """Hand a job queued again after a failure back to the transport"""
+
+
+class ImmediateBackend(DatabaseBackend):
+    """Jobs run in this process once the enqueuing transaction commits"""
+
+    def enqueue(self, registered, args, kwargs, queue, priority, eta):
+        job = self.create(registered, args, kwargs, queue, priority, eta)
+        transaction.on_commit(lambda: execute(job.pk, worker='immediate'))
+        return job
+
+    def retry(self, job):
+        execute(job.pk, worker='immediate', ignore_eta=True)
+
+
+class CeleryBackend(DatabaseBackend):
+    """The job row is kept for bookkeeping; Celery carries its id to a worker"""
+
+    def __init__(self):
+        from society_platform.celery import app
+        self.app = app
+
+    def send(self, job):
+        self.app.send_task(
+            'society_management.execute_job', args=[job.pk], queue=job.queue,
+            priority=job.priority, eta=job.run_at,
+        )
+
+    def enqueue(self, registered, args, kwargs, queue, priority, eta):
+        job = self.create(registered, args, kwargs, queue, priority, eta)
+        transaction.on_commit(lambda: self.send(job))
+        return job
+
+    def retry(self, job):
+        self.send(job)
+
+
+BACKENDS = {
+    'database': DatabaseBackend,
+    'immediate': ImmediateBackend,
+    'celery': CeleryBackend,
+}
+
+
+def get_backend():
+    name = _setting('TASK_BACKEND', 'database')
+    if name not in _backends:
+        if name not in BACKENDS:
+            raise ValueError(f'Unknown TASK_BACKEND "{name}"; expected one of {", ".join(BACKENDS)}')
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+# Running jobs
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _backoff(attempt):
+    base = _setting('TASK_RETRY_BACKOFF', 10)
+    return min(base * 2 ** (attempt - 1), _setting('TASK_RETRY_BACKOFF_MAX', 3600))
+
+
+def _json_result(value):
+    try:
+        return json.loads(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def _claim(queryset, worker):
+    """Move one QUEUED job of ``queryset`` to RUNNING for ``worker``; None if there is none"""
+    from .models import BackgroundJob
+
+    now = timezone.now()
+    for _ in range(5):
+        with transaction.atomic():
+            candidate = (
+                queryset.select_for_update(skip_locked=True)
+                .filter(status=QUEUED).order_by('priority', 'run_at', 'id').values_list('pk', flat=True).first()
+            )
+            if candidate is None:
+                return None
+            # On databases without row locks another worker may have raced us here
+            claimed = BackgroundJob.objects.filter(pk=candidate, status=QUEUED).update(  # type: ignore
+                status=RUNNING, locked_by=worker, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+            )
+        if claimed:
+            return BackgroundJob.objects.get(pk=candidate)  # type: ignore
+    return None
+
+
+def claim_next(queues=None, worker=None):
+    from .models import BackgroundJob
+
+    ready = BackgroundJob.objects.filter(run_at__lte=timezone.now())  # type: ignore
+    if queues:
+        ready = ready.filter(queue__in=queues)
+    return _claim(ready, worker or worker_name())
+
+
+def _claimed(job):
+    """The job's row while it is still held by this claim of it"""
+    from .models import BackgroundJob
+
+    return BackgroundJob.objects.filter(  # type: ignore
+        pk=job.pk, status=RUNNING, locked_by=job.locked_by, attempts=job.attempts,
+    )
+
+
+def heartbeat():
+    """
+    Report progress of the job this thread is running, at most every
+    ``TASK_HEARTBEAT_INTERVAL`` seconds; a no-op outside a job.
+
+    Returns False once the job has been claimed again after its heartbeat went stale.
+    """
+    job = getattr(_running, 'job', None)
+    if job is None:
+        return True
+    if time.monotonic() - _running.beat < _setting('TASK_HEARTBEAT_INTERVAL', 30):
+        return True
+    _running.beat = time.monotonic()
+    return bool(_claimed(job).update(heartbeat_at=timezone.now()))
+
+
+def run(job):
+    """Run a claimed job and record how it went; returns the job"""
+    registered = get_task(job.task)
+    started = time.monotonic()
+    updates = {}
+    _running.job, _running.beat = job, started
+    try:
+        if registered is None:
+            raise LookupError(f'Unknown task {job.task}')
+        result = registered.function(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed on attempt %s', job.pk, job.task, job.attempts, exc_info=True)
+        updates['last_error'] = error[-10000:]
+        if registered is not None and job.attempts < job.max_attempts:
+            updates.update(status=QUEUED, run_at=timezone.now() + datetime.timedelta(seconds=_backoff(job.attempts)))
+        else:
+            updates['status'] = FAILED
+    else:
+        updates.update(status=SUCCEEDED, result=_json_result(result))
+    finally:
+        _running.job = None
+
+    updates.update(finished_at=timezone.now(), duration_ms=int((time.monotonic() - started) * 1000))
+    if not _claimed(job).update(**updates):
+        logger.warning('Job %s (%s) was claimed again while attempt %s ran; its outcome is dropped',
+                       job.pk, job.task, job.attempts)
+        return job
+    for field, value in updates.items():
+        setattr(job, field, value)
+    if job.status == QUEUED:
+        get_backend().retry(job)
+    return job
+
+
+def execute(job_id, worker=None, ignore_eta=False):
+    """Claim and run one job by id, as a Celery task or the immediate backend does"""
+    from .models import BackgroundJob
+
+    jobs = BackgroundJob.objects.filter(pk=job_id)  # type: ignore
+    if not ignore_eta:
+        jobs = jobs.filter(run_at__lte=timezone.now())
+    job = _claim(jobs, worker or worker_name())
+    return run(job) if job is not None else None
+
+
+def requeue_stale():
+    """Queue again jobs whose heartbeat stopped, handing them to the backend; returns how many"""
+    from .models import BackgroundJob
+
+    stale = timezone.now() - datetime.timedelta(seconds=_setting('TASK_JOB_TIMEOUT', 1800))
+    jobs = BackgroundJob.objects.filter(status=RUNNING, heartbeat_at__lt=stale)  # type: ignore
+    retry_ids = list(jobs.filter(attempts__lt=F('max_attempts')).values_list('pk', flat=True))
+    requeued = jobs.filter(pk__in=retry_ids).update(
+        status=QUEUED, run_at=timezone.now(), last_error='Worker stopped before finishing the job',
+    )
+    jobs.update(status=FAILED, finished_at=timezone.now(), last_error='Worker stopped before finishing the job')
+    backend = get_backend()
+    for job in BackgroundJob.objects.filter(pk__in=retry_ids, status=QUEUED):  # type: ignore
+        backend.retry(job)
+    return requeued
+
+
+def work(queues=None, burst=False, stop=None, worker=None):
+    """
+    Run jobs until ``stop()`` is true; with ``burst`` return once no job is ready.
+
+    Returns the number of jobs run.
+    """
+    worker = worker or worker_name()
+    poll_interval = _setting('TASK_WORKER_POLL_INTERVAL', 1.0)
+    processed = 0
+    last_requeue = 0.0
+    while not (stop and stop()):
+        try:
+            if time.monotonic() - last_requeue > 60:
+                requeue_stale()
+                last_requeue = time.monotonic()
+            job = claim_next(queues, worker)
+        except OperationalError:
+            # e.g. SQLite busy while another worker writes; try again after a pause
+            logger.warning('Worker %s could not claim a job', worker, exc_info=True)
+            time.sleep(poll_interval)
+            continue
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+        run(job)
+        processed += 1
+    return processed
+
+
+# Scheduling
+def schedule():
+    return _setting('TASK_SCHEDULE', {})
+
+
+def enqueue_due(now=None):
+    """Queue every TASK_SCHEDULE entry that is due; returns the names queued"""
+    from .models import ScheduledJob
+
+    now = now or timezone.now()
+    entries = schedule()
+    known = {job.name: job for job in ScheduledJob.objects.filter(name__in=list(entries))}  # type: ignore
+    queued = []
+    for name, entry in entries.items():
+        interval = int(entry['interval'])
+        scheduled = known.get(name)
+        if scheduled is None:
+            scheduled, _ = ScheduledJob.objects.get_or_create(  # type: ignore
+                name=name, defaults={'task': entry['task'], 'interval_seconds': interval, 'next_run_at': now},
+            )
+        if scheduled.next_run_at > now:
+            continue
+        registered = get_task(entry['task'])
+        if registered is None:
+            logger.error('Scheduled job %s names unknown task %s', name, entry['task'])
+            continue
+        with transaction.atomic():
+            # Only the scheduler that moves next_run_at queues this run
+            claimed = ScheduledJob.objects.filter(pk=scheduled.pk, next_run_at=scheduled.next_run_at).update(  # type: ignore
+                task=entry['task'], interval_seconds=interval, last_enqueued_at=now,
+                next_run_at=now + datetime.timedelta(seconds=interval),
+            )
+            if claimed:
+                job = registered.enqueue(entry.get('args', ()), entry.get('kwargs'))
+                ScheduledJob.objects.filter(pk=scheduled.pk).update(last_job=job)  # type: ignore
+                queued.append(name)
+    return queued
+
+
+# Metrics
+def metrics(since=None):
+    """Per-task outcome counts and timings since ``since`` (default the last day), and queue depth"""
+    from .models import BackgroundJob
+
+    now = timezone.now()
+    since = since or now - datetime.timedelta(days=1)
+    per_task = (
+        BackgroundJob.objects.filter(created_at__gte=since)  # type: ignore
+        .values('task')
+        .annotate(
+            total=Count('pk'),
+            queued=Count('pk', filter=Q(status=QUEUED)),
+            running=Count('pk', filter=Q(status=RUNNING)),
+            succeeded=Count('pk', filter=Q(status=SUCCEEDED)),
+            failed=Count('pk', filter=Q(status=FAILED)),
+            retried=Count('pk', filter=Q(attempts__gt=1)),
+            avg_duration_ms=Avg('duration_ms'),
+            max_duration_ms=Max('duration_ms'),
+            avg_wait=Avg(F('started_at') - F('created_at'), filter=Q(started_at__isnull=False)),
+        )
+        .order_by('task')
+    )
+    tasks = []
+    for row in per_task:
+        wait = row.pop('avg_wait')
+        row['avg_wait_seconds'] = round(wait.total_seconds(), 3) if wait is not None else None
+        if row['avg_duration_ms'] is not None:
+            row['avg_duration_ms'] = round(row['avg_duration_ms'], 1)
+        tasks.append(row)
+
+    queues = []
+    depth = (
+        BackgroundJob.objects.filter(status=QUEUED)  # type: ignore
+        .values('queue')
+        .annotate(queued=Count('pk'), ready=Count('pk', filter=Q(run_at__lte=now)), oldest=Min('run_at'))
+        .order_by('queue')
+    )
+    for row in depth:
+        oldest = row.pop('oldest')
+        row['oldest_ready_age_seconds'] = round(max((now - oldest).total_seconds(), 0), 3) if row['ready'] else 0
+        queues.append(row)
+    return {'since': since.isoformat(), 'tasks': tasks, 'queues': queues}
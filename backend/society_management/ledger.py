@@ -0,0 +1,183 @@
+"""
+Per-flat ledger.
+
+Every amount a flat owes or pays is appended to ``LedgerEntry`` and the flat's
+``FlatBalance`` row moves in the same transaction, so dues are a single-row read and
+a statement is one page of an index scan instead of an aggregate over bill history.
+
+Entries carry the bill row they came from (``source_type``/``source_id``). Single
+saves of maintenance bills, expense splits and bill distributions are synced by the
+signal handlers in ``signals.py``: the posted totals for the source are compared with
+what the row now says and only the difference is appended, as an ADJUSTMENT or
+PAYMENT. Bulk writers (bill runs, splits, the overdue sweeper) post their entries
+directly with ``post``. ``manage.py rebuild_flat_ledger`` reposts a flat's history
+from the bill tables.
+
+Amounts are signed: charges, late fees and positive adjustments raise the balance,
+payments are stored negative.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+
+CHARGE = 'CHARGE'
+PAYMENT = 'PAYMENT'
+LATE_FEE = 'LATE_FEE'
+ADJUSTMENT = 'ADJUSTMENT'
+
+MAINTENANCE_BILL = 'MAINTENANCE_BILL'
+EXPENSE_SPLIT = 'EXPENSE_SPLIT'
+BILL_DISTRIBUTION = 'BILL_DISTRIBUTION'
+
+
+def entry(flat_id, entry_type, amount, source_type='MANUAL', source_id=None, description=''):
+    """A pending ledger entry as accepted by ``post``"""
+    return (flat_id, entry_type, Decimal(amount), source_type, source_id, description)
+
+
+def _lock_balances(flat_ids):
+    from .models import FlatBalance
+
+    FlatBalance.objects.bulk_create(  # type: ignore
+        [FlatBalance(flat_id=flat_id) for flat_id in flat_ids], ignore_conflicts=True
+    )
+    # Fixed lock order so concurrent posters cannot deadlock
+    return {
+        balance.flat_id: balance
+        for balance in FlatBalance.objects.select_for_update().filter(flat_id__in=flat_ids).order_by('flat_id')  # type: ignore
+    }
+
+
+def post(entries):
+    """Append entries and move the affected balances; returns the number posted"""
+    from .models import FlatBalance, LedgerEntry
+
+    entries = [e for e in entries if e[2]]
+    if not entries:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        balances = _lock_balances(sorted({e[0] for e in entries}))
+        rows = []
+        for flat_id, entry_type, amount, source_type, source_id, description in entries:
+            balance = balances[flat_id]
+            balance.balance += amount
+            if entry_type == PAYMENT:
+                balance.total_paid -= amount
+            else:
+                balance.total_charged += amount
+            balance.last_entry_at = now
+            balance.updated_at = now
+            rows.append(LedgerEntry(
+                flat_id=flat_id, entry_type=entry_type, amount=amount, balance_after=balance.balance,
+                source_type=source_type, source_id=source_id, description=description[:255], created_at=now,
+            ))
+        LedgerEntry.objects.bulk_create(rows, batch_size=1000)  # type: ignore
+        # The rows are locked, so writing the new absolute values back as one upsert is safe
+        FlatBalance.objects.bulk_create(  # type: ignore
+            list(balances.values()), batch_size=1000, update_conflicts=True, unique_fields=['flat'],
+            update_fields=['balance', 'total_charged', 'total_paid', 'last_entry_at', 'updated_at'],
+        )
+    return len(rows)
+
+
+def sync_source(flat_id, source_type, source_id, charged, paid, description=''):
+    """
+    Bring the ledger in line with one bill row.
+
+    ``charged`` is what the row currently bills (including late fees) and ``paid``
+    what has been paid against it; ``flat_id`` may be None once the row is gone or has
+    no ledger flat, in which case everything posted for it is reversed.
+    """
+    from .models import LedgerEntry
+
+    with transaction.atomic():
+        if flat_id is not None:
+            # Serialise syncs for the flat before reading what has been posted
+            _lock_balances([flat_id])
+        posted = (
+            LedgerEntry.objects.filter(source_type=source_type, source_id=source_id)  # type: ignore
+            .values_list('flat_id', 'entry_type').annotate(total=Sum('amount'))
+        )
+        totals = {}
+        for posted_flat_id, entry_type, total in posted:
+            flat_totals = totals.setdefault(posted_flat_id, {'charged': Decimal('0'), 'paid': Decimal('0')})
+            if entry_type == PAYMENT:
+                flat_totals['paid'] -= total
+            else:
+                flat_totals['charged'] += total
+
+        entries = []
+        # Amounts posted to another flat (the row moved, or was deleted) are reversed there
+        for posted_flat_id, flat_totals in totals.items():
+            if posted_flat_id != flat_id:
+                entries.append(entry(posted_flat_id, ADJUSTMENT, -flat_totals['charged'],
+                                     source_type, source_id, f'Reversal: {description}'))
+                entries.append(entry(posted_flat_id, PAYMENT, flat_totals['paid'],
+                                     source_type, source_id, f'Reversal: {description}'))
+
+        if flat_id is not None:
+            current = totals.get(flat_id, {'charged': Decimal('0'), 'paid': Decimal('0')})
+            charge_type = ADJUSTMENT if flat_id in totals else CHARGE
+            entries.append(entry(flat_id, charge_type, Decimal(charged) - current['charged'],
+                                 source_type, source_id, description))
+            entries.append(entry(flat_id, PAYMENT, -(Decimal(paid) - current['paid']),
+                                 source_type, source_id, description))
+        return post(entries)
+
+
+def legacy_flat_ids(enhanced_flat_ids):
+    """EnhancedFlat id -> linked Flat id; the ledger is kept against Flat"""
+    from .models import Flat
+
+    return dict(
+        Flat.objects.filter(enhanced_flat_id__in=list(enhanced_flat_ids))  # type: ignore
+        .values_list('enhanced_flat_id', 'id')
+    )
+
+
+def maintenance_bill_description(bill):
+    return f'Maintenance {bill.billing_period_start} to {bill.billing_period_end}'
+
+
+def rebuild(flat_ids):
+    """Replace the ledger of the given flats with entries reposted from the bill tables"""
+    from .models import BillDistribution, CommonExpenseSplit, FlatBalance, LedgerEntry, MaintenanceBill
+
+    flat_ids = list(flat_ids)
+    entries = []
+
+    bills = MaintenanceBill.objects.filter(flat_id__in=flat_ids).order_by('created_at', 'id')  # type: ignore
+    for bill in bills.only('id', 'flat_id', 'amount', 'late_fee', 'status', 'billing_period_start', 'billing_period_end'):
+        description = maintenance_bill_description(bill)
+        entries.append(entry(bill.flat_id, CHARGE, bill.amount, MAINTENANCE_BILL, bill.pk, description))
+        entries.append(entry(bill.flat_id, LATE_FEE, bill.late_fee, MAINTENANCE_BILL, bill.pk, 'Late fee'))
+        if bill.status == 'PAID':
+            entries.append(entry(bill.flat_id, PAYMENT, -(bill.amount + bill.late_fee),
+                                 MAINTENANCE_BILL, bill.pk, description))
+
+    splits = CommonExpenseSplit.objects.filter(flat_id__in=flat_ids).order_by('id').values_list(  # type: ignore
+        'id', 'flat_id', 'amount_due', 'status', 'common_expense__title'
+    )
+    for pk, flat_id, amount_due, split_status, title in splits:
+        description = f'Common expense: {title}'
+        entries.append(entry(flat_id, CHARGE, amount_due, EXPENSE_SPLIT, pk, description))
+        if split_status == 'PAID':
+            entries.append(entry(flat_id, PAYMENT, -amount_due, EXPENSE_SPLIT, pk, description))
+
+    distributions = BillDistribution.objects.filter(flat__legacy_flat__in=flat_ids).order_by('id').values_list(  # type: ignore
+        'id', 'flat__legacy_flat', 'allocated_amount', 'paid_amount', 'bill__bill_number', 'bill__title'
+    )
+    for pk, flat_id, allocated, paid, bill_number, title in distributions:
+        description = f'{bill_number}: {title}'
+        entries.append(entry(flat_id, CHARGE, allocated, BILL_DISTRIBUTION, pk, description))
+        entries.append(entry(flat_id, PAYMENT, -paid, BILL_DISTRIBUTION, pk, description))
+
+    with transaction.atomic():
+        LedgerEntry.objects.filter(flat_id__in=flat_ids).delete()  # type: ignore
+        FlatBalance.objects.filter(flat_id__in=flat_ids).delete()  # type: ignore
+        return post(entries)
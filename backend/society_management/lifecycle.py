@@ -0,0 +1,144 @@
+"""
+Lifecycle sweep for rows that stop being useful once they expire.
+
+Each policy below first *expires* rows whose time has passed but whose status still
+says they are live (PENDING invitations, ACTIVE visitor passes, unused OTPs), so
+lookups filtering on status no longer have to re-check ``is_valid()`` row by row, and
+then *purges* finished rows older than their retention. Retention is configured per
+policy in ``LIFECYCLE_RETENTION_DAYS``; a policy missing from it, or set to None,
+keeps its rows forever.
+
+Like the overdue bill sweep, every step walks the table in primary key ranges of
+``LIFECYCLE_SWEEP_CHUNK_SIZE`` with one UPDATE or DELETE per range, committed on its
+own, so no statement locks the whole table. Steps only touch rows that still match
+their condition, which makes the sweep safe to repeat and to run alongside requests.
+"""
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+
+INVITATION_FINISHED = ('EXPIRED', 'CANCELLED', 'REJECTED')
+
+POLICIES = (
+    'otps', 'subadmin_invitations', 'member_invitations', 'staff_invitations', 'chairman_invitations',
+    'visitor_passes', 'background_jobs', 'revoked_tokens',
+)
+
+
+def chunk_size():
+    return getattr(settings, 'LIFECYCLE_SWEEP_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def retention(label):
+    """Days finished rows of a policy are kept, or None to keep them"""
+    return getattr(settings, 'LIFECYCLE_RETENTION_DAYS', {}).get(label)
+
+
+def _invitation_policy(model, now, cutoff):
+    return (
+        model.objects.filter(status='PENDING', expires_at__lt=now),
+        {'status': 'EXPIRED'},
+        model.objects.filter(status__in=INVITATION_FINISHED, expires_at__lt=cutoff) if cutoff else None,
+    )
+
+
+def _policies(now):
+    """``{label: (expire queryset, UPDATE assignments, purge queryset)}``; either part may be None"""
+    from .models import (
+        OTP, BackgroundJob, ChairmanInvitation, MemberInvitation, RevokedToken, StaffInvitation,
+        SubAdminInvitation, VisitorPass,
+    )
+
+    def cutoff(label):
+        days = retention(label)
+        return now - datetime.timedelta(days=days) if days is not None else None
+
+    grace = datetime.timedelta(hours=getattr(settings, 'VISITOR_PASS_GRACE_HOURS', 24))
+    otp_cutoff, pass_cutoff, job_cutoff = cutoff('otps'), cutoff('visitor_passes'), cutoff('background_jobs')
+    token_cutoff = cutoff('revoked_tokens')
+    return {
+        'otps': (
+            OTP.objects.filter(is_used=False, is_expired=False, expires_at__lt=now),  # type: ignore
+            {'is_expired': True},
+            OTP.objects.filter(expires_at__lt=otp_cutoff) if otp_cutoff else None,  # type: ignore
+        ),
+        'subadmin_invitations': _invitation_policy(SubAdminInvitation, now, cutoff('subadmin_invitations')),
+        'member_invitations': _invitation_policy(MemberInvitation, now, cutoff('member_invitations')),
+        'staff_invitations': _invitation_policy(StaffInvitation, now, cutoff('staff_invitations')),
+        'chairman_invitations': _invitation_policy(ChairmanInvitation, now, cutoff('chairman_invitations')),
+        'visitor_passes': (
+            # Passes nobody checked in with; a visitor inside the gate keeps theirs
+            VisitorPass.objects.filter(  # type: ignore
+                Q(expected_exit_time__lt=now)
+                | Q(expected_exit_time__isnull=True, expected_entry_time__lt=now - grace),
+                status='ACTIVE', actual_entry_time__isnull=True,
+            ),
+            {'status': 'EXPIRED'},
+            VisitorPass.objects.filter(  # type: ignore
+                status__in=['USED', 'EXPIRED', 'CANCELLED'], expected_entry_time__lt=pass_cutoff,
+            ) if pass_cutoff else None,
+        ),
+        'background_jobs': (
+            None,
+            None,
+            BackgroundJob.objects.filter(  # type: ignore
+                status__in=['SUCCEEDED', 'FAILED'], finished_at__lt=job_cutoff,
+            ) if job_cutoff else None,
+        ),
+        'revoked_tokens': (
+            # An expired refresh token is refused before its revocation is looked up
+            None,
+            None,
+            RevokedToken.objects.filter(expires_at__lt=token_cutoff) if token_cutoff else None,  # type: ignore
+        ),
+    }
+
+
+def _walk(queryset, size, apply):
+    """Apply ``apply`` to ``queryset`` one primary key range at a time; total rows affected"""
+    rows = 0
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    low = bounds['low']
+    while low is not None and low <= bounds['high']:
+        with transaction.atomic():
+            rows += apply(queryset.filter(pk__gte=low, pk__lt=low + size))
+        low += size
+    return rows
+
+
+def sweep_expired_records(only=None, size=None, dry_run=False):
+    """
+    Expire and purge the rows of every policy (or those named in ``only``).
+
+    Returns ``{label: {'expired': n, 'purged': n}}`` plus the run's duration; with
+    ``dry_run`` the same ranges are counted instead of changed.
+    """
+    started = time.monotonic()
+    size = size or chunk_size()
+    now = timezone.now()
+    report = {'dry_run': dry_run}
+
+    for label, (expiring, assignments, purging) in _policies(now).items():
+        if only and label not in only:
+            continue
+        stats = {'expired': 0, 'purged': 0}
+        if expiring is not None:
+            stats['expired'] = _walk(expiring, size, lambda chunk: chunk.count() if dry_run else chunk.update(**assignments))
+        if purging is not None:
+            stats['purged'] = _walk(purging, size, lambda chunk: chunk.count() if dry_run else chunk.delete()[0])
+        report[label] = stats
+
+    report['duration_seconds'] = round(time.monotonic() - started, 3)
+    if not dry_run:
+        logger.info('Lifecycle sweep: %s', report)
+    return report
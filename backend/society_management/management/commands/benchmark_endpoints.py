@@ -0,0 +1,515 @@
+import json
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from society_management.models import (
+    User, Society, Flat, MaintenanceBill, CommonExpense, CommonExpenseSplit,
+    Notice, Amenity, AmenityBooking, VisitorLog, Complaint, MarketplaceListing,
+    JobListing, AdBanner, ChairmanInvitation, StaffCategory, StaffMember,
+    DutySchedule, UserRoleTransition, SocietySettings, FeeStructure,
+    BulkUserOperation, AdminSociety, Building, EnhancedFlat,
+    MemberRegistrationRequest, MemberInvitation, StaffInvitation, SocietyProfile,
+    HelpdeskDesignation, HelpdeskContact, BillType, EnhancedBill,
+    BillDistribution, VisitorPass, GateUpdateLog, DirectoryEntry
+)
+from society_management.token_auth import RefreshToken
+from society_management.urls import router
+
+
+BENCH_PASSWORD = 'bench-pass-123'
+ROLES = ['ADMIN', 'SUB_ADMIN', 'MEMBER', 'STAFF']
+FLAT_TYPES = ['1BHK', '2BHK', '3BHK']
+
+# Function views measured alongside the router: (name, method, url name, roles).
+# A role of None means the request is sent anonymously.
+FUNCTION_ENDPOINTS = [
+    ('dashboard_stats', 'get', 'dashboard_stats', ROLES),
+    ('profile', 'get', 'profile', ROLES),
+    ('my_capabilities', 'get', 'my_capabilities', ROLES),
+    ('search_societies', 'get', 'search_societies', [None]),
+    ('login_with_password', 'post', 'login_with_password', [None]),
+    ('login_otp_step1', 'post', 'login_otp_step1', [None]),
+    ('send_otp', 'post', 'send_otp', [None]),
+    ('forgot_password', 'post', 'forgot_password', [None]),
+]
+
+
+class _Rollback(Exception):
+    """Raised to discard the benchmark dataset once measurements are taken"""
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Build a realistic dataset and measure SQL query count, p50/p95 latency and '
+        'response size for every router endpoint and the key function views. '
+        'Compares against a baseline file and fails on regressions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--societies', type=int, default=2, help='Number of societies to generate')
+        parser.add_argument('--flats', type=int, default=1000, help='Flats (and member users) per society')
+        parser.add_argument('--bills-per-flat', type=int, default=3, help='Maintenance bills per flat')
+        parser.add_argument('--gate-logs', type=int, default=5000, help='Gate log rows per society')
+        parser.add_argument('--iterations', type=int, default=10, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed requests per endpoint')
+        parser.add_argument('--roles', default=','.join(ROLES), help='Comma separated roles to benchmark as')
+        parser.add_argument('--only', default='', help='Only run endpoints whose key contains this text')
+        parser.add_argument('--baseline', default='benchmarks/endpoint_baseline.json',
+                            help='Baseline file to compare against (relative to the working directory)')
+        parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--output', default='', help='Also write the raw results to this JSON file')
+        parser.add_argument('--query-slack', type=int, default=0,
+                            help='Extra queries allowed over the baseline before failing')
+        parser.add_argument('--latency-threshold', type=float, default=0.5,
+                            help='Allowed relative p95 growth over the baseline (0.5 = +50%%)')
+        parser.add_argument('--latency-floor-ms', type=float, default=5.0,
+                            help='Ignore p95 growth smaller than this many milliseconds')
+
+    def handle(self, *args, **options):
+        roles = [r.strip() for r in options['roles'].split(',') if r.strip()]
+        unknown = set(roles) - set(ROLES)
+        if unknown:
+            raise CommandError(f'Unknown roles: {", ".join(sorted(unknown))}')
+
+        setup_test_environment()
+        try:
+            results = {}
+            try:
+                with transaction.atomic():
+                    self.stdout.write('Building benchmark dataset...')
+                    started = time.perf_counter()
+                    context = self._build_dataset(options)
+                    self.stdout.write(f'Dataset ready in {time.perf_counter() - started:.1f}s')
+                    results = self._run(context, roles, options)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': {
+                'societies': options['societies'],
+                'flats_per_society': options['flats'],
+                'bills_per_flat': options['bills_per_flat'],
+                'gate_logs_per_society': options['gate_logs'],
+            },
+            'iterations': options['iterations'],
+            'endpoints': results,
+        }
+        self._print_table(results)
+
+        if options['output']:
+            self._write_json(options['output'], report)
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            self._write_json(baseline_path, report)
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}'))  # type: ignore
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(  # type: ignore
+                f'No baseline at {baseline_path}; run with --update-baseline to create one'
+            ))
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        regressions = self._compare(results, baseline.get('endpoints', {}), options)
+        if regressions:
+            for line in regressions:
+                self.stderr.write(line)
+            raise CommandError(f'{len(regressions)} endpoint regression(s) against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline'))  # type: ignore
+
+    # ----- measurement -----
+
+    def _run(self, context, roles, options):
+        # Throttling would answer the repeated auth requests with 429s; measure the views
+        rates = {scope: None for scope in settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})}
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}):
+            return self._measure_all(context, roles, options)
+
+    def _measure_all(self, context, roles, options):
+        results = {}
+        clients = {None: self._client(None)}
+        for role in roles:
+            clients[role] = self._client(context['personas'][role])
+
+        for prefix, viewset, basename in router.registry:
+            for role in roles:
+                client = clients[role]
+                key = f'{role} GET {basename}-list'
+                if not self._selected(key, options):
+                    continue
+                url = reverse(f'{basename}-list')
+                result, response = self._measure(client, 'get', url, None, options)
+                results[key] = result
+
+                pk = self._first_pk(response)
+                detail_key = f'{role} GET {basename}-detail'
+                if pk is not None and self._selected(detail_key, options):
+                    detail_url = reverse(f'{basename}-detail', args=[pk])
+                    results[detail_key], _ = self._measure(client, 'get', detail_url, None, options)
+
+        for name, method, url_name, endpoint_roles in FUNCTION_ENDPOINTS:
+            for role in endpoint_roles:
+                if role is not None and role not in roles:
+                    continue
+                key = f'{role or "ANON"} {method.upper()} {name}'
+                if not self._selected(key, options):
+                    continue
+                data = self._payload(name, context)
+                results[key], _ = self._measure(clients[role], method, reverse(url_name), data, options)
+
+        return results
+
+    def _measure(self, client, method, url, data, options):
+        timings = []
+        queries = 0
+        response = None
+        for i in range(options['warmup'] + options['iterations']):
+            # queries_log is a bounded deque; once full, CaptureQueriesContext counts nothing
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if method == 'get':
+                    response = client.get(url, data)
+                else:
+                    response = client.post(url, data, format='json')
+                elapsed = (time.perf_counter() - started) * 1000
+            if i >= options['warmup']:
+                timings.append(elapsed)
+                queries = len(captured.captured_queries)
+
+        result = {
+            'url': url,
+            'status': response.status_code,
+            'queries': queries,
+            'p50_ms': round(_percentile(timings, 50), 2) if timings else 0.0,
+            'p95_ms': round(_percentile(timings, 95), 2) if timings else 0.0,
+            'bytes': len(response.content),
+        }
+        return result, response
+
+    def _client(self, user):
+        client = APIClient()
+        client.raise_request_exception = False
+        if user is not None:
+            access = RefreshToken.for_user(user).access_token  # type: ignore
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client
+
+    def _first_pk(self, response):
+        if response is None or response.status_code != 200:
+            return None
+        data = response.data
+        rows = data.get('results', []) if isinstance(data, dict) else data
+        if rows and isinstance(rows[0], dict):
+            return rows[0].get('id')
+        return None
+
+    def _payload(self, name, context):
+        member = context['personas']['MEMBER']
+        if name == 'search_societies':
+            return {'search': 'Bench'}
+        if name == 'login_with_password':
+            return {'phone_number': member.phone_number, 'password': BENCH_PASSWORD}
+        if name in ('login_otp_step1', 'forgot_password'):
+            return {'phone_number': member.phone_number}
+        if name == 'send_otp':
+            return {'phone_number': member.phone_number, 'purpose': 'LOGIN'}
+        return None
+
+    def _selected(self, key, options):
+        return not options['only'] or options['only'] in key
+
+    # ----- reporting -----
+
+    def _compare(self, results, baseline, options):
+        regressions = []
+        for key, result in sorted(results.items()):
+            base = baseline.get(key)
+            if not base:
+                continue
+            if base['status'] < 400 <= result['status']:
+                regressions.append(f'{key}: status {base["status"]} -> {result["status"]}')
+            if result['queries'] > base['queries'] + options['query_slack']:
+                regressions.append(f'{key}: queries {base["queries"]} -> {result["queries"]}')
+            growth = result['p95_ms'] - base['p95_ms']
+            if (growth > options['latency_floor_ms']
+                    and result['p95_ms'] > base['p95_ms'] * (1 + options['latency_threshold'])):
+                regressions.append(f'{key}: p95 {base["p95_ms"]}ms -> {result["p95_ms"]}ms')
+        return regressions
+
+    def _print_table(self, results):
+        self.stdout.write(f'{"endpoint":<58} {"status":>6} {"queries":>7} {"p50 ms":>8} {"p95 ms":>8} {"bytes":>9}')
+        for key, result in sorted(results.items()):
+            self.stdout.write(
+                f'{key:<58} {result["status"]:>6} {result["queries"]:>7} '
+                f'{result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} {result["bytes"]:>9}'
+            )
+
+    def _write_json(self, path, payload):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(payload, indent=2, sort_keys=True) + '\n')
+
+    # ----- dataset -----
+
+    def _build_dataset(self, options):
+        call_command('populate_permissions', stdout=StringIO())
+
+        password = make_password(BENCH_PASSWORD)
+        now = timezone.now()
+        today = date.today()
+        flats_per_society = options['flats']
+
+        admin = User.objects.create(  # type: ignore
+            phone_number='8000000000', username='8000000000', password=password,
+            first_name='Bench', last_name='Admin', role='ADMIN', is_staff=True
+        )
+        AdBanner.objects.bulk_create([  # type: ignore
+            AdBanner(title=f'Banner {i}', image_url=f'/banners/{i}.png', target_url='https://example.com',
+                     placement_location='HOME_TOP', start_date=today, end_date=today + timedelta(days=30))
+            for i in range(5)
+        ])
+
+        personas = {'ADMIN': admin}
+        for s in range(options['societies']):
+            society = Society.objects.create(  # type: ignore
+                name=f'Bench Society {s}', address=f'{s} Bench Road', city='Benchpur',
+                state='Benchland', pincode=f'4000{s:02d}'
+            )
+            AdminSociety.objects.create(admin=admin, society=society, is_primary=(s == 0))  # type: ignore
+            SocietySettings.objects.create(society=society, default_maintenance_amount=Decimal('2500'))  # type: ignore
+            SocietyProfile.objects.create(society=society, total_units=flats_per_society)  # type: ignore
+            FeeStructure.objects.bulk_create([  # type: ignore
+                FeeStructure(society=society, flat_type=flat_type, maintenance_amount=Decimal(2000 + 1000 * i))
+                for i, flat_type in enumerate(FLAT_TYPES)
+            ])
+
+            sub_admin = User.objects.create(  # type: ignore
+                phone_number=f'81{s:02d}000000', username=f'81{s:02d}000000', password=password,
+                first_name='Bench', last_name=f'Chairman {s}', role='SUB_ADMIN', society=society
+            )
+
+            buildings = Building.objects.bulk_create([  # type: ignore
+                Building(society=society, name=f'Block {b}', total_floors=10, flats_per_floor=10)
+                for b in range(max(1, flats_per_society // 100))
+            ])
+            enhanced_flats = EnhancedFlat.objects.bulk_create([  # type: ignore
+                EnhancedFlat(
+                    society=society, building=buildings[i % len(buildings)], floor_number=(i // 10) % 10,
+                    flat_number=f'{i:05d}', flat_type=FLAT_TYPES[i % 3], carpet_area=600 + 200 * (i % 3),
+                    balcony_area=50.0, is_available=(i % 10 == 0)
+                )
+                for i in range(flats_per_society)
+            ], batch_size=1000)
+            members = User.objects.bulk_create([  # type: ignore
+                User(phone_number=f'9{s:02d}{i:07d}', username=f'9{s:02d}{i:07d}', password=password,
+                     first_name='Member', last_name=f'{s}-{i}', role='MEMBER', society=society)
+                for i in range(flats_per_society)
+            ], batch_size=1000)
+            flats = Flat.objects.bulk_create([  # type: ignore
+                Flat(society=society, owner=members[i], block_number=f'B{i % len(buildings)}',
+                     flat_number=f'{i:05d}', type=FLAT_TYPES[i % 3], area_sqft=600 + 200 * (i % 3),
+                     enhanced_flat=enhanced_flats[i])
+                for i in range(flats_per_society)
+            ], batch_size=1000)
+            DirectoryEntry.objects.bulk_create([  # type: ignore
+                DirectoryEntry(user=member, display_name=f'{member.first_name} {member.last_name}')
+                for member in members
+            ], batch_size=1000)
+
+            MaintenanceBill.objects.bulk_create([  # type: ignore
+                MaintenanceBill(
+                    flat=flat, amount=Decimal('2500'), due_date=today - timedelta(days=30 * m),
+                    billing_period_start=today - timedelta(days=30 * (m + 1)),
+                    billing_period_end=today - timedelta(days=30 * m),
+                    status='PAID' if m else 'PENDING'
+                )
+                for flat in flats for m in range(options['bills_per_flat'])
+            ], batch_size=1000)
+
+            expenses = CommonExpense.objects.bulk_create([  # type: ignore
+                CommonExpense(society=society, title=f'Festival {e}', total_amount=Decimal('50000'),
+                              created_by=sub_admin)
+                for e in range(5)
+            ])
+            CommonExpenseSplit.objects.bulk_create([  # type: ignore
+                CommonExpenseSplit(common_expense=expense, flat=flat,
+                                   amount_due=Decimal('50000') / flats_per_society)
+                for expense in expenses for flat in flats
+            ], batch_size=1000)
+
+            Notice.objects.bulk_create([  # type: ignore
+                Notice(title=f'Notice {n}', content='Bench notice', posted_by=sub_admin, society=society)
+                for n in range(50)
+            ])
+            amenities = Amenity.objects.bulk_create([  # type: ignore
+                Amenity(society=society, name=f'Amenity {a}') for a in range(5)
+            ])
+            AmenityBooking.objects.bulk_create([  # type: ignore
+                AmenityBooking(amenity=amenities[b % 5], booked_by=members[b % len(members)],
+                               start_time=now + timedelta(hours=b), end_time=now + timedelta(hours=b + 1))
+                for b in range(200)
+            ])
+            VisitorLog.objects.bulk_create([  # type: ignore
+                VisitorLog(name=f'Visitor {v}', phone_number=f'7{v:09d}', flat_to_visit=flats[v % len(flats)],
+                           pass_code=f'S{s:02d}{v:06d}')
+                for v in range(500)
+            ])
+            MarketplaceListing.objects.bulk_create([  # type: ignore
+                MarketplaceListing(posted_by=members[i % len(members)], title=f'Listing {i}',
+                                   description='Bench listing', status='ACTIVE')
+                for i in range(50)
+            ])
+            JobListing.objects.bulk_create([  # type: ignore
+                JobListing(posted_by=members[i % len(members)], title=f'Job {i}',
+                           description='Bench job', status='ACTIVE')
+                for i in range(20)
+            ])
+
+            categories = StaffCategory.objects.bulk_create([  # type: ignore
+                StaffCategory(society=society, name=name) for name in ('Security', 'Cleaning', 'Maintenance')
+            ])
+            staff_users = User.objects.bulk_create([  # type: ignore
+                User(phone_number=f'82{s:02d}{i:06d}', username=f'82{s:02d}{i:06d}', password=password,
+                     first_name='Staff', last_name=f'{s}-{i}', role='STAFF', society=society)
+                for i in range(20)
+            ])
+            staff_members = StaffMember.objects.bulk_create([  # type: ignore
+                StaffMember(user=staff_user, staff_id=f'ST{s:02d}{i:04d}', category=categories[i % 3],
+                            join_date=today, shift_start_time='09:00', shift_end_time='18:00',
+                            emergency_contact='7000000000', address='Bench quarters')
+                for i, staff_user in enumerate(staff_users)
+            ])
+            DutySchedule.objects.bulk_create([  # type: ignore
+                DutySchedule(staff_member=staff_member, date=today + timedelta(days=d), start_time='09:00',
+                             end_time='18:00', task_description='Patrol', location='Gate 1',
+                             assigned_by=sub_admin)
+                for staff_member in staff_members for d in range(10)
+            ])
+            Complaint.objects.bulk_create([  # type: ignore
+                Complaint(raised_by=members[c % len(members)], flat=flats[c % len(flats)], title=f'Complaint {c}',
+                          description='Bench complaint', status=('OPEN', 'IN_PROGRESS', 'RESOLVED')[c % 3],
+                          assigned_to=staff_users[c % len(staff_users)])
+                for c in range(500)
+            ])
+
+            bill_types = BillType.objects.bulk_create([  # type: ignore
+                BillType(society=society, name='Water', is_recurring=True, recurrence_period='monthly',
+                         is_splitable=True),
+                BillType(society=society, name='Electricity', is_recurring=True, recurrence_period='monthly'),
+                BillType(society=society, name='Repairs'),
+            ])
+            bills = EnhancedBill.objects.bulk_create([  # type: ignore
+                EnhancedBill(society=society, bill_type=bill_types[b % 3], bill_number=f'BEN{s:03d}{b:06d}',
+                             title=f'Bill {b}', amount=Decimal('100000'), total_amount=Decimal('100000'),
+                             due_date=today + timedelta(days=15), status='PENDING', created_by=sub_admin)
+                for b in range(100)
+            ])
+            BillDistribution.objects.bulk_create([  # type: ignore
+                BillDistribution(bill=bills[0], flat=enhanced_flat,
+                                 allocated_amount=Decimal('100000') / flats_per_society)
+                for enhanced_flat in enhanced_flats
+            ], batch_size=1000)
+
+            passes = VisitorPass.objects.bulk_create([  # type: ignore
+                VisitorPass(pass_number=f'VPB{s:03d}{p:07d}', visitor_name=f'Guest {p}', visitor_phone='7000000000',
+                            purpose_of_visit='Visit', society=society,
+                            flat_to_visit=enhanced_flats[p % len(enhanced_flats)],
+                            expected_entry_time=now + timedelta(hours=p % 48), referenced_by='Resident',
+                            created_by=sub_admin, gate_entry_staff=staff_users[0])
+                for p in range(2000)
+            ], batch_size=1000)
+            GateUpdateLog.objects.bulk_create([  # type: ignore
+                GateUpdateLog(society=society, update_type='VISITOR_ENTRY', person_name=f'Guest {g}',
+                              visitor_pass=passes[g % len(passes)], gate_number=str(1 + g % 3),
+                              logged_by=staff_users[g % len(staff_users)])
+                for g in range(options['gate_logs'])
+            ], batch_size=1000)
+
+            designations = HelpdeskDesignation.objects.bulk_create([  # type: ignore
+                HelpdeskDesignation(society=society, title=title, category='Maintenance')
+                for title in ('Electrician', 'Plumber', 'Carpenter', 'Manager', 'Doctor')
+            ])
+            HelpdeskContact.objects.bulk_create([  # type: ignore
+                HelpdeskContact(society=society, designation=designations[h % 5], name=f'Helper {h}',
+                                primary_phone='7000000000', added_by=sub_admin)
+                for h in range(20)
+            ])
+
+            MemberRegistrationRequest.objects.bulk_create([  # type: ignore
+                MemberRegistrationRequest(
+                    first_name='Applicant', last_name=str(r), phone_number=f'83{s:02d}{r:06d}',
+                    email=f'applicant{s}-{r}@example.com', society=society, building=buildings[0],
+                    flat=enhanced_flats[0], ownership_type='OWNER', emergency_contact_name='Kin',
+                    emergency_contact_phone='7000000000', permanent_address='Elsewhere', id_proof_number='X'
+                )
+                for r in range(50)
+            ])
+            MemberInvitation.objects.bulk_create([  # type: ignore
+                MemberInvitation(invited_by=sub_admin, society=society, building=buildings[0],
+                                 flat=enhanced_flats[0], phone_number=f'84{s:02d}{r:06d}',
+                                 email=f'invitee{s}-{r}@example.com', first_name='Invitee', last_name=str(r),
+                                 ownership_type='TENANT', expires_at=now + timedelta(days=7))
+                for r in range(20)
+            ])
+            StaffInvitation.objects.bulk_create([  # type: ignore
+                StaffInvitation(invited_by=sub_admin, society=society, category=categories[0],
+                                phone_number=f'85{s:02d}{r:06d}', email=f'staff{s}-{r}@example.com',
+                                first_name='Guard', last_name=str(r), staff_id=f'SI{s:02d}{r:04d}',
+                                designation='Guard', shift_start_time='09:00', shift_end_time='18:00',
+                                expires_at=now + timedelta(days=7))
+                for r in range(10)
+            ])
+            ChairmanInvitation.objects.bulk_create([  # type: ignore
+                ChairmanInvitation(invited_by=admin, society=society, email=f'chair{s}-{r}@example.com',
+                                   phone_number=f'86{s:02d}{r:06d}', first_name='Chair', last_name=str(r),
+                                   invitation_token=f'bench-{s}-{r}', expires_at=now + timedelta(days=7))
+                for r in range(5)
+            ])
+            BulkUserOperation.objects.bulk_create([  # type: ignore
+                BulkUserOperation(operation_type='IMPORT', initiated_by=sub_admin, society=society,
+                                  total_records=100, successful_records=90, failed_records=10,
+                                  status='COMPLETED')
+                for _ in range(5)
+            ])
+            UserRoleTransition.objects.bulk_create([  # type: ignore
+                UserRoleTransition(user=members[t], from_role='MEMBER', to_role='STAFF',
+                                   requested_by=sub_admin, reason='Bench')
+                for t in range(min(20, len(members)))
+            ])
+
+            if s == 0:
+                personas['SUB_ADMIN'] = sub_admin
+                personas['MEMBER'] = members[0]
+                personas['STAFF'] = staff_users[0]
+
+        return {'personas': personas}
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from society_management.models import OTP
+from society_management.otp_store import STORES
+
+
+PHONE_PREFIX = 'otpbench-'
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure OTP send/verify throughput and latency of each OTP_BACKEND store under '
+        'concurrent load, and check that every code is consumed exactly once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', action='append', choices=sorted(STORES),
+                            help='Store to benchmark (repeatable; default: all)')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--phones', type=int, default=50, help='Phone numbers per client')
+        parser.add_argument('--rounds', type=int, default=4, help='Send/verify rounds per phone number')
+        parser.add_argument('--racers', type=int, default=8,
+                            help='Clients verifying the same code at once in the race check')
+        parser.add_argument('--output', default='', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['phones'] < 1 or options['rounds'] < 1:
+            raise CommandError('--threads, --phones and --rounds must be at least 1')
+
+        results = {}
+        for name in options['backend'] or sorted(STORES):
+            store = STORES[name]()
+            try:
+                results[name] = self._run(store, options)
+            finally:
+                OTP.objects.filter(phone_number__startswith=PHONE_PREFIX).delete()  # type: ignore
+            self._print(name, results[name])
+
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({
+                'generated_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'threads': options['threads'],
+                'phones_per_thread': options['phones'],
+                'rounds': options['rounds'],
+                'backends': results,
+            }, indent=2, sort_keys=True))
+
+    def _client(self, store, client, options):
+        """Send, verify, re-verify and mis-verify codes for this client's phone numbers"""
+        timings = {'send': [], 'verify': []}
+        counts = {'verified': 0, 'reused': 0, 'guessed': 0, 'errors': 0, 'queries': 0}
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(options['rounds']):
+                    for p in range(options['phones']):
+                        phone_number = f'{PHONE_PREFIX}{client:03d}{p:05d}'
+                        try:
+                            started = time.perf_counter()
+                            otp = store.issue(phone_number, 'LOGIN')
+                            timings['send'].append(time.perf_counter() - started)
+
+                            wrong = f'{(int(otp.otp_code) + 1) % 1000000:06d}'
+                            counts['guessed'] += bool(store.verify(phone_number, wrong, 'LOGIN'))
+                            started = time.perf_counter()
+                            counts['verified'] += bool(store.verify(phone_number, otp.otp_code, 'LOGIN'))
+                            timings['verify'].append(time.perf_counter() - started)
+                            counts['reused'] += bool(store.verify(phone_number, otp.otp_code, 'LOGIN'))
+                        except Exception:
+                            counts['errors'] += 1
+            counts['queries'] = len(queries)
+        finally:
+            connection.close()
+        return timings, counts
+
+    def _race(self, store, racers):
+        """Successful verifications when ``racers`` clients submit the same code at once"""
+        phone_number = f'{PHONE_PREFIX}race'
+        otp = store.issue(phone_number, 'LOGIN')
+        barrier = threading.Barrier(racers)
+
+        def verify():
+            try:
+                barrier.wait()
+                return bool(store.verify(phone_number, otp.otp_code, 'LOGIN'))
+            except Exception:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(racers) as pool:
+            return sum(pool.map(lambda _: verify(), range(racers)))
+
+    def _run(self, store, options):
+        threads = options['threads']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            outcomes = list(pool.map(lambda client: self._client(store, client, options), range(threads)))
+        elapsed = time.perf_counter() - started
+
+        timings = {'send': [], 'verify': []}
+        counts = {'verified': 0, 'reused': 0, 'guessed': 0, 'errors': 0, 'queries': 0}
+        for client_timings, client_counts in outcomes:
+            for key in timings:
+                timings[key].extend(client_timings[key])
+            for key in counts:
+                counts[key] += client_counts[key]
+
+        attempts = threads * options['phones'] * options['rounds']
+        result = {
+            'attempts': attempts,
+            'seconds': round(elapsed, 3),
+            # Each attempt is one send and three verifications
+            'operations_per_second': round(attempts * 4 / elapsed, 1),
+            'queries_per_attempt': round(counts['queries'] / attempts, 2),
+            'race_winners': self._race(store, options['racers']),
+            **{key: value for key, value in counts.items() if key != 'queries'},
+        }
+        for key, values in timings.items():
+            if values:
+                result[f'{key}_p50_ms'] = round(_percentile(values, 50) * 1000, 3)
+                result[f'{key}_p95_ms'] = round(_percentile(values, 95) * 1000, 3)
+        return result
+
+    def _print(self, name, result):
+        self.stdout.write(
+            f"{name:<10} {result['operations_per_second']:>10} ops/s  "
+            f"send p50/p95 {result.get('send_p50_ms', '-')}/{result.get('send_p95_ms', '-')} ms  "
+            f"verify p50/p95 {result.get('verify_p50_ms', '-')}/{result.get('verify_p95_ms', '-')} ms  "
+            f"{result['queries_per_attempt']} queries/attempt"
+        )
+        problems = []
+        if result['verified'] + result['errors'] != result['attempts']:
+            problems.append(f"{result['attempts'] - result['verified']} valid codes rejected")
+        if result['reused'] or result['guessed']:
+            problems.append(f"{result['reused']} reused and {result['guessed']} wrong codes accepted")
+        if result['race_winners'] != 1:
+            problems.append(f"{result['race_winners']} winners verifying the same code")
+        if result['errors']:
+            problems.append(f"{result['errors']} attempts failed with errors")
+        for problem in problems:
+            self.stdout.write(self.style.WARNING(f'  {problem}'))  # type: ignore
@@ -0,0 +1,166 @@
+import datetime
+import json
+import time
+import uuid
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from society_management import revocation
+from society_management.models import RevokedToken, User
+from society_management.token_auth import ClaimsTokenRefreshSerializer, RefreshToken
+
+
+PHONE_NUMBER = 'refreshbench'
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure token refresh throughput and latency against a large set of revoked refresh '
+        'tokens, with and without the revocation filters, and check that replayed tokens are '
+        'refused. Runs in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=1000000, help='Revoked tokens to seed')
+        parser.add_argument('--refreshes', type=int, default=2000, help='Refreshes per mode')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per seeding INSERT')
+        parser.add_argument('--output', default='', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['tokens'] < 0 or options['refreshes'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--refreshes and --batch-size must be at least 1, --tokens at least 0')
+
+        results = {}
+        with transaction.atomic():
+            user = User.objects.create_user(  # type: ignore
+                username=PHONE_NUMBER, email=f'{PHONE_NUMBER}@example.com', phone_number=PHONE_NUMBER,
+                password=uuid.uuid4().hex, role='MEMBER',
+            )
+            results['seed_seconds'] = self._seed(options['tokens'], options['batch_size'])
+            self.stdout.write(f"Seeded {options['tokens']} revoked tokens in {results['seed_seconds']}s")
+            try:
+                for mode, use_filter in (('filter', True), ('database', False)):
+                    revocation._store = revocation.RevocationStore(use_filter=use_filter)
+                    results[mode] = self._run(revocation._store, user, options['refreshes'])
+                    self._print(mode, results[mode])
+            finally:
+                revocation._store = None
+                transaction.set_rollback(True)
+
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({
+                'generated_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'revoked_tokens': options['tokens'],
+                'refreshes': options['refreshes'],
+                **results,
+            }, indent=2, sort_keys=True))
+
+    def _seed(self, count, batch_size):
+        """Insert ``count`` revoked tokens expiring over the refresh token lifetime"""
+        started = time.perf_counter()
+        now = timezone.now()
+        lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+        last_pk = RevokedToken.objects.order_by('-pk').values_list('pk', flat=True).first() or 0  # type: ignore
+        for low in range(0, count, batch_size):
+            RevokedToken.objects.bulk_create([  # type: ignore
+                RevokedToken(
+                    jti=uuid.uuid4().hex,
+                    expires_at=now + datetime.timedelta(seconds=60 + (i * 7919) % lifetime),
+                )
+                for i in range(low, min(count, low + batch_size))
+            ])
+        # Revoked before this run, as in a live table, so periodic syncs only read new rows
+        RevokedToken.objects.filter(pk__gt=last_pk).update(revoked_at=now - datetime.timedelta(hours=1))  # type: ignore
+        return round(time.perf_counter() - started, 3)
+
+    def _refresh(self, token):
+        serializer = ClaimsTokenRefreshSerializer(data={'refresh': token})
+        try:
+            return serializer.is_valid()
+        except TokenError:
+            return False
+
+    def _run(self, store, user, refreshes):
+        started = time.perf_counter()
+        if store.use_filter:
+            store._sync()
+        sync_seconds = time.perf_counter() - started
+
+        tokens = [str(RefreshToken.for_user(user)) for _ in range(refreshes)]
+        timings = {'refresh': [], 'replay': []}
+        counts = {'refreshed': 0, 'replayed': 0}
+        queries = [0]
+
+        def count(execute, *args):
+            queries[0] += 1
+            return execute(*args)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            for token in tokens:
+                began = time.perf_counter()
+                counts['refreshed'] += self._refresh(token)
+                timings['refresh'].append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - started
+        for token in tokens:
+            began = time.perf_counter()
+            counts['replayed'] += self._refresh(token)
+            timings['replay'].append(time.perf_counter() - began)
+
+        result = {
+            'refreshes': refreshes,
+            'refreshes_per_second': round(refreshes / elapsed, 1),
+            'queries_per_refresh': round(queries[0] / refreshes, 2),
+            **counts,
+        }
+        if store.use_filter:
+            # Never-revoked ids that still hit a filter and cost a confirming query
+            probes = 10000
+            expires = int(time.time()) + 3600
+            bucket = store._buckets.get(store._bucket(expires))
+            hits = sum(uuid.uuid4().hex in bucket for _ in range(probes)) if bucket else 0
+            result.update(
+                sync_seconds=round(sync_seconds, 3),
+                false_positive_rate=round(hits / probes, 4),
+                filter_bytes=sum(len(bucket.bits) for bucket in store._buckets.values()),
+            )
+        for key, values in timings.items():
+            result[f'{key}_p50_ms'] = round(_percentile(values, 50) * 1000, 3)
+            result[f'{key}_p95_ms'] = round(_percentile(values, 95) * 1000, 3)
+            result[f'{key}_max_ms'] = round(max(values) * 1000, 3)
+        return result
+
+    def _print(self, mode, result):
+        line = (
+            f"{mode:<9} {result['refreshes_per_second']:>9} refreshes/s  "
+            f"refresh p50/p95/max {result['refresh_p50_ms']}/{result['refresh_p95_ms']}/{result['refresh_max_ms']} ms  "
+            f"replay p50/p95 {result['replay_p50_ms']}/{result['replay_p95_ms']} ms  "
+            f"{result['queries_per_refresh']} queries/refresh"
+        )
+        if 'filter_bytes' in result:
+            line += (
+                f"  filters {result['filter_bytes'] // 1024} KiB, synced in {result['sync_seconds']}s, "
+                f"{result['false_positive_rate']:.2%} false positives"
+            )
+        self.stdout.write(line)
+        if result['replayed']:
+            self.stdout.write(self.style.WARNING(f"  {result['replayed']} replayed tokens accepted"))  # type: ignore
+        if result['refreshed'] != result['refreshes']:
+            self.stdout.write(self.style.WARNING(  # type: ignore
+                f"  {result['refreshes'] - result['refreshed']} valid tokens refused"
+            ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from society_management.billing import DEFAULT_BATCH_SIZE, generate_maintenance_bills, parse_period
+from society_management.models import Society
+
+
+class Command(BaseCommand):
+    help = 'Generate monthly maintenance bills for every flat of one or all societies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period', help='Billing month as YYYY-MM')
+        parser.add_argument('--society', type=int, action='append', dest='societies',
+                            help='Society id (repeatable); defaults to every society')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be created without writing')
+
+    def handle(self, *args, **options):
+        try:
+            period_start = parse_period(options['period'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        societies = Society.objects.all()  # type: ignore
+        if options['societies']:
+            societies = Society.objects.filter(id__in=options['societies'])  # type: ignore
+
+        total_created = total_errors = 0
+        for society in societies.order_by('id'):
+            result = generate_maintenance_bills(
+                society, period_start, batch_size=options['batch_size'], dry_run=options['dry_run']
+            )
+            total_created += result.created
+            total_errors += len(result.errors)
+            self.stdout.write(
+                f'{society.name}: {result.created} created, {result.skipped} already billed, '
+                f'{len(result.errors)} errors in {result.duration:.2f}s '
+                f'({result.throughput:.0f} bills/s)'
+            )
+            for error in result.errors:
+                self.stderr.write(f'  flat {error["flat"]}: {error["error"]}')
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total_created} bills ({total_errors} errors)'))
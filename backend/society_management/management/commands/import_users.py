@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from society_management.models import BulkUserOperation, User
+from society_management.user_import import run_import
+
+
+class Command(BaseCommand):
+    help = 'Run a pending bulk user import, e.g. one whose worker was restarted before it began'
+
+    def add_arguments(self, parser):
+        parser.add_argument('operation', type=int, help='BulkUserOperation id')
+        parser.add_argument('--default-role', choices=[role for role, _ in User.ROLE_CHOICES], default='MEMBER',
+                            help='Role of rows without a role column')
+        parser.add_argument('--batch-size', type=int, help='Rows validated and inserted per batch')
+
+    def handle(self, *args, **options):
+        try:
+            operation = run_import(options['operation'], options['default_role'], options['batch_size'])
+        except (BulkUserOperation.DoesNotExist, ValueError) as e:  # type: ignore
+            raise CommandError(str(e))
+
+        message = (
+            f'Import {operation.id} {operation.status.lower()}: {operation.successful_records} of '
+            f'{operation.total_records} rows imported, {operation.failed_records} rejected'
+        )
+        if operation.status == 'COMPLETED':
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(self.style.ERROR(message))
+            self.stdout.write(operation.error_log[-2000:])
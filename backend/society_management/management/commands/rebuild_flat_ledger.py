@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from society_management import ledger
+from society_management.models import Flat
+
+
+class Command(BaseCommand):
+    help = 'Rebuild flat ledger entries and balances from maintenance bills, expense splits and bill distributions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--society', type=int, action='append', dest='societies',
+                            help='Society id (repeatable); defaults to every society')
+        parser.add_argument('--batch-size', type=int, default=500, help='Flats rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        flats = Flat.objects.order_by('id')  # type: ignore
+        if options['societies']:
+            flats = flats.filter(society_id__in=options['societies'])
+
+        flat_ids = list(flats.values_list('id', flat=True))
+        posted = 0
+        for i in range(0, len(flat_ids), options['batch_size']):
+            posted += ledger.rebuild(flat_ids[i:i + options['batch_size']])
+
+        self.stdout.write(self.style.SUCCESS(f'Posted {posted} ledger entries for {len(flat_ids)} flats'))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from society_management.models import Society
+from society_management.reconciliation import DEFAULT_CHUNK_SIZE, reconcile_statement
+
+
+class Command(BaseCommand):
+    help = "Match a bank/UPI statement CSV against a society's open bills and mark them paid"
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help='Path to the statement CSV')
+        parser.add_argument('--society', type=int, required=True, help='Society id')
+        parser.add_argument('--report', help='Where to write unmatched rows; defaults to <statement>.unmatched.csv')
+        parser.add_argument('--payment-mode', choices=['BANK_TRANSFER', 'UPI'], default='BANK_TRANSFER')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Statement rows matched and applied per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report matches without marking bills paid')
+
+    def handle(self, *args, **options):
+        try:
+            society = Society.objects.get(pk=options['society'])  # type: ignore
+        except Society.DoesNotExist:  # type: ignore
+            raise CommandError(f'Society {options["society"]} does not exist')
+
+        report_path = options['report'] or f'{options["statement"]}.unmatched.csv'
+        try:
+            with open(options['statement'], newline='', encoding='utf-8-sig') as statement, \
+                    open(report_path, 'w', newline='', encoding='utf-8') as report:
+                result = reconcile_statement(
+                    society, statement, report=report, chunk_size=options['chunk_size'],
+                    dry_run=options['dry_run'], payment_mode=options['payment_mode']
+                )
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            raise CommandError(str(e))
+
+        summary = result.as_dict()
+        verb = 'Would match' if options['dry_run'] else 'Matched'
+        self.stdout.write(
+            f'{summary["rows"]} rows, {summary["credits"]} credits against {summary["open_bills"]} open bills '
+            f'in {summary["duration_seconds"]}s ({summary["rows_per_second"]:.0f} rows/s)'
+        )
+        self.stdout.write(
+            f'{verb} {summary["matched"]} ({summary["matched_amount"]}): '
+            f'{summary["matched_by"]["transaction_id"]} by transaction id, '
+            f'{summary["matched_by"]["reference"]} by reference; '
+            f'{summary["already_reconciled"]} already reconciled'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{summary["unmatched"]} unmatched ({summary["unmatched_amount"]}) written to {report_path}'
+        ))
@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from society_management.analytics import rollup_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily analytics rollups; by default the last ANALYTICS_ROLLUP_LOOKBACK_DAYS days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', help='Last day to rebuild (YYYY-MM-DD); defaults to today')
+        parser.add_argument('--society', type=int, action='append', dest='societies',
+                            help='Society id (repeatable); defaults to every society')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.date.fromisoformat(options['start']) if options['start'] else None
+            end = datetime.date.fromisoformat(options['end']) if options['end'] else None
+            report = rollup_daily_stats(start, end, society_ids=options['societies'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {report["from"]} to {report["to"]}: {report["rows"]} rows in '
+            f'{report["windows"]} windows, {report["duration_seconds"]}s'
+        ))
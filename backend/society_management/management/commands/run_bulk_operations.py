@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from society_management.bulk_jobs import resume_stalled, run_operation
+
+
+class Command(BaseCommand):
+    help = 'Run bulk exports, deactivations and role changes left pending or abandoned by a crashed worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('operations', nargs='*', type=int,
+                            help='Operation ids to run or resume (including failed ones); '
+                                 'defaults to every pending or stalled operation')
+        parser.add_argument('--chunk-size', type=int, help='Users processed per checkpoint')
+
+    def handle(self, *args, **options):
+        if not options['operations']:
+            resumed = resume_stalled()
+            self.stdout.write(self.style.SUCCESS(f'Ran {len(resumed)} operations {resumed}'))
+            return
+
+        for operation_id in options['operations']:
+            try:
+                operation = run_operation(operation_id, options['chunk_size'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'{operation.operation_type} {operation.id}: {operation.successful_records} of '
+                f'{operation.total_records} users done, {operation.failed_records} skipped'
+            ))
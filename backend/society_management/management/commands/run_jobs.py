@@ -0,0 +1,84 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from society_management import jobs
+
+
+def _worker_process(queues, burst, stop_event):
+    import django
+    django.setup()
+    jobs.work(queues, burst=burst, stop=stop_event.is_set)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue (TASK_BACKEND="database") and queue scheduled jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help='Queue to take jobs from (repeatable); defaults to every queue')
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker processes')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is ready')
+        parser.add_argument('--no-scheduler', action='store_true',
+                            help='Do not queue TASK_SCHEDULE jobs from this process')
+        parser.add_argument('--metrics', action='store_true', help='Print job metrics for the last day and exit')
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            self.print_metrics()
+            return
+
+        stop = multiprocessing.get_context('spawn').Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+        scheduler = not options['no_scheduler']
+        queues = options['queues']
+
+        if options['concurrency'] <= 1:
+            processed = 0
+            while not stop.is_set():
+                if scheduler:
+                    jobs.enqueue_due()
+                ran = jobs.work(queues, burst=True, stop=stop.is_set)
+                processed += ran
+                if options['burst'] and not ran:
+                    break
+                if not ran:
+                    stop.wait(settings.TASK_WORKER_POLL_INTERVAL)
+            self.stdout.write(self.style.SUCCESS(f'Ran {processed} jobs'))
+            return
+
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(target=_worker_process, args=(queues, options['burst'], stop), name=f'run_jobs-{index}')
+            for index in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {len(workers)} workers')
+        while any(worker.is_alive() for worker in workers) and not stop.is_set():
+            if scheduler:
+                jobs.enqueue_due()
+            stop.wait(settings.TASK_SCHEDULER_INTERVAL)
+        stop.set()
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
+
+    def print_metrics(self):
+        report = jobs.metrics()
+        self.stdout.write(f'Since {report["since"]}')
+        for row in report['tasks']:
+            self.stdout.write(
+                f'{row["task"]}: {row["total"]} jobs, {row["succeeded"]} succeeded, {row["failed"]} failed, '
+                f'{row["retried"]} retried, {row["queued"] + row["running"]} waiting or running; '
+                f'avg {row["avg_duration_ms"]} ms, max {row["max_duration_ms"]} ms, '
+                f'avg wait {row["avg_wait_seconds"]} s'
+            )
+        for row in report['queues']:
+            self.stdout.write(
+                f'queue {row["queue"]}: {row["queued"]} queued, {row["ready"]} ready, '
+                f'oldest ready for {row["oldest_ready_age_seconds"]} s'
+            )
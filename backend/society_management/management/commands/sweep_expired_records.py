@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from society_management.lifecycle import POLICIES, chunk_size, sweep_expired_records
+
+
+class Command(BaseCommand):
+    help = 'Expire stale OTPs, invitations and visitor passes, and purge finished rows past their retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=POLICIES,
+                            help='Sweep only this policy (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help=f'Primary key range changed per statement (default {chunk_size()})')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        report = sweep_expired_records(only=options['only'], size=options['chunk_size'], dry_run=options['dry_run'])
+        expire, purge = ('Would expire', 'would purge') if options['dry_run'] else ('Expired', 'purged')
+        for label in POLICIES:
+            if label in report:
+                stats = report[label]
+                self.stdout.write(f'{label.replace("_", " ")}: {expire} {stats["expired"]}, {purge} {stats["purged"]}')
+        self.stdout.write(self.style.SUCCESS(f'Done in {report["duration_seconds"]}s'))
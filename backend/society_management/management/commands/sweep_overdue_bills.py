@@ -0,0 +1,33 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from society_management.billing import DEFAULT_SWEEP_CHUNK_SIZE, sweep_overdue_bills
+
+
+class Command(BaseCommand):
+    help = 'Mark unpaid bills past their due date as overdue and apply late fees'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help='Treat bills due before this date (YYYY-MM-DD) as overdue; defaults to today')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_SWEEP_CHUNK_SIZE,
+                            help='Primary key range updated per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            try:
+                as_of = datetime.date.fromisoformat(options['as_of'])
+            except ValueError:
+                raise CommandError(f'Invalid date "{options["as_of"]}", expected YYYY-MM-DD')
+
+        report = sweep_overdue_bills(as_of=as_of, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        verb = 'Would mark' if options['dry_run'] else 'Marked'
+        for label in ('maintenance_bills', 'enhanced_bills', 'bill_distributions'):
+            stats = report[label]
+            line = f'{verb} {stats["rows"]} {label.replace("_", " ")} overdue'
+            if options['dry_run'] and 'late_fees' in stats:
+                line += f' (late fees {stats["late_fees"]})'
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f'Done in {report["duration_seconds"]}s'))
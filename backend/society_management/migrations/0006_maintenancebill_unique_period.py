@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:53
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_bills(apps, schema_editor):
+    """
+    Stop before adding the constraint while a flat has several bills for one period.
+
+    Duplicates may carry payments, so which one to keep is left to an operator; the
+    error lists every affected (flat, period) group to resolve with a data fix.
+    """
+    MaintenanceBill = apps.get_model('society_management', 'MaintenanceBill')
+    groups = list(
+        MaintenanceBill.objects.values('flat_id', 'billing_period_start')
+        .annotate(bills=Count('id')).filter(bills__gt=1).order_by('flat_id', 'billing_period_start')
+    )
+    if groups:
+        listed = '\n'.join(
+            f"  flat {group['flat_id']}, period starting {group['billing_period_start']}: {group['bills']} bills"
+            for group in groups
+        )
+        raise RuntimeError(
+            f'{len(groups)} flat/period groups have more than one maintenance bill. Resolve them '
+            f'(keep one bill per flat and period) and run the migration again:\n{listed}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0005_user_aadhaar_number_user_date_of_birth_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_bills, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='maintenancebill',
+            constraint=models.UniqueConstraint(fields=('flat', 'billing_period_start'), name='unique_maintenance_bill_period'),
+        ),
+    ]
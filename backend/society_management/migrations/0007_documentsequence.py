@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0006_maintenancebill_unique_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(help_text='e.g., "BILL", "VISITOR_PASS"', max_length=50)),
+                ('period', models.CharField(blank=True, default='', help_text='e.g., "20250131" for daily series', max_length=20)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('society', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_sequences', to='society_management.society')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='documentsequence',
+            constraint=models.UniqueConstraint(fields=('society', 'series', 'period'), name='unique_document_sequence'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentsequence',
+            constraint=models.UniqueConstraint(condition=models.Q(('society__isnull', True)), fields=('series', 'period'), name='unique_global_document_sequence'),
+        ),
+    ]
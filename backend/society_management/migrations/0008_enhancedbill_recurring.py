@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0007_documentsequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enhancedbill',
+            index=models.Index(fields=['is_recurring', 'next_due_date'], name='enhancedbill_recurring_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='enhancedbill',
+            constraint=models.UniqueConstraint(condition=models.Q(('parent_bill__isnull', False)), fields=('parent_bill', 'due_date'), name='unique_recurring_bill_occurrence'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0008_enhancedbill_recurring'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maintenancebill',
+            name='late_fee',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=8),
+        ),
+    ]
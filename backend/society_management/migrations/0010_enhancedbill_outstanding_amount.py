@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:58
+
+from django.db import migrations, models
+
+
+def backfill_outstanding_amount(apps, schema_editor):
+    EnhancedBill = apps.get_model('society_management', 'EnhancedBill')
+    EnhancedBill.objects.update(outstanding_amount=models.F('total_amount') - models.F('paid_amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0009_maintenancebill_late_fee'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enhancedbill',
+            name='outstanding_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_outstanding_amount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0010_enhancedbill_outstanding_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlatBalance',
+            fields=[
+                ('flat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='society_management.flat')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_charged', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_entry_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('CHARGE', 'Charge'), ('PAYMENT', 'Payment'), ('LATE_FEE', 'Late Fee'), ('ADJUSTMENT', 'Adjustment')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Positive increases dues, negative reduces them', max_digits=12)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('source_type', models.CharField(choices=[('MAINTENANCE_BILL', 'Maintenance Bill'), ('EXPENSE_SPLIT', 'Common Expense Split'), ('BILL_DISTRIBUTION', 'Bill Distribution'), ('MANUAL', 'Manual')], default='MANUAL', max_length=20)),
+                ('source_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('flat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='society_management.flat')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['flat', 'created_at', 'id'], name='ledgerentry_flat_created_idx'), models.Index(fields=['source_type', 'source_id'], name='ledgerentry_source_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0011_flat_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SocietyCounters',
+            fields=[
+                ('society', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to='society_management.society')),
+                ('users', models.IntegerField(default=0)),
+                ('members', models.IntegerField(default=0)),
+                ('staff', models.IntegerField(default=0)),
+                ('flats', models.IntegerField(default=0)),
+                ('complaints', models.IntegerField(default=0)),
+                ('open_complaints', models.IntegerField(default=0)),
+                ('pending_bills', models.IntegerField(default=0, help_text='Maintenance bills not yet paid')),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Last full recount')),
+            ],
+        ),
+    ]
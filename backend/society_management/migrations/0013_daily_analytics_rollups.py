@@ -0,0 +1,100 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0012_society_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AmenityDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('approved_bookings', models.IntegerField(default=0)),
+                ('rejected_bookings', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GateDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('gate_number', models.CharField(max_length=10)),
+                ('visitor_entries', models.IntegerField(default=0)),
+                ('visitor_exits', models.IntegerField(default=0)),
+                ('vehicle_entries', models.IntegerField(default=0)),
+                ('vehicle_exits', models.IntegerField(default=0)),
+                ('denied_entries', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SocietyDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bills_raised', models.IntegerField(default=0)),
+                ('amount_billed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('bills_paid', models.IntegerField(default=0)),
+                ('amount_collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('bills_overdue', models.IntegerField(default=0, help_text='Bills due this day and not paid by then')),
+                ('amount_overdue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('complaints_opened', models.IntegerField(default=0)),
+                ('complaints_resolved', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='gateupdatelog',
+            index=models.Index(fields=['timestamp'], name='gateupdatelog_timestamp_idx'),
+        ),
+        migrations.AddField(
+            model_name='societydailystats',
+            name='society',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='society_management.society'),
+        ),
+        migrations.AddField(
+            model_name='gatedailystats',
+            name='society',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gate_daily_stats', to='society_management.society'),
+        ),
+        migrations.AddField(
+            model_name='amenitydailystats',
+            name='amenity',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='society_management.amenity'),
+        ),
+        migrations.AddField(
+            model_name='amenitydailystats',
+            name='society',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='amenity_daily_stats', to='society_management.society'),
+        ),
+        migrations.AddConstraint(
+            model_name='societydailystats',
+            constraint=models.UniqueConstraint(fields=('society', 'date'), name='unique_society_daily_stats'),
+        ),
+        migrations.AddConstraint(
+            model_name='gatedailystats',
+            constraint=models.UniqueConstraint(fields=('society', 'date', 'gate_number'), name='unique_gate_daily_stats'),
+        ),
+        migrations.AddIndex(
+            model_name='amenitydailystats',
+            index=models.Index(fields=['society', 'date'], name='amenitydailystats_society_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='amenitydailystats',
+            constraint=models.UniqueConstraint(fields=('amenity', 'date'), name='unique_amenity_daily_stats'),
+        ),
+    ]
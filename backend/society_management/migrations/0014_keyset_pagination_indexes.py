@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0013_daily_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['created_at', 'id'], name='complaint_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gateupdatelog',
+            index=models.Index(fields=['society', 'timestamp', 'id'], name='gateupdatelog_society_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notice',
+            index=models.Index(fields=['society', 'created_at', 'id'], name='notice_society_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notice',
+            index=models.Index(fields=['created_at', 'id'], name='notice_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitorlog',
+            index=models.Index(fields=['created_at', 'id'], name='visitorlog_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitorpass',
+            index=models.Index(fields=['society', 'created_at', 'id'], name='visitorpass_society_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0014_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkuseroperation',
+            name='checkpoint',
+            field=models.JSONField(blank=True, default=dict, help_text='Progress of a background operation, for resuming'),
+        ),
+        migrations.AddField(
+            model_name='bulkuseroperation',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last progress of the worker running it', null=True),
+        ),
+        migrations.AddField(
+            model_name='bulkuseroperation',
+            name='parameters',
+            field=models.JSONField(blank=True, default=dict, help_text='Users selected and options of the operation'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0016_background_jobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(condition=models.Q(('is_expired', False), ('is_used', False)), fields=['phone_number', 'purpose'], name='otp_active_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0017_otp_active_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='backgroundjob',
+            index=models.Index(fields=['status', 'finished_at'], name='backgroundjob_finished_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chairmaninvitation',
+            index=models.Index(fields=['status', 'expires_at'], name='chairmaninv_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memberinvitation',
+            index=models.Index(fields=['status', 'expires_at'], name='memberinv_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffinvitation',
+            index=models.Index(fields=['status', 'expires_at'], name='staffinv_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subadmininvitation',
+            index=models.Index(fields=['status', 'expires_at'], name='subadmininv_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitorpass',
+            index=models.Index(fields=['status', 'expected_entry_time'], name='visitorpass_status_entry_idx'),
+        ),
+    ]
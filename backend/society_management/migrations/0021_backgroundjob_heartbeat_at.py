@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:12
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_heartbeats(apps, schema_editor):
+    """Running jobs count from when they started until their worker first reports"""
+    BackgroundJob = apps.get_model('society_management', 'BackgroundJob')
+    BackgroundJob.objects.filter(status='RUNNING').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('society_management', '0020_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of progress from the running worker', null=True),
+        ),
+        migrations.RunPython(start_heartbeats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+from rest_framework.decorators import action
+from rest_framework.permissions import SAFE_METHODS
+
+from . import exports
+from .planner import plan_for_serializer
+from .tenancy import accessible_society_ids
+
+
+class RelationPlannerMixin:
+    """
+    Applies the serializer's relation plan to the viewset queryset.
+
+    Joins and prefetches are derived from the serializer's declared sources (see
+    ``planner.py``), so views keep returning plain ``Model.objects.filter(...)``
+    querysets. ``related_paths`` adds lookups the serializer cannot describe itself.
+    Columns of joined rows are only restricted with ``only()`` on read requests.
+    """
+    related_paths = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)  # type: ignore
+        request = getattr(self, 'request', None)
+        if request is None:
+            return queryset
+        plan = plan_for_serializer(self.get_serializer_class(), tuple(self.related_paths))  # type: ignore
+        return plan.apply(queryset, restrict_fields=request.method in SAFE_METHODS)
+
+
+class SocietyScopedMixin:
+    """
+    Restricts the viewset queryset to the caller's accessible societies.
+
+    ``society_path`` is the lookup from the model to its society foreign key, e.g.
+    ``'category__society'``; the filter becomes ``<path>_id IN (...)`` on the ids
+    resolved once per request (see ``tenancy.py``). Callers whose role is not in
+    ``society_roles`` get an empty queryset unless ``get_queryset`` handles them.
+    """
+    society_path = 'society'
+    society_roles = ('ADMIN', 'SUB_ADMIN')
+
+    def get_society_ids(self):
+        return accessible_society_ids(self.request)  # type: ignore
+
+    def scope_to_societies(self, queryset):
+        return queryset.filter(**{f'{self.society_path}_id__in': self.get_society_ids()})
+
+    def get_queryset(self):
+        queryset = super().get_queryset()  # type: ignore
+        if self.request.user.role in self.society_roles:  # type: ignore
+            return self.scope_to_societies(queryset)
+        return queryset.none()
+
+
+class ExportMixin:
+    """
+    Adds a streaming ``GET <list>/export/?format=csv|ndjson`` action.
+
+    The export covers the same rows as the list (``get_queryset`` plus the filter
+    backends) but reads the ``export_columns`` projection directly instead of going
+    through the serializer; see ``exports.py``.
+    """
+    export_columns = ()
+    export_name = 'export'
+    export_ordering = ('pk',)
+
+    def get_export_queryset(self):
+        queryset = self.get_queryset()  # type: ignore
+        for backend in list(self.filter_backends):  # type: ignore
+            queryset = backend().filter_queryset(self.request, queryset, self)  # type: ignore
+        return queryset.order_by(*self.export_ordering)
+
+    @action(detail=False, methods=['get'], renderer_classes=[exports.CSVRenderer, exports.NDJSONRenderer])
+    def export(self, request):
+        """Stream the filtered rows as CSV or newline-delimited JSON"""
+        return exports.streaming_response(
+            self.get_export_queryset(), self.export_columns, request.accepted_renderer.format, self.export_name
+        )
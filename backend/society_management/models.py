@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 import random
 import string
 from datetime import timedelta
@@ -40,7 +41,19 @@ class CustomUserManager(UserManager):
         return self.create_user(username=phone_number, email=email, password=password, **extra_fields)
 
 
-class User(AbstractUser):
+
+class LoadedRowMixin:
+    """Keeps the row an instance was loaded from, so saves can tell what changed (see counters.py)"""
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Only references are kept here; the row is read on save
+        instance._loaded_row = (field_names, values)
+        return instance
+
+
+class User(LoadedRowMixin, AbstractUser):
     """Stores all users of the platform (Admins, Sub-Admins, Members, Staff)"""
     
     ROLE_CHOICES = [
@@ -75,6 +88,8 @@ class User(AbstractUser):
     approved_by = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='approved_users')
     approval_date = models.DateTimeField(null=True, blank=True)
     last_login_ip = models.GenericIPAddressField(null=True, blank=True)
+    # Bumped when the role, society or access of the user changes, making issued tokens stale
+    token_version = models.PositiveIntegerField(default=0)  # type: ignore
     
     # Override username to make it optional
     username = models.CharField(max_length=150, unique=True, null=True, blank=True)
@@ -87,23 +102,48 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.phone_number})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_claims = instance._versioned_values()
+        return instance
+    
+    def _versioned_values(self):
+        from .token_auth import VERSIONED_FIELDS
+        # Read __dict__ so deferred fields are not loaded
+        return {name: self.__dict__[name] for name in VERSIONED_FIELDS if name in self.__dict__}
+    
+    def refresh_from_db(self, using=None, fields=None):
+        # A user built from token claims loads all of its remaining fields at once
+        if fields is not None and getattr(self, '_from_claims', False):
+            fields = list(self.get_deferred_fields() | set(fields))
+        super().refresh_from_db(using, fields)
+    
     def save(self, *args, **kwargs):
         if not self.username:
             self.username = self.phone_number
+        loaded = getattr(self, '_loaded_claims', None)
+        update_fields = kwargs.get('update_fields')
+        changed = not self._state.adding and loaded is not None and any(
+            value != loaded[name] for name, value in self._versioned_values().items()
+            if name in loaded and (update_fields is None or name in update_fields
+                                   or name.removesuffix('_id') in update_fields)
+        )
+        # set_password() keeps the raw password until the save that stores its hash
+        changed = changed or not self._state.adding and self._password is not None and (
+            update_fields is None or 'password' in update_fields
+        )
         super().save(*args, **kwargs)
+        self._loaded_claims = self._versioned_values()
+        if changed:
+            from .token_auth import bump_token_versions
+            bump_token_versions([self.pk])
+            self.refresh_from_db(fields=['token_version'])
     
-    def has_permission(self, permission_code, society=None):
-        """Check if user has a specific permission"""
-        try:
-            permission = Permission.objects.get(code=permission_code)  # type: ignore
-            role_permission = RolePermission.objects.filter(  # type: ignore
-                role=self.role,
-                permission=permission,
-                society=society or self.society
-            ).first()
-            return role_permission is not None
-        except Permission.DoesNotExist:  # type: ignore
-            return False
+    def has_permission(self, permission_code, society=None, action='read'):
+        """Check if user has a specific permission (create/read/update/delete)"""
+        from .permission_matrix import has_capability
+        return has_capability(self.role, society or self.society_id, permission_code, action)
 
 
 class OTP(models.Model):
@@ -129,14 +169,20 @@ class OTP(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Superseding and verifying only ever look at codes still in play
+            models.Index(fields=['phone_number', 'purpose'], name='otp_active_idx',
+                         condition=models.Q(is_used=False, is_expired=False)),
+            models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ]
     
     def __str__(self):
         return f"OTP {self.otp_code} for {self.phone_number} ({self.purpose})"
     
     def save(self, *args, **kwargs):
-        # Set expiry time if not set (default 10 minutes)
+        # Set expiry time if not set (OTP_TTL_SECONDS, 10 minutes by default)
         if not self.expires_at:
-            self.expires_at = timezone.now() + timedelta(minutes=10)
+            self.expires_at = timezone.now() + timedelta(seconds=getattr(settings, 'OTP_TTL_SECONDS', 600))
         
         # Generate OTP if not set
         if not self.otp_code:
@@ -161,12 +207,12 @@ class OTP(models.Model):
         """Mark OTP as used"""
         self.is_used = True
         self.verified_at = timezone.now()
-        self.save()
+        self.save(update_fields=['is_used', 'verified_at'])
     
     def mark_as_expired(self):
         """Mark OTP as expired"""
         self.is_expired = True
-        self.save()
+        self.save(update_fields=['is_expired'])
     
     @classmethod
     def create_otp(cls, phone_number, purpose, user=None, email=None):
@@ -191,24 +237,10 @@ class OTP(models.Model):
     
     @classmethod
     def verify_otp(cls, phone_number, otp_code, purpose):
-        """Verify OTP and return the OTP instance if valid"""
-        try:
-            otp = cls.objects.get(  # type: ignore
-                phone_number=phone_number,
-                otp_code=otp_code,
-                purpose=purpose,
-                is_used=False,
-                is_expired=False
-            )
-            
-            if otp.is_valid():
-                otp.mark_as_used()
-                return otp
-            else:
-                otp.mark_as_expired()
-                return None
-        except cls.DoesNotExist:  # type: ignore
-            return None
+        """Consume a valid OTP in one UPDATE; returns the verified code or None"""
+        from .otp_store import DatabaseOTPStore
+
+        return DatabaseOTPStore().verify(phone_number, otp_code, purpose)
 
 
 class AdminSociety(models.Model):
@@ -247,6 +279,9 @@ class SubAdminInvitation(models.Model):
     
     class Meta:
         unique_together = ['society', 'phone_number']
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='subadmininv_status_exp_idx'),
+        ]
     
     def __str__(self):
         return f"Invitation for {self.phone_number} to {self.society.name}"
@@ -288,7 +323,7 @@ class Society(models.Model):
         return str(self.name)
 
 
-class Flat(models.Model):
+class Flat(LoadedRowMixin, models.Model):
     """Represents an individual unit (flat/apartment) within a society"""
     society = models.ForeignKey(Society, on_delete=models.CASCADE, related_name='flats')
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='owned_flats')
@@ -325,7 +360,7 @@ class Vehicle(models.Model):
         return f"{self.vehicle_number} ({self.owner.first_name})"  # type: ignore
 
 
-class MaintenanceBill(models.Model):
+class MaintenanceBill(LoadedRowMixin, models.Model):
     """Records individual monthly maintenance bills for each flat"""
     
     STATUS_CHOICES = [
@@ -341,6 +376,7 @@ class MaintenanceBill(models.Model):
     
     flat = models.ForeignKey(Flat, on_delete=models.CASCADE, related_name='maintenance_bills')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    late_fee = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     due_date = models.DateField()
     billing_period_start = models.DateField()
     billing_period_end = models.DateField()
@@ -350,6 +386,11 @@ class MaintenanceBill(models.Model):
     paid_date = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['flat', 'billing_period_start'], name='unique_maintenance_bill_period'),
+        ]
+    
     def __str__(self):
         return f"{self.flat} - {self.billing_period_start} to {self.billing_period_end}"
 
@@ -366,17 +407,10 @@ class CommonExpense(models.Model):
     def __str__(self):
         return f"{self.society.name} - {self.title}"
     
-    def split_expense(self):
-        """Split the expense among all flats in the society"""
-        flats = self.society.flats.all()  # type: ignore
-        if flats.exists():
-            amount_per_flat = self.total_amount / flats.count()
-            for flat in flats:
-                CommonExpenseSplit.objects.get_or_create(  # type: ignore
-                    common_expense=self,
-                    flat=flat,
-                    defaults={'amount_due': amount_per_flat}
-                )
+    def split_expense(self, mode='EQUAL', type_weights=None):
+        """Split the expense among the society's flats (see splitting.py for modes)"""
+        from .splitting import split_common_expense
+        return split_common_expense(self, mode, type_weights)
 
 
 class CommonExpenseSplit(models.Model):
@@ -408,6 +442,13 @@ class Notice(models.Model):
     society = models.ForeignKey(Society, on_delete=models.CASCADE, null=True, blank=True, related_name='notices', help_text="Null for global notices")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination walks (created_at, id) within a society
+            models.Index(fields=['society', 'created_at', 'id'], name='notice_society_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='notice_created_idx'),
+        ]
+    
     def __str__(self) -> str:
         return str(self.title)
 
@@ -463,11 +504,16 @@ class VisitorLog(models.Model):
     pass_code = models.CharField(max_length=10, unique=True, help_text="for pinless entry")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='visitorlog_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.name} visiting {self.flat_to_visit}"
 
 
-class Complaint(models.Model):
+class Complaint(LoadedRowMixin, models.Model):
     """For raising and tracking service requests or complaints"""
     
     STATUS_CHOICES = [
@@ -483,9 +529,26 @@ class Complaint(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='OPEN')
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_complaints', help_text="Staff member")
     created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='complaint_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.raised_by.first_name}"  # type: ignore
+    
+    def save(self, *args, **kwargs):
+        # Stamp resolution time for the daily analytics rollup
+        if self.status == 'RESOLVED' and self.resolved_at is None:
+            self.resolved_at = timezone.now()
+        elif self.status != 'RESOLVED':
+            self.resolved_at = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'resolved_at'}
+        super().save(*args, **kwargs)
 
 
 class MarketplaceListing(models.Model):
@@ -570,6 +633,11 @@ class ChairmanInvitation(models.Model):
     expires_at = models.DateTimeField()
     accepted_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='chairmaninv_status_exp_idx'),
+        ]
+    
     def __str__(self):
         return f"Chairman invitation for {self.first_name} {self.last_name} - {self.society.name}"
 
@@ -783,6 +851,9 @@ class BulkUserOperation(models.Model):
     failed_records = models.IntegerField(default=0)  # type: ignore
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     error_log = models.TextField(blank=True)
+    parameters = models.JSONField(default=dict, blank=True, help_text='Users selected and options of the operation')
+    checkpoint = models.JSONField(default=dict, blank=True, help_text='Progress of a background operation, for resuming')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text='Last progress of the worker running it')
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
@@ -950,6 +1021,11 @@ class MemberInvitation(models.Model):
     expires_at = models.DateTimeField()
     accepted_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='memberinv_status_exp_idx'),
+        ]
+    
     def __str__(self):
         return f"Invitation for {self.first_name} {self.last_name} to {self.society.name}"
     
@@ -994,6 +1070,11 @@ class StaffInvitation(models.Model):
     expires_at = models.DateTimeField()
     accepted_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='staffinv_status_exp_idx'),
+        ]
+    
     def __str__(self):
         return f"Staff invitation for {self.first_name} {self.last_name} - {self.designation}"
     
@@ -1159,21 +1240,54 @@ class EnhancedBill(models.Model):
     payment_mode = models.CharField(max_length=20, choices=PAYMENT_MODE_CHOICES, null=True, blank=True)
     transaction_id = models.CharField(max_length=255, null=True, blank=True)
     paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    outstanding_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     paid_date = models.DateTimeField(null=True, blank=True)
     paid_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='paid_bills')
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_recurring', 'next_due_date'], name='enhancedbill_recurring_due_idx'),
+        ]
+        constraints = [
+            # One generated occurrence per recurring template and due date
+            models.UniqueConstraint(
+                fields=['parent_bill', 'due_date'], condition=models.Q(parent_bill__isnull=False),
+                name='unique_recurring_bill_occurrence'
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.bill_number} - {self.title}"
     
+    @staticmethod
+    def bill_number_prefix(society):
+        return society.name[:3].upper()
+    
+    @classmethod
+    def allocate_bill_numbers(cls, society, count=1):
+        """Reserve the next bill numbers for a society, e.g. for bulk_create"""
+        return cls.allocate_prefixed_bill_numbers(cls.bill_number_prefix(society), count)
+    
+    @classmethod
+    def allocate_prefixed_bill_numbers(cls, prefix, count=1):
+        """Reserve the next bill numbers of a prefix"""
+        from .sequences import allocate, last_number
+        # Bill numbers are unique across societies, so societies sharing a name
+        # prefix draw from one counter
+        numbers = allocate(f'BILL:{prefix}', count=count, seed=lambda: last_number(
+            cls.objects.filter(bill_number__startswith=prefix).values_list('bill_number', flat=True),  # type: ignore
+            prefix
+        ))
+        return [f"{prefix}{number:06d}" for number in numbers]
+    
     def save(self, *args, **kwargs):
         if not self.bill_number:
             # Generate unique bill number
-            prefix = self.society.name[:3].upper()
-            count = EnhancedBill.objects.filter(society=self.society).count() + 1  # type: ignore
-            self.bill_number = f"{prefix}{count:06d}"
+            self.bill_number = self.allocate_bill_numbers(self.society)[0]
         
         # Calculate total amount
         self.total_amount = self.amount + self.tax_amount + self.late_fee  # type: ignore
+        self.outstanding_amount = self.total_amount - self.paid_amount  # type: ignore
         
         super().save(*args, **kwargs)
 
@@ -1201,6 +1315,40 @@ class BillDistribution(models.Model):
     
     def __str__(self):
         return f"{self.bill.title} - {self.flat}"  # type: ignore
+    
+    def record_payment(self, amount, payment_mode=None, transaction_id=None):
+        """Apply a payment to this share and roll it into the bill's paid/outstanding totals"""
+        try:
+            amount = Decimal(str(amount))
+        except InvalidOperation:
+            raise ValueError('Payment amount must be a number')
+        if not amount.is_finite() or amount <= 0:
+            raise ValueError('Payment amount must be positive')
+        
+        now = timezone.now()
+        with transaction.atomic():
+            share = BillDistribution.objects.select_for_update().get(pk=self.pk)  # type: ignore
+            if amount > share.allocated_amount - share.paid_amount:
+                raise ValueError('Payment exceeds the outstanding share')
+            
+            share.paid_amount += amount
+            if share.paid_amount >= share.allocated_amount:
+                share.status = 'PAID'
+            share.paid_date = now
+            share.payment_mode = payment_mode or share.payment_mode
+            share.transaction_id = transaction_id or share.transaction_id
+            share.save(update_fields=['paid_amount', 'status', 'paid_date', 'payment_mode', 'transaction_id'])
+            
+            # Incremental update, so payments on other shares of the bill never overwrite each other
+            bills = EnhancedBill.objects.filter(pk=self.bill_id)  # type: ignore
+            bills.update(
+                paid_amount=models.F('paid_amount') + amount,
+                outstanding_amount=models.F('outstanding_amount') - amount,
+            )
+            bills.filter(outstanding_amount__lte=0).exclude(status='PAID').update(status='PAID', paid_date=now)
+        
+        for field in ('paid_amount', 'status', 'paid_date', 'payment_mode', 'transaction_id'):
+            setattr(self, field, getattr(share, field))
 
 
 # Security and Gate Management
@@ -1245,15 +1393,30 @@ class VisitorPass(models.Model):
     gate_entry_staff = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='checked_in_visitors')
     gate_exit_staff = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='checked_out_visitors')
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['society', 'created_at', 'id'], name='visitorpass_society_ts_idx'),
+            models.Index(fields=['status', 'expected_entry_time'], name='visitorpass_status_entry_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.pass_number} - {self.visitor_name}"
     
+    @classmethod
+    def allocate_pass_numbers(cls, count=1):
+        """Reserve the next pass numbers of the day, e.g. for bulk_create"""
+        from .sequences import allocate, last_number
+        prefix = f"VP{timezone.now().strftime('%Y%m%d')}"
+        numbers = allocate('VISITOR_PASS', period=prefix[2:], count=count, seed=lambda: last_number(
+            cls.objects.filter(pass_number__startswith=prefix).values_list('pass_number', flat=True),  # type: ignore
+            prefix
+        ))
+        return [f"{prefix}{number:04d}" for number in numbers]
+    
     def save(self, *args, **kwargs):
         if not self.pass_number:
             # Generate unique pass number
-            date_part = timezone.now().strftime('%Y%m%d')
-            count = VisitorPass.objects.filter(created_at__date=timezone.now().date()).count() + 1  # type: ignore
-            self.pass_number = f"VP{date_part}{count:04d}"
+            self.pass_number = self.allocate_pass_numbers()[0]
         super().save(*args, **kwargs)
 
 
@@ -1305,6 +1468,10 @@ class GateUpdateLog(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp'], name='gateupdatelog_timestamp_idx'),
+            models.Index(fields=['society', 'timestamp', 'id'], name='gateupdatelog_society_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.update_type} - {self.person_name or 'Unknown'} at {self.timestamp}"
@@ -1347,3 +1514,237 @@ class DirectoryEntry(models.Model):
         owned_flats = EnhancedFlat.objects.filter(owner=self.user).values_list('flat_number', flat=True)  # type: ignore
         rented_flats = EnhancedFlat.objects.filter(tenant=self.user).values_list('flat_number', flat=True)  # type: ignore
         return list(set(list(owned_flats) + list(rented_flats)))
+
+
+# Document Numbering
+class DocumentSequence(models.Model):
+    """Last number handed out for a document series, per society and period"""
+    
+    society = models.ForeignKey(Society, on_delete=models.CASCADE, null=True, blank=True, related_name='document_sequences')
+    series = models.CharField(max_length=50, help_text='e.g., "BILL", "VISITOR_PASS"')
+    period = models.CharField(max_length=20, blank=True, default='', help_text='e.g., "20250131" for daily series')
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['society', 'series', 'period'], name='unique_document_sequence'),
+            models.UniqueConstraint(
+                fields=['series', 'period'], condition=models.Q(society__isnull=True),
+                name='unique_global_document_sequence'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.series}/{self.period or '-'} @ {self.last_value}"
+
+
+# Flat Ledger
+class LedgerEntry(models.Model):
+    """Append-only record of every amount charged to or paid by a flat"""
+    
+    ENTRY_TYPES = [
+        ('CHARGE', 'Charge'),
+        ('PAYMENT', 'Payment'),
+        ('LATE_FEE', 'Late Fee'),
+        ('ADJUSTMENT', 'Adjustment'),
+    ]
+    
+    SOURCE_TYPES = [
+        ('MAINTENANCE_BILL', 'Maintenance Bill'),
+        ('EXPENSE_SPLIT', 'Common Expense Split'),
+        ('BILL_DISTRIBUTION', 'Bill Distribution'),
+        ('MANUAL', 'Manual'),
+    ]
+    
+    flat = models.ForeignKey(Flat, on_delete=models.CASCADE, related_name='ledger_entries')
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, help_text='Positive increases dues, negative reduces them')
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    source_type = models.CharField(max_length=20, choices=SOURCE_TYPES, default='MANUAL')
+    source_id = models.PositiveBigIntegerField(null=True, blank=True)
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['flat', 'created_at', 'id'], name='ledgerentry_flat_created_idx'),
+            models.Index(fields=['source_type', 'source_id'], name='ledgerentry_source_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.flat} - {self.entry_type} {self.amount}"
+
+
+class FlatBalance(models.Model):
+    """Running totals of a flat's ledger, updated with every entry"""
+    
+    flat = models.OneToOneField(Flat, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_charged = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_entry_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.flat} - {self.balance}"
+
+
+class SocietyCounters(models.Model):
+    """Dashboard counters of a society, kept current by the handlers in signals.py"""
+    
+    society = models.OneToOneField(Society, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+    users = models.IntegerField(default=0)  # type: ignore
+    members = models.IntegerField(default=0)  # type: ignore
+    staff = models.IntegerField(default=0)  # type: ignore
+    flats = models.IntegerField(default=0)  # type: ignore
+    complaints = models.IntegerField(default=0)  # type: ignore
+    open_complaints = models.IntegerField(default=0)  # type: ignore
+    pending_bills = models.IntegerField(default=0, help_text='Maintenance bills not yet paid')  # type: ignore
+    refreshed_at = models.DateTimeField(default=timezone.now, help_text='Last full recount')
+    
+    def __str__(self):
+        return f"{self.society} counters"
+
+
+# Analytics rollups
+class SocietyDailyStats(models.Model):
+    """Billing and complaint facts of one society for one day, written by analytics.py"""
+    
+    society = models.ForeignKey(Society, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    bills_raised = models.IntegerField(default=0)  # type: ignore
+    amount_billed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    bills_paid = models.IntegerField(default=0)  # type: ignore
+    amount_collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    bills_overdue = models.IntegerField(default=0, help_text='Bills due this day and not paid by then')  # type: ignore
+    amount_overdue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    complaints_opened = models.IntegerField(default=0)  # type: ignore
+    complaints_resolved = models.IntegerField(default=0)  # type: ignore
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['society', 'date'], name='unique_society_daily_stats'),
+        ]
+    
+    def __str__(self):
+        return f"{self.society} - {self.date}"
+
+
+class GateDailyStats(models.Model):
+    """Gate traffic of one society gate for one day"""
+    
+    society = models.ForeignKey(Society, on_delete=models.CASCADE, related_name='gate_daily_stats')
+    date = models.DateField()
+    gate_number = models.CharField(max_length=10)
+    visitor_entries = models.IntegerField(default=0)  # type: ignore
+    visitor_exits = models.IntegerField(default=0)  # type: ignore
+    vehicle_entries = models.IntegerField(default=0)  # type: ignore
+    vehicle_exits = models.IntegerField(default=0)  # type: ignore
+    denied_entries = models.IntegerField(default=0)  # type: ignore
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['society', 'date', 'gate_number'], name='unique_gate_daily_stats'),
+        ]
+    
+    def __str__(self):
+        return f"{self.society} - {self.date} - Gate {self.gate_number}"
+
+
+class AmenityDailyStats(models.Model):
+    """Booking requests made for one amenity on one day"""
+    
+    society = models.ForeignKey(Society, on_delete=models.CASCADE, related_name='amenity_daily_stats')
+    amenity = models.ForeignKey(Amenity, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    bookings = models.IntegerField(default=0)  # type: ignore
+    approved_bookings = models.IntegerField(default=0)  # type: ignore
+    rejected_bookings = models.IntegerField(default=0)  # type: ignore
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['amenity', 'date'], name='unique_amenity_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['society', 'date'], name='amenitydailystats_society_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.amenity} - {self.date}"
+
+
+# Background jobs
+class BackgroundJob(models.Model):
+    """A task call queued for a worker (see jobs.py), with its outcome and timings"""
+    
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    priority = models.PositiveSmallIntegerField(default=5, help_text='0 runs first, 9 last')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    run_at = models.DateTimeField(default=timezone.now, help_text='Not started before this time')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    locked_by = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text='Last sign of progress from the running worker')
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True, help_text='Run time of the last attempt')
+    
+    class Meta:
+        indexes = [
+            # Workers pick the next ready job of their queues with this index alone
+            models.Index(fields=['queue', 'priority', 'run_at'], condition=models.Q(status='QUEUED'),
+                         name='backgroundjob_ready_idx'),
+            models.Index(fields=['status', 'started_at'], name='backgroundjob_status_idx'),
+            models.Index(fields=['status', 'finished_at'], name='backgroundjob_finished_idx'),
+            models.Index(fields=['task', 'created_at'], name='backgroundjob_task_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class ScheduledJob(models.Model):
+    """When a TASK_SCHEDULE entry is next due; shared by every scheduler so each run is queued once"""
+    
+    name = models.CharField(max_length=100, unique=True)
+    task = models.CharField(max_length=100)
+    interval_seconds = models.PositiveIntegerField()
+    next_run_at = models.DateTimeField()
+    last_enqueued_at = models.DateTimeField(null=True, blank=True)
+    last_job = models.ForeignKey(BackgroundJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    
+    def __str__(self):
+        return f"{self.name} every {self.interval_seconds}s"
+
+
+class RevokedToken(models.Model):
+    """A refresh token that was rotated or logged out (see ``revocation.py``)"""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='revokedtoken_expires_idx'),
+            models.Index(fields=['revoked_at'], name='revokedtoken_revoked_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Revoked token {self.jti}"
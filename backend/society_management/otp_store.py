@@ -0,0 +1,134 @@
+"""
+Where one-time passwords live between being sent and being verified.
+
+``OTP_BACKEND`` picks the store for a deployment:
+
+* ``database`` keeps an ``OTP`` row per code. Issuing supersedes the active code of the
+  phone number and purpose with one UPDATE over the partial ``otp_active_idx`` index,
+  then inserts the new row. Verifying is a single conditional UPDATE that consumes a
+  matching, unused and unexpired code, so two concurrent verifications of the same
+  code cannot both succeed.
+* ``cache`` keeps codes in the ``OTP_CACHE_ALIAS`` Django cache (use a shared cache
+  such as Redis when several processes serve requests) and never touches the
+  relational database. A code is stored under a key derived from the phone number,
+  purpose and code, expiring after ``OTP_TTL_SECONDS``; verifying reads and then
+  deletes that key, and only the caller whose delete removed it succeeds. A second key points at the
+  current code of the phone number and purpose so that issuing a new code drops the
+  previous one.
+
+Both stores return objects with ``phone_number``, ``purpose``, ``otp_code``,
+``expires_at`` and ``verified_at`` attributes, which is all the OTP views read.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+
+def ttl_seconds():
+    return getattr(settings, 'OTP_TTL_SECONDS', 600)
+
+
+class OneTimePassword:
+    """A code issued or consumed by a store that does not keep ``OTP`` rows"""
+
+    def __init__(self, phone_number, purpose, otp_code=None, expires_at=None, verified_at=None, email=None):
+        self.phone_number = phone_number
+        self.purpose = purpose
+        self.otp_code = otp_code
+        self.expires_at = expires_at
+        self.verified_at = verified_at
+        self.email = email
+
+    def __repr__(self):
+        return f'<OneTimePassword {self.phone_number} ({self.purpose})>'
+
+
+class DatabaseOTPStore:
+    """Codes as ``OTP`` rows"""
+
+    def issue(self, phone_number, purpose, user=None, email=None):
+        from .models import OTP
+
+        return OTP.create_otp(phone_number, purpose, user=user, email=email)
+
+    def verify(self, phone_number, otp_code, purpose):
+        from .models import OTP
+
+        now = timezone.now()
+        consumed = OTP.objects.filter(  # type: ignore
+            phone_number=phone_number, otp_code=otp_code, purpose=purpose,
+            is_used=False, is_expired=False, expires_at__gte=now,
+        ).update(is_used=True, verified_at=now)
+        if not consumed:
+            return None
+        return OneTimePassword(phone_number, purpose, otp_code=otp_code, verified_at=now)
+
+
+class CacheOTPStore:
+    """Codes as expiring cache keys"""
+
+    def __init__(self, alias=None):
+        self.alias = alias or getattr(settings, 'OTP_CACHE_ALIAS', 'default')
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _key(*parts):
+        # Keeps codes and phone numbers out of key names and within memcached's key rules
+        return 'otp:' + salted_hmac('otp-store', ':'.join(parts)).hexdigest()
+
+    def issue(self, phone_number, purpose, user=None, email=None):
+        from .models import OTP
+
+        ttl = ttl_seconds()
+        otp_code = OTP.generate_otp()
+        code_key = self._key(purpose, phone_number, otp_code)
+        current_key = self._key(purpose, phone_number)
+        previous = self.cache.get(current_key)
+        if previous:
+            self.cache.delete(previous)
+        self.cache.set_many({code_key: 1, current_key: code_key}, ttl)
+        return OneTimePassword(
+            phone_number, purpose, otp_code=otp_code,
+            expires_at=timezone.now() + datetime.timedelta(seconds=ttl), email=email,
+        )
+
+    def verify(self, phone_number, otp_code, purpose):
+        key = self._key(purpose, phone_number, otp_code)
+        # get() honours expiry on every backend (locmem's delete() does not); the delete
+        # still decides which concurrent caller consumes the code
+        if not self.cache.get(key) or not self.cache.delete(key):
+            return None
+        return OneTimePassword(phone_number, purpose, otp_code=otp_code, verified_at=timezone.now())
+
+
+STORES = {
+    'database': DatabaseOTPStore,
+    'cache': CacheOTPStore,
+}
+
+_stores = {}
+
+
+def get_store():
+    name = getattr(settings, 'OTP_BACKEND', 'database')
+    if name not in _stores:
+        if name not in STORES:
+            raise ValueError(f'Unknown OTP_BACKEND "{name}"; expected one of {", ".join(STORES)}')
+        _stores[name] = STORES[name]()
+    return _stores[name]
+
+
+def issue(phone_number, purpose, user=None, email=None):
+    """Issue a new code for ``phone_number`` and ``purpose``, replacing the current one"""
+    return get_store().issue(phone_number, purpose, user=user, email=email)
+
+
+def verify(phone_number, otp_code, purpose):
+    """Consume a valid code; the verified code, or None if it is wrong, used or expired"""
+    return get_store().verify(phone_number, otp_code, purpose)
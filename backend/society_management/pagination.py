@@ -0,0 +1,193 @@
+"""
+Keyset (cursor) pagination for append-heavy tables.
+
+``PageNumberPagination`` counts the whole filtered table and skips ``OFFSET`` rows on
+every page. ``KeysetPagination`` orders by a unique key such as ``(-created_at, -id)``
+and continues from the last row seen with a ``WHERE (created_at, id) < (...)``
+condition, so every page costs an index range scan of ``page_size`` rows however deep
+the client has scrolled, and rows inserted meanwhile never shift a page.
+
+Cursors are opaque URL-safe tokens carrying the boundary row's key and direction.
+Views pick their key with ``keyset_ordering``; the last field must be unique.
+
+``?count=approximate`` adds an ``approximate_count``: the planner's row estimate on
+PostgreSQL, elsewhere an exact count capped at ``APPROXIMATE_COUNT_CAP``. Clients still
+sending ``?page=`` get the old page-number response.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+APPROXIMATE_COUNT_CAP = 10000
+
+
+def approximate_count(queryset):
+    """Cheap estimate of the number of rows in ``queryset``"""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.order_by()[:APPROXIMATE_COUNT_CAP].count()
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on a unique ``(timestamp, id)`` style key"""
+
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.legacy = None
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'k': values, 'r': int(reverse)}, separators=(',', ':'), default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            values, reverse = payload['k'], bool(payload['r'])
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            values = [
+                self.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, KeyError, AttributeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def _order_by(self, reverse):
+        return [
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.fields
+        ]
+
+    def _beyond(self, values, reverse):
+        """Rows strictly after ``values`` in the (possibly reversed) ordering"""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[index]})
+            for earlier, _ in self.fields[:index]:
+                step &= Q(**{earlier: values[self.field_index[earlier]]})
+            condition |= step
+        return condition
+
+    def _key(self, instance):
+        return [getattr(instance, name) for name, _ in self.fields]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('page') and not request.query_params.get(self.cursor_query_param):
+            # Clients written against the page-number API keep working
+            self.legacy = PageNumberPagination()
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.model = queryset.model
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.get_ordering(view)]
+        self.field_index = {name: index for index, (name, _) in enumerate(self.fields)}
+        self.page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+
+        self.approximate_count = None
+        if request.query_params.get(self.count_query_param) == 'approximate':
+            self.approximate_count = approximate_count(queryset)
+
+        page_queryset = queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            page_queryset = page_queryset.filter(self._beyond(values, reverse))
+        rows = list(page_queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_key = self.previous_key = None
+        if rows:
+            if has_more if not reverse else values is not None:
+                self.next_key = self._key(rows[-1])
+            if has_more if reverse else values is not None:
+                self.previous_key = self._key(rows[0])
+        elif values is not None:
+            # Ran off the end; let the client step back to where it was
+            self.next_key, self.previous_key = (values, None) if reverse else (None, values)
+        return rows
+
+    def _link(self, key, reverse):
+        if key is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(key, reverse))
+
+    def get_next_link(self):
+        return self._link(self.next_key, False)
+
+    def get_previous_link(self):
+        return self._link(self.previous_key, True)
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        body = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.approximate_count is not None:
+            body['approximate_count'] = self.approximate_count
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'approximate_count': {'type': 'integer', 'description': 'Only with ?count=approximate'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'Opaque cursor from the next/previous link', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': f'Results per page, at most {self.max_page_size}', 'schema': {'type': 'integer'}},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'description': '"approximate" to include an estimated total', 'schema': {'type': 'string'}},
+        ]
@@ -0,0 +1,153 @@
+"""
+Compiled role/permission matrix.
+
+``Permission`` + ``RolePermission`` rows are compiled into one bitset per permission
+code for each (role, society) pair and kept in process memory. Global rows
+(``society=None``, as seeded by ``populate_permissions``) form the base layer and a
+society-specific row for the same permission replaces it.
+
+Entries are dropped by the post_save/post_delete handlers in ``signals.py`` once the
+change commits. Other processes notice the change through a version counter in the
+shared Django cache, polled at most every ``PERMISSION_MATRIX_CHECK_INTERVAL`` seconds.
+A matrix is also recompiled once it is ``PERMISSION_MATRIX_TTL`` seconds old, so one
+that missed an invalidation is not kept for the life of the process.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+
+CREATE = 1
+READ = 2
+UPDATE = 4
+DELETE = 8
+
+ACTION_BITS = {
+    'create': CREATE,
+    'read': READ,
+    'update': UPDATE,
+    'delete': DELETE,
+}
+
+VERSION_CACHE_KEY = 'society_management:permission_matrix_version'
+
+_matrices = {}
+_lock = threading.Lock()
+_state = {'version': None, 'checked_at': 0.0, 'generation': 0}
+
+
+def _check_interval():
+    return getattr(settings, 'PERMISSION_MATRIX_CHECK_INTERVAL', 5)
+
+
+def _ttl():
+    return getattr(settings, 'PERMISSION_MATRIX_TTL', 300)
+
+
+def _sync_version():
+    """Drop the local matrices when another process bumped the shared version"""
+    now = time.monotonic()
+    if now - _state['checked_at'] < _check_interval():
+        return
+    _state['checked_at'] = now
+    version = cache.get(VERSION_CACHE_KEY, 0)
+    if version != _state['version']:
+        with _lock:
+            _matrices.clear()
+            _state['version'] = version
+            _state['generation'] += 1
+
+
+def _society_id(society):
+    if society is None or isinstance(society, int):
+        return society
+    return society.pk
+
+
+def _compile(role, society_id):
+    from .models import RolePermission
+
+    scope = Q(society__isnull=True)
+    if society_id is not None:
+        scope |= Q(society_id=society_id)
+
+    rows = RolePermission.objects.filter(  # type: ignore
+        scope, role=role, permission__is_active=True
+    ).values_list('society_id', 'permission__code', 'can_create', 'can_read', 'can_update', 'can_delete')
+
+    global_bits, society_bits = {}, {}
+    for row_society_id, code, can_create, can_read, can_update, can_delete in rows:
+        bits = (
+            (CREATE if can_create else 0) |
+            (READ if can_read else 0) |
+            (UPDATE if can_update else 0) |
+            (DELETE if can_delete else 0)
+        )
+        if row_society_id is None:
+            global_bits[code] = bits
+        else:
+            society_bits[code] = bits
+
+    global_bits.update(society_bits)
+    return global_bits
+
+
+def get_matrix(role, society=None):
+    """Permission code -> action bitset for a role within a society (or globally)"""
+    _sync_version()
+    key = (role, _society_id(society))
+    now = time.monotonic()
+    entry = _matrices.get(key)
+    if entry is not None and now - entry[1] < _ttl():
+        return entry[0]
+    generation = _state['generation']
+    matrix = _compile(*key)
+    with _lock:
+        # Not cached if an invalidation ran while compiling, as the rows read may predate it
+        if generation == _state['generation']:
+            _matrices[key] = (matrix, now)
+    return matrix
+
+
+def has_capability(role, society, permission_code, action='read'):
+    """Check one action of one permission for a role"""
+    bit = ACTION_BITS.get(action)
+    if bit is None:
+        raise ValueError(f'Unknown permission action: {action}')
+    return bool(get_matrix(role, society).get(permission_code, 0) & bit)
+
+
+def resolve_capabilities(role, society=None):
+    """The whole resolved matrix as plain booleans, for API responses"""
+    return {
+        code: {action: bool(bits & bit) for action, bit in ACTION_BITS.items()}
+        for code, bits in sorted(get_matrix(role, society).items())
+    }
+
+
+def invalidate(role=None, society=None):
+    """
+    Forget compiled matrices.
+
+    With a role, only that role's entries for the society are dropped; a global
+    (``society=None``) change drops the role's entries for every society.
+    """
+    society_id = _society_id(society)
+    with _lock:
+        _state['generation'] += 1
+        if role is None:
+            _matrices.clear()
+        else:
+            for key in list(_matrices):
+                if key[0] == role and (society_id is None or key[1] == society_id):
+                    del _matrices[key]
+
+    try:
+        version = cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        version = 1
+        cache.set(VERSION_CACHE_KEY, version, None)
+    _state['version'] = version
@@ -0,0 +1,169 @@
+"""
+Relation planner - derives select_related/prefetch_related/only() from serializer sources.
+
+The planner walks a serializer's readable fields (including nested serializers) and
+records every relation traversed by their dotted sources, e.g. ``society.name`` or
+``staff_member.user.get_full_name``. Forward and reverse one-to-one hops become
+``select_related`` joins, anything reached through a to-many hop is prefetched.
+
+Method fields cannot be introspected, so serializers may list the relations their
+``SerializerMethodField``s or model ``__str__`` methods touch in ``Meta.related_paths``
+using Django lookup syntax, e.g. ``related_paths = ('flat__society',)``.
+
+Top-level annotated aggregate fields (see ``aggregates.py``) contribute their
+``annotate()`` expressions to the same plan.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+from .aggregates import AnnotatedAggregateField, build_annotations
+
+
+class RelationPlan:
+    """Relations and columns a serializer reads, relative to its model"""
+
+    def __init__(self, model):
+        self.model = model
+        self.select_related = set()
+        self.prefetch_related = set()
+        self.annotations = {}
+        # join path -> model, and join path -> needed columns (None means the whole row)
+        self.models = {'': model}
+        self.columns = {'': None}
+
+    def add_select(self, path, model):
+        self.select_related.add(path)
+        self.models[path] = model
+        self.columns.setdefault(path, set())
+
+    def add_prefetch(self, path):
+        self.prefetch_related.add(path)
+
+    def need_column(self, path, column):
+        if path in self.columns and self.columns[path] is not None:
+            self.columns[path].add(column)
+
+    def need_row(self, path):
+        if path in self.columns:
+            self.columns[path] = None
+
+    def only_fields(self):
+        """Field list for only(), or None when nothing can be deferred"""
+        if all(columns is None for columns in self.columns.values()):
+            return None
+        fields = []
+        for path, model in self.models.items():
+            columns = self.columns[path]
+            if columns is None:
+                names = [f.name for f in model._meta.concrete_fields]
+            else:
+                names = {model._meta.pk.name} | columns
+            prefix = f'{path}__' if path else ''
+            fields.extend(f'{prefix}{name}' for name in sorted(names))
+        return fields
+
+    def apply(self, queryset, restrict_fields=False):
+        if queryset.model is not self.model:
+            return queryset
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        if restrict_fields and queryset.query.deferred_loading == (frozenset(), True):
+            only = self.only_fields()
+            if only:
+                queryset = queryset.only(*only)
+        return queryset
+
+
+def _walk(plan, model, attrs, prefix, to_many, leaf_is_row=False):
+    """
+    Follow attribute names from model, recording the relations they traverse.
+
+    Returns the model and join path reached by the last relation hop, plus whether a
+    to-many hop was crossed on the way.
+    """
+    path = prefix
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # A method or property: it may read anything on the row
+            plan.need_row(path)
+            return model, path, to_many
+        if not field.is_relation:
+            plan.need_column(path, field.name)
+            return model, path, to_many
+
+        lookup = f'{path}__{attr}' if path else attr
+        related_model = field.related_model
+        if field.many_to_many or field.one_to_many or to_many:
+            to_many = True
+            plan.add_prefetch(lookup)
+        else:
+            if field.concrete:
+                plan.need_column(path, field.name)
+            plan.add_select(lookup, related_model)
+            if not field.concrete:
+                # Reverse one-to-one: keep the joined row whole so its link column loads
+                plan.need_row(lookup)
+        model, path = related_model, lookup
+
+    if leaf_is_row:
+        plan.need_row(path)
+    return model, path, to_many
+
+
+def _plan_serializer(plan, serializer, model, prefix, to_many):
+    meta = getattr(serializer, 'Meta', None)
+    for related_path in getattr(meta, 'related_paths', ()):
+        _walk(plan, model, related_path.split('__'), prefix, to_many, leaf_is_row=True)
+
+    aggregates = {}
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, AnnotatedAggregateField):
+            aggregates[name] = field
+            continue
+        if field.source == '*' and not isinstance(field, serializers.BaseSerializer):
+            continue
+        attrs = field.source_attrs
+
+        if isinstance(field, serializers.ListSerializer):
+            child_model, child_path, _ = _walk(plan, model, attrs, prefix, to_many)
+            _plan_serializer(plan, field.child, child_model, child_path, True)
+        elif isinstance(field, serializers.BaseSerializer):
+            child_model, child_path, child_many = _walk(plan, model, attrs, prefix, to_many)
+            _plan_serializer(plan, field, child_model, child_path, child_many)
+        elif isinstance(field, serializers.ManyRelatedField):
+            _walk(plan, model, attrs, prefix, to_many)
+        elif isinstance(field, serializers.RelatedField):
+            if field.use_pk_only_optimization():
+                # The primary key is read from the FK column without loading the target row
+                target_model, target_path, _ = _walk(plan, model, attrs[:-1], prefix, to_many)
+                plan.need_column(target_path, attrs[-1])
+            else:
+                _walk(plan, model, attrs, prefix, to_many, leaf_is_row=True)
+        else:
+            _walk(plan, model, attrs, prefix, to_many)
+
+    if aggregates and not prefix:
+        # Nested serializers fall back to per-object aggregate queries
+        plan.annotations = build_annotations(aggregates)
+
+
+@lru_cache(maxsize=None)
+def plan_for_serializer(serializer_class, extra_paths=()):
+    """Build (and memoise) the relation plan for a ModelSerializer class"""
+    model = serializer_class.Meta.model
+    plan = RelationPlan(model)
+    serializer = serializer_class()
+    _plan_serializer(plan, serializer, model, '', False)
+    for related_path in extra_paths:
+        _walk(plan, model, related_path.split('__'), '', False, leaf_is_row=True)
+    return plan
@@ -0,0 +1,551 @@
+"""
+Bank / UPI statement reconciliation.
+
+``reconcile_statement`` reads a statement CSV one row at a time and matches every
+credit against the society's open (PENDING or OVERDUE) bills:
+
+1. by transaction id (UTR / reference number) already recorded on a MaintenanceBill,
+   EnhancedBill or BillDistribution, e.g. entered by the member who reported paying;
+2. by a bill number or flat reference (``A-101``, ``A101``, ``Block A 101``) found in
+   the narration, together with an amount equal to what that bill still owes. When a
+   flat has several bills of that amount the one due first is paid.
+
+Open bills, and the transaction ids already on paid bills, are loaded once, one query
+per bill table, into in-memory hash indexes, so each row costs a few dict lookups and
+memory is bounded by the society's bills rather than the length of the statement.
+Credits whose normalized transaction id is already on a paid bill are skipped, so
+re-importing a statement never pays a bill twice. Rows are processed in chunks; each
+chunk's matches are applied in one transaction with a few set-based updates per bill
+table, posting the ledger payments alongside. Rows that match nothing are written to
+the unmatched report as each chunk completes.
+
+Only credits are matched: a statement needs a credit column, or a plain amount column
+together with a Dr/Cr indicator column.
+"""
+import csv
+import datetime
+import itertools
+import re
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, CharField, DateTimeField, Exists, F, OuterRef, Value, When
+from django.utils import timezone
+
+from . import counters, ledger
+
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Unmatched lines returned inline with an import's summary; the full report is a CSV download
+UNMATCHED_PREVIEW_ROWS = 100
+
+OPEN_STATUSES = ('PENDING', 'OVERDUE')
+
+MAINTENANCE_BILL = 'MAINTENANCE_BILL'
+ENHANCED_BILL = 'ENHANCED_BILL'
+BILL_DISTRIBUTION = 'BILL_DISTRIBUTION'
+
+MATCH_TRANSACTION_ID = 'transaction_id'
+MATCH_REFERENCE = 'reference'
+
+# Header names as bank exports spell them, compared on lowercase alphanumerics only
+TRANSACTION_COLUMNS = ('transactionid', 'txnid', 'utr', 'utrno', 'utrnumber', 'reference', 'referenceno',
+                       'refno', 'chqrefno', 'chequerefno')
+CREDIT_COLUMNS = ('credit', 'creditamount', 'creditamt', 'deposit', 'depositamt', 'depositamount', 'cr')
+# A plain amount column holds debits too, so it is only read with a Dr/Cr indicator column
+AMOUNT_COLUMNS = ('amount', 'amt', 'transactionamount', 'txnamount')
+INDICATOR_COLUMNS = ('drcr', 'crdr', 'drcrindicator', 'type', 'transactiontype', 'txntype', 'creditdebit',
+                     'debitcredit')
+CREDIT_INDICATORS = ('CR', 'C', 'CREDIT')
+DATE_COLUMNS = ('date', 'txndate', 'transactiondate', 'valuedate', 'valuedt')
+NARRATION_COLUMNS = ('narration', 'description', 'remarks', 'particulars', 'details')
+DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d-%m-%y', '%d/%m/%y', '%d-%b-%Y', '%d %b %Y', '%d-%b-%y')
+
+# Longest run of narration tokens joined into one reference, e.g. "BLOCK", "A", "101"
+MAX_REFERENCE_TOKENS = 3
+
+# MaintenanceBill only records ONLINE or OFFLINE; a bank or UPI credit is an online payment
+MAINTENANCE_PAYMENT_MODE = 'ONLINE'
+
+
+def normalize_reference(*parts):
+    """Uppercase alphanumerics only, so "A-101", "a 101" and "A101" compare equal"""
+    return re.sub(r'[^A-Z0-9]', '', ''.join(str(part or '') for part in parts).upper())
+
+
+def _money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def parse_amount(value):
+    """Statement amount cell -> Decimal, or None for an empty (debit) cell"""
+    value = re.sub(r'(?i)inr|rs\.?|cr|[,\s₹]', '', value or '')
+    if not value:
+        return None
+    try:
+        return _money(value)
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount "{value}"')
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _find_column(header, aliases):
+    for alias in aliases:
+        if alias in header:
+            return header.index(alias)
+    return None
+
+
+class StatementRow:
+    """One credit line of a statement"""
+
+    __slots__ = ('line_number', 'raw', 'amount', 'transaction_id', 'narration', 'date')
+
+    def __init__(self, line_number, raw, amount, transaction_id, narration, date):
+        self.line_number = line_number
+        self.raw = raw
+        self.amount = amount
+        self.transaction_id = transaction_id
+        self.narration = narration
+        self.date = date
+
+    @property
+    def transaction_key(self):
+        return normalize_reference(self.transaction_id) or None
+
+
+def read_statement(lines):
+    """
+    Yield ``(header, row_or_error)`` for each data line of a statement CSV.
+
+    Columns are found by their usual bank export names. Credits are read from a
+    credit column, or from a plain amount column on lines whose Dr/Cr indicator says
+    credit. The row is a ``StatementRow``, None for a debit line, or a ``(raw, reason)``
+    pair when it cannot be read. A malformed CSV raises ``ValueError``.
+    """
+    reader = csv.reader(lines)
+    try:
+        header = next(reader, None)
+    except csv.Error as e:
+        raise ValueError(f'Line 1: {e}')
+    if header is None:
+        raise ValueError('The statement is empty')
+    columns = [re.sub(r'[^a-z0-9]', '', name.lower()) for name in header]
+    amount_column = _find_column(columns, CREDIT_COLUMNS)
+    indicator_column = None
+    if amount_column is None:
+        amount_column = _find_column(columns, AMOUNT_COLUMNS)
+        indicator_column = _find_column(columns, INDICATOR_COLUMNS)
+        if amount_column is None:
+            raise ValueError('The statement has no credit/amount column')
+        if indicator_column is None:
+            raise ValueError('The statement has an amount column but no Dr/Cr column to tell credits from debits')
+    transaction_column = _find_column(columns, TRANSACTION_COLUMNS)
+    narration_column = _find_column(columns, NARRATION_COLUMNS)
+    date_column = _find_column(columns, DATE_COLUMNS)
+
+    def cell(raw, column):
+        return raw[column].strip() if column is not None and column < len(raw) else ''
+
+    line_number = 1
+    while True:
+        try:
+            raw = next(reader, None)
+        except csv.Error as e:
+            raise ValueError(f'Line {reader.line_num}: {e}')
+        if raw is None:
+            break
+        line_number += 1
+        if not ''.join(raw).strip():
+            continue
+        if indicator_column is not None and normalize_reference(cell(raw, indicator_column)) not in CREDIT_INDICATORS:
+            yield header, None
+            continue
+        try:
+            amount = parse_amount(cell(raw, amount_column))
+        except ValueError as e:
+            yield header, (raw, str(e))
+            continue
+        if amount is None or amount <= 0:
+            yield header, None
+            continue
+        yield header, StatementRow(
+            line_number, raw, amount,
+            cell(raw, transaction_column) or None,
+            cell(raw, narration_column),
+            parse_date(cell(raw, date_column)),
+        )
+
+
+class OpenBill:
+    """An open bill as held in the index"""
+
+    __slots__ = ('kind', 'pk', 'ledger_flat_id', 'amount_due', 'due_date', 'settled')
+
+    def __init__(self, kind, pk, ledger_flat_id, amount_due, due_date):
+        self.kind = kind
+        self.pk = pk
+        self.ledger_flat_id = ledger_flat_id
+        self.amount_due = _money(amount_due)
+        self.due_date = due_date
+        self.settled = False
+
+
+class OpenBillIndex:
+    """Hash indexes over a society's open bills: transaction id and (reference, amount)"""
+
+    def __init__(self):
+        self.by_transaction = {}
+        self.by_reference = {}
+        self.size = 0
+
+    def add(self, bill, transaction_id, references):
+        self.size += 1
+        transaction_id = normalize_reference(transaction_id)
+        if transaction_id:
+            self.by_transaction.setdefault(transaction_id, bill)
+        for reference in set(filter(None, references)):
+            self.by_reference.setdefault((reference, bill.amount_due), []).append(bill)
+
+    def finalize(self):
+        for bills in self.by_reference.values():
+            bills.sort(key=lambda bill: (bill.due_date, bill.pk))
+
+    def _by_reference(self, row):
+        tokens = re.findall(r'[A-Z0-9]+', f'{row.narration} {row.transaction_id or ""}'.upper())
+        for start in range(len(tokens)):
+            for length in range(1, MAX_REFERENCE_TOKENS + 1):
+                if start + length > len(tokens):
+                    break
+                candidates = self.by_reference.get((''.join(tokens[start:start + length]), row.amount))
+                for bill in candidates or ():
+                    if not bill.settled:
+                        return bill
+        return None
+
+    def match(self, row):
+        """``(bill, rule)`` for a statement row, or ``(None, reason)``"""
+        if row.transaction_key:
+            bill = self.by_transaction.get(row.transaction_key)
+            if bill is not None:
+                if bill.settled:
+                    return None, 'Duplicate transaction id in statement'
+                if bill.amount_due != row.amount:
+                    return None, f'Amount does not match bill (due {bill.amount_due})'
+                return self.settle(bill, row), MATCH_TRANSACTION_ID
+
+        bill = self._by_reference(row)
+        if bill is None:
+            return None, 'No open bill matches this payment'
+        return self.settle(bill, row), MATCH_REFERENCE
+
+    def settle(self, bill, row):
+        bill.settled = True
+        if row.transaction_key:
+            # Remembered so a repeated row is reported instead of paying another bill
+            self.by_transaction[row.transaction_key] = bill
+        return bill
+
+
+def build_index(society_id):
+    """Load the society's open bills, one query per bill table"""
+    from .models import BillDistribution, EnhancedBill, MaintenanceBill
+
+    index = OpenBillIndex()
+
+    maintenance_bills = MaintenanceBill.objects.filter(  # type: ignore
+        flat__society_id=society_id, status__in=OPEN_STATUSES
+    ).values_list('id', 'flat_id', 'amount', 'late_fee', 'due_date', 'transaction_id',
+                  'flat__block_number', 'flat__flat_number')
+    for pk, flat_id, amount, late_fee, due_date, transaction_id, block, flat_number in maintenance_bills.iterator(chunk_size=2000):
+        bill = OpenBill(MAINTENANCE_BILL, pk, flat_id, amount + late_fee, due_date)
+        index.add(bill, transaction_id, [normalize_reference(block, flat_number)])
+
+    # Bills that were split are paid share by share
+    enhanced_bills = EnhancedBill.objects.filter(  # type: ignore
+        society_id=society_id, status__in=OPEN_STATUSES, outstanding_amount__gt=0
+    ).exclude(
+        Exists(BillDistribution.objects.filter(bill=OuterRef('pk')))  # type: ignore
+    ).values_list('id', 'outstanding_amount', 'due_date', 'transaction_id', 'bill_number')
+    for pk, outstanding, due_date, transaction_id, bill_number in enhanced_bills.iterator(chunk_size=2000):
+        bill = OpenBill(ENHANCED_BILL, pk, None, outstanding, due_date)
+        index.add(bill, transaction_id, [normalize_reference(bill_number)])
+
+    distributions = BillDistribution.objects.filter(  # type: ignore
+        bill__society_id=society_id, status__in=OPEN_STATUSES, allocated_amount__gt=F('paid_amount')
+    ).values_list('id', 'flat__legacy_flat', 'allocated_amount', 'paid_amount', 'bill__due_date',
+                  'transaction_id', 'flat__building__name', 'flat__flat_number',
+                  'flat__legacy_flat__block_number', 'flat__legacy_flat__flat_number')
+    for (pk, ledger_flat_id, allocated, paid, due_date, transaction_id, building, flat_number,
+         block, legacy_flat_number) in distributions.iterator(chunk_size=2000):
+        bill = OpenBill(BILL_DISTRIBUTION, pk, ledger_flat_id, allocated - paid, due_date)
+        references = [normalize_reference(building, flat_number)]
+        if legacy_flat_number:
+            references.append(normalize_reference(block, legacy_flat_number))
+        index.add(bill, transaction_id, references)
+
+    index.finalize()
+    return index
+
+
+def reconciled_transaction_keys(society_id):
+    """
+    Normalized transaction ids already recorded on the society's paid bills, one query
+    per bill table; normalized like statement rows so "UTR 123" and "utr-123" are one id
+    """
+    from .models import BillDistribution, EnhancedBill, MaintenanceBill
+
+    paid = (
+        MaintenanceBill.objects.filter(flat__society_id=society_id),  # type: ignore
+        EnhancedBill.objects.filter(society_id=society_id),  # type: ignore
+        BillDistribution.objects.filter(bill__society_id=society_id),  # type: ignore
+    )
+    keys = set()
+    for queryset in paid:
+        transaction_ids = queryset.filter(status='PAID', transaction_id__isnull=False).values_list(
+            'transaction_id', flat=True
+        )
+        keys.update(normalize_reference(transaction_id) for transaction_id in transaction_ids.iterator(chunk_size=2000))
+    keys.discard('')
+    return keys
+
+
+def _per_row(field, values, output_field):
+    """CASE expression giving each pk its own value, leaving other rows unchanged"""
+    whens = [When(pk=pk, then=Value(value)) for pk, value in values.items() if value is not None]
+    if not whens:
+        return F(field)
+    return Case(*whens, default=F(field), output_field=output_field)
+
+
+class ReconciliationResult:
+    """Outcome of one statement import"""
+
+    def __init__(self, society_id, dry_run=False):
+        self.society_id = society_id
+        self.dry_run = dry_run
+        self.rows = 0
+        self.credits = 0
+        self.matched = {MATCH_TRANSACTION_ID: 0, MATCH_REFERENCE: 0}
+        self.matched_amount = Decimal('0')
+        self.already_reconciled = 0
+        self.unmatched = 0
+        self.unmatched_amount = Decimal('0')
+        self.open_bills = 0
+        self.duration = 0.0
+
+    @property
+    def throughput(self):
+        return self.rows / self.duration if self.duration else 0.0
+
+    def as_dict(self):
+        return {
+            'society': self.society_id,
+            'dry_run': self.dry_run,
+            'rows': self.rows,
+            'credits': self.credits,
+            'open_bills': self.open_bills,
+            'matched': sum(self.matched.values()),
+            'matched_by': dict(self.matched),
+            'matched_amount': str(self.matched_amount),
+            'already_reconciled': self.already_reconciled,
+            'unmatched': self.unmatched,
+            'unmatched_amount': str(self.unmatched_amount),
+            'duration_seconds': round(self.duration, 3),
+            'rows_per_second': round(self.throughput, 1),
+        }
+
+
+class _ChunkApplier:
+    """Applies one chunk of matches with set-based updates"""
+
+    def __init__(self, society_id, payment_mode):
+        self.society_id = society_id
+        self.payment_mode = payment_mode
+        self.now = timezone.now()
+
+    def _paid_at(self, row):
+        if row.date is None:
+            return self.now
+        return timezone.make_aware(datetime.datetime.combine(row.date, datetime.time(12)))
+
+    def _assignments(self, matches):
+        transaction_ids = {bill.pk: row.transaction_id for bill, row in matches}
+        paid_dates = {bill.pk: self._paid_at(row) for bill, row in matches}
+        return {
+            'transaction_id': _per_row('transaction_id', transaction_ids, CharField()),
+            'paid_date': _per_row('paid_date', paid_dates, DateTimeField()),
+        }
+
+    def _payment(self, bill, row):
+        description = f'Bank statement line {row.line_number}'
+        if row.transaction_id:
+            description += f' ({row.transaction_id})'
+        return ledger.entry(bill.ledger_flat_id, ledger.PAYMENT, -bill.amount_due,
+                            bill.kind, bill.pk, description)
+
+    def maintenance_bills(self, matches):
+        from .models import MaintenanceBill
+
+        locked = dict(
+            (pk, _money(amount + late_fee)) for pk, amount, late_fee in
+            MaintenanceBill.objects.select_for_update().filter(  # type: ignore
+                pk__in=[bill.pk for bill, _ in matches], status__in=OPEN_STATUSES
+            ).values_list('pk', 'amount', 'late_fee')
+        )
+        applied = [(bill, row) for bill, row in matches if locked.get(bill.pk) == bill.amount_due]
+        if applied:
+            MaintenanceBill.objects.filter(pk__in=[bill.pk for bill, _ in applied]).update(  # type: ignore
+                status='PAID', payment_mode=MAINTENANCE_PAYMENT_MODE, **self._assignments(applied)
+            )
+            ledger.post([self._payment(bill, row) for bill, row in applied])
+            counters.adjust({self.society_id: {'pending_bills': -len(applied)}})
+        return applied
+
+    def enhanced_bills(self, matches):
+        from .models import EnhancedBill
+
+        locked = dict(
+            EnhancedBill.objects.select_for_update().filter(  # type: ignore
+                pk__in=[bill.pk for bill, _ in matches], status__in=OPEN_STATUSES
+            ).values_list('pk', 'outstanding_amount')
+        )
+        applied = [(bill, row) for bill, row in matches if locked.get(bill.pk) == bill.amount_due]
+        if applied:
+            EnhancedBill.objects.filter(pk__in=[bill.pk for bill, _ in applied]).update(  # type: ignore
+                status='PAID', payment_mode=self.payment_mode, paid_amount=F('total_amount'),
+                outstanding_amount=0, **self._assignments(applied)
+            )
+        return applied
+
+    def bill_distributions(self, matches):
+        from .models import BillDistribution, EnhancedBill
+
+        locked = {
+            pk: (_money(allocated - paid), bill_id) for pk, allocated, paid, bill_id in
+            BillDistribution.objects.select_for_update().filter(  # type: ignore
+                pk__in=[bill.pk for bill, _ in matches], status__in=OPEN_STATUSES
+            ).values_list('pk', 'allocated_amount', 'paid_amount', 'bill_id')
+        }
+        applied = [(bill, row) for bill, row in matches if locked.get(bill.pk, (None,))[0] == bill.amount_due]
+        if not applied:
+            return applied
+
+        BillDistribution.objects.filter(pk__in=[bill.pk for bill, _ in applied]).update(  # type: ignore
+            status='PAID', payment_mode=self.payment_mode, paid_amount=F('allocated_amount'),
+            **self._assignments(applied)
+        )
+        # Roll the shares into their bills, one incremental update per distinct total
+        bill_totals = {}
+        for bill, _ in applied:
+            bill_id = locked[bill.pk][1]
+            bill_totals[bill_id] = bill_totals.get(bill_id, Decimal('0')) + bill.amount_due
+        bills_by_total = {}
+        for bill_id, total in bill_totals.items():
+            bills_by_total.setdefault(total, []).append(bill_id)
+        for total, bill_ids in bills_by_total.items():
+            EnhancedBill.objects.filter(pk__in=bill_ids).update(  # type: ignore
+                paid_amount=F('paid_amount') + total, outstanding_amount=F('outstanding_amount') - total
+            )
+        EnhancedBill.objects.filter(pk__in=list(bill_totals), outstanding_amount__lte=0).exclude(  # type: ignore
+            status='PAID'
+        ).update(status='PAID', paid_date=self.now)
+
+        ledger.post([self._payment(bill, row) for bill, row in applied if bill.ledger_flat_id])
+        return applied
+
+    def apply(self, matches):
+        """Apply ``(bill, row)`` pairs; returns the pairs whose bill changed meanwhile"""
+        by_kind = {}
+        for bill, row in matches:
+            by_kind.setdefault(bill.kind, []).append((bill, row))
+        handlers = {
+            MAINTENANCE_BILL: self.maintenance_bills,
+            ENHANCED_BILL: self.enhanced_bills,
+            BILL_DISTRIBUTION: self.bill_distributions,
+        }
+        stale = []
+        with transaction.atomic():
+            for kind, kind_matches in by_kind.items():
+                applied = {bill.pk for bill, _ in handlers[kind](kind_matches)}
+                stale.extend((bill, row) for bill, row in kind_matches if bill.pk not in applied)
+        return stale
+
+
+def reconcile_statement(society, lines, report=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                        dry_run=False, payment_mode='BANK_TRANSFER'):
+    """
+    Match a statement's credits to the society's open bills and mark them paid.
+
+    ``lines`` is any iterable of CSV text lines (an open file, a decoded upload).
+    Unmatched rows are written to ``report``, a text file, as the original columns
+    plus a ``reason``. With ``dry_run`` nothing is written to the database.
+    """
+    started = time.monotonic()
+    society_id = getattr(society, 'pk', society)
+    result = ReconciliationResult(society_id, dry_run)
+    index = build_index(society_id)
+    result.open_bills = index.size
+    reconciled = reconciled_transaction_keys(society_id)
+    applier = _ChunkApplier(society_id, payment_mode)
+    writer = csv.writer(report) if report is not None else None
+    header_written = False
+
+    def unmatched(header, raw, reason, amount=None):
+        nonlocal header_written
+        result.unmatched += 1
+        result.unmatched_amount += amount or 0
+        if writer is None:
+            return
+        if not header_written:
+            writer.writerow(list(header) + ['reason'])
+            header_written = True
+        writer.writerow(list(raw) + [reason])
+
+    rows = read_statement(lines)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        header = chunk[0][0]
+        result.rows += len(chunk)
+        credits = [row for _, row in chunk if isinstance(row, StatementRow)]
+        result.credits += len(credits)
+        for _, row in chunk:
+            if isinstance(row, tuple):
+                unmatched(header, *row)
+
+        matches = []
+        for row in credits:
+            if row.transaction_key and row.transaction_key in reconciled:
+                result.already_reconciled += 1
+                continue
+            bill, rule = index.match(row)
+            if bill is None:
+                unmatched(header, row.raw, rule, row.amount)
+                continue
+            matches.append((bill, row, rule))
+
+        stale = set()
+        if matches and not dry_run:
+            stale = {id(row) for _, row in applier.apply([(bill, row) for bill, row, _ in matches])}
+        for bill, row, rule in matches:
+            if id(row) in stale:
+                unmatched(header, row.raw, 'Bill was paid or changed during the import', row.amount)
+                continue
+            result.matched[rule] += 1
+            result.matched_amount += row.amount
+
+    result.duration = time.monotonic() - started
+    return result
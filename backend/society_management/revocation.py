@@ -0,0 +1,141 @@
+"""
+Revoked refresh tokens.
+
+A refresh token is revoked by inserting its ``jti`` into ``RevokedToken``, on logout
+and when it is rotated. The insert is the authoritative check: ``jti`` is unique, so a
+token can be rotated once, and a replayed or concurrently reused token fails with
+``TokenError`` however many processes serve requests. Only revoked tokens are stored,
+never every issued one, and ``RevokedToken`` rows are purged once the token has expired
+by the ``revoked_tokens`` lifecycle policy, as an expired token is refused anyway.
+
+Each process keeps Bloom filters of the revoked ``jti``s in front of the table, one per
+``REVOCATION_BUCKET_SECONDS`` of token expiry, so the revocation check of a token
+that was never revoked (nearly every one) costs no query. A filter hit is confirmed
+against the table. Filters catch up with rows revoked by other processes on the first
+check after every ``REVOCATION_SYNC_INTERVAL`` seconds; until then such a token passes
+the check, but rotating it still fails on the insert. A bucket is dropped whole once
+every token in it has expired, so memory follows the tokens that can still be presented.
+"""
+import datetime
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+
+
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives"""
+
+    def __init__(self, bits, hashes):
+        self.size = bits
+        self.hashes = hashes
+        self.bits = bytearray((bits + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing: positions h1 + i*h2 from one 128-bit digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class RevocationStore:
+    def __init__(self, use_filter=True):
+        self.use_filter = use_filter
+        self.bucket_seconds = getattr(settings, 'REVOCATION_BUCKET_SECONDS', 86400)
+        self.filter_bits = getattr(settings, 'REVOCATION_FILTER_BITS', 2 ** 21)
+        self.filter_hashes = getattr(settings, 'REVOCATION_FILTER_HASHES', 7)
+        self.sync_interval = getattr(settings, 'REVOCATION_SYNC_INTERVAL', 5)
+        self._buckets = {}
+        self._synced_through = None
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def _bucket(self, expires):
+        return int(expires) // self.bucket_seconds
+
+    def _add(self, jti, expires):
+        bucket = self._bucket(expires)
+        if bucket not in self._buckets:
+            self._buckets[bucket] = BloomFilter(self.filter_bits, self.filter_hashes)
+        self._buckets[bucket].add(jti)
+
+    def _sync(self):
+        """Add rows revoked since the last sync to the filters and drop expired buckets"""
+        from .models import RevokedToken
+
+        now = time.time()
+        if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+                return
+            current = self._bucket(now)
+            for bucket in [bucket for bucket in self._buckets if bucket < current]:
+                del self._buckets[bucket]
+            started = timezone.now()
+            rows = RevokedToken.objects.filter(expires_at__gte=started)  # type: ignore
+            if self._synced_through is not None:
+                # Overlap the previous sync so rows committed late are not missed
+                rows = rows.filter(revoked_at__gte=self._synced_through - SYNC_OVERLAP)
+            for jti, expires_at in rows.values_list('jti', 'expires_at').iterator(chunk_size=10000):
+                self._add(jti, expires_at.timestamp())
+            self._synced_through = started
+            self._synced_at = now
+
+    def is_revoked(self, jti, expires):
+        from .models import RevokedToken
+
+        if self.use_filter:
+            self._sync()
+            bucket = self._buckets.get(self._bucket(expires))
+            if bucket is None or jti not in bucket:
+                return False
+        return RevokedToken.objects.filter(jti=jti).exists()  # type: ignore
+
+    def revoke(self, jti, expires):
+        """Revoke a token; ``TokenError`` if it already was"""
+        from .models import RevokedToken
+
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(  # type: ignore
+                    jti=jti, expires_at=datetime.datetime.fromtimestamp(expires, tz=datetime.timezone.utc),
+                )
+        except IntegrityError:
+            raise TokenError('Token is blacklisted')
+        if self.use_filter:
+            with self._lock:
+                self._add(jti, expires)
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = RevocationStore()
+    return _store
+
+
+def is_revoked(jti, expires):
+    return get_store().is_revoked(jti, expires)
+
+
+def revoke(jti, expires):
+    return get_store().revoke(jti, expires)
@@ -0,0 +1,55 @@
+"""
+Document number allocation.
+
+Numbers come from a ``DocumentSequence`` counter row per (society, series, period).
+Allocating bumps the row with a single ``UPDATE ... SET last_value = last_value + n``,
+which holds the row lock until the surrounding transaction ends, then reads the new
+value back. Concurrent allocators for the same series queue on that lock instead of
+counting history, so numbers are unique and the cost does not grow with the table.
+
+``count`` reserves a contiguous block in one round trip for bulk creation. When the
+counter row does not exist yet, ``seed`` is called once to return the last number
+already in use, so existing documents are never renumbered over.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def allocate(series, society=None, period='', count=1, seed=None):
+    """Reserve ``count`` consecutive numbers and return them as a range"""
+    from .models import DocumentSequence
+
+    if count < 1:
+        raise ValueError('count must be at least 1')
+    society_id = getattr(society, 'pk', society)
+    lookup = {'society_id': society_id, 'series': series, 'period': period}
+
+    with transaction.atomic():
+        while True:
+            updated = DocumentSequence.objects.filter(**lookup).update(  # type: ignore
+                last_value=F('last_value') + count
+            )
+            if updated:
+                last_value = DocumentSequence.objects.filter(**lookup).values_list(  # type: ignore
+                    'last_value', flat=True
+                ).get()
+                return range(last_value - count + 1, last_value + 1)
+
+            try:
+                with transaction.atomic():
+                    start = seed() if seed else 0
+                    DocumentSequence.objects.create(last_value=start + count, **lookup)  # type: ignore
+                return range(start + 1, start + count + 1)
+            except IntegrityError:
+                # Another allocator created the row first; bump it instead
+                continue
+
+
+def last_number(values, prefix):
+    """Highest numeric suffix among existing document numbers with this prefix"""
+    highest = 0
+    for value in values:
+        suffix = value[len(prefix):]
+        if value.startswith(prefix) and suffix.isdigit():
+            highest = max(highest, int(suffix))
+    return highest
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
@@ -11,8 +13,11 @@ from .models import (
     MemberRegistrationRequest, MemberInvitation, StaffInvitation,
     SocietyProfile, HelpdeskDesignation, HelpdeskContact, BillType,
     EnhancedBill, BillDistribution, VisitorPass, GateUpdateLog,
-    DirectoryEntry
+    DirectoryEntry, LedgerEntry, FlatBalance
 )
+from . import otp_store
+from .aggregates import AnnotatedCountField
+from .splitting import parse_weights_csv
 
 
 # Secure Admin Creation Serializers (Superuser Only)
@@ -203,7 +208,7 @@ class OTPVerificationSerializer(serializers.Serializer):
         purpose = attrs.get('purpose')
         
         # Verify OTP
-        otp = OTP.verify_otp(phone_number, otp_code, purpose)
+        otp = otp_store.verify(phone_number, otp_code, purpose)
         if not otp:
             raise serializers.ValidationError('Invalid or expired OTP')
         
@@ -228,22 +233,6 @@ class PasswordResetSerializer(serializers.Serializer):
         if new_password != confirm_password:
             raise serializers.ValidationError("Passwords don't match")
         
-        # Find a valid OTP (not used and not expired)
-        try:
-            otp = OTP.objects.get(  # type: ignore
-                phone_number=phone_number,
-                otp_code=otp_code,
-                purpose='FORGOT_PASSWORD',
-                is_used=False,
-                is_expired=False
-            )
-            
-            if not otp.is_valid():
-                otp.mark_as_expired()
-                raise serializers.ValidationError('OTP has expired')
-        except OTP.DoesNotExist:  # type: ignore
-            raise serializers.ValidationError('Invalid OTP')
-        
         # Get user
         try:
             user = User.objects.get(phone_number=phone_number)  # type: ignore
@@ -251,6 +240,11 @@ class PasswordResetSerializer(serializers.Serializer):
         except User.DoesNotExist:  # type: ignore
             raise serializers.ValidationError('User not found')
         
+        # Consume the OTP last, so a request rejected above leaves it usable
+        otp = otp_store.verify(phone_number, otp_code, 'FORGOT_PASSWORD')
+        if not otp:
+            raise serializers.ValidationError('Invalid or expired OTP')
+        
         attrs['otp'] = otp
         return attrs
 
@@ -276,7 +270,7 @@ class OTPLoginSerializer(serializers.Serializer):
         otp_code = attrs.get('otp_code')
         
         # Verify OTP
-        otp = OTP.verify_otp(phone_number, otp_code, 'LOGIN')
+        otp = otp_store.verify(phone_number, otp_code, 'LOGIN')
         if not otp:
             raise serializers.ValidationError('Invalid or expired OTP')
         
@@ -380,7 +374,7 @@ class InvitationOTPVerificationSerializer(serializers.Serializer):
             raise serializers.ValidationError('No valid invitation found for this phone number')
         
         # Verify OTP
-        otp = OTP.verify_otp(phone_number, otp_code, 'REGISTRATION')
+        otp = otp_store.verify(phone_number, otp_code, 'REGISTRATION')
         if not otp:
             raise serializers.ValidationError('Invalid or expired OTP')
         
@@ -431,14 +425,11 @@ class CompleteSubAdminRegistrationSerializer(serializers.Serializer):
 # Core Models Serializers
 class SocietySerializer(serializers.ModelSerializer):
     """Serializer for Society model"""
-    flats_count = serializers.SerializerMethodField()
+    flats_count = AnnotatedCountField('flats')
     
     class Meta:
         model = Society
         fields = '__all__'
-    
-    def get_flats_count(self, obj):
-        return obj.flats.count()
 
 
 class FlatSerializer(serializers.ModelSerializer):
@@ -470,22 +461,38 @@ class MaintenanceBillSerializer(serializers.ModelSerializer):
     class Meta:
         model = MaintenanceBill
         fields = '__all__'
+        related_paths = ('flat__society',)
+
+
+class LedgerEntrySerializer(serializers.ModelSerializer):
+    """Serializer for flat ledger entries"""
+    
+    class Meta:
+        model = LedgerEntry
+        fields = '__all__'
+
+
+class FlatBalanceSerializer(serializers.ModelSerializer):
+    """Serializer for a flat's running balance"""
+    flat_details = serializers.CharField(source='flat.__str__', read_only=True)
+    
+    class Meta:
+        model = FlatBalance
+        fields = '__all__'
+        related_paths = ('flat__society',)
 
 
 class CommonExpenseSerializer(serializers.ModelSerializer):
     """Serializer for CommonExpense model"""
     society_name = serializers.CharField(source='society.name', read_only=True)
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
-    splits_count = serializers.SerializerMethodField()
+    splits_count = AnnotatedCountField('splits')
     
     class Meta:
         model = CommonExpense
         fields = '__all__'
         read_only_fields = ('created_by',)
     
-    def get_splits_count(self, obj):
-        return obj.splits.count()
-    
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
@@ -499,6 +506,7 @@ class CommonExpenseSplitSerializer(serializers.ModelSerializer):
     class Meta:
         model = CommonExpenseSplit
         fields = '__all__'
+        related_paths = ('flat__society',)
 
 
 # Community Serializers
@@ -549,6 +557,7 @@ class VisitorLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = VisitorLog
         fields = '__all__'
+        related_paths = ('flat_to_visit__society',)
 
 
 class ComplaintSerializer(serializers.ModelSerializer):
@@ -560,6 +569,7 @@ class ComplaintSerializer(serializers.ModelSerializer):
     class Meta:
         model = Complaint
         fields = '__all__'
+        related_paths = ('flat__society',)
         read_only_fields = ('raised_by',)
     
     def create(self, validated_data):
@@ -630,14 +640,11 @@ class ChairmanInvitationSerializer(serializers.ModelSerializer):
 class StaffCategorySerializer(serializers.ModelSerializer):
     """Serializer for Staff Category"""
     society_name = serializers.CharField(source='society.name', read_only=True)
-    staff_count = serializers.SerializerMethodField()
+    staff_count = AnnotatedCountField('staff_members')
     
     class Meta:
         model = StaffCategory
         fields = '__all__'
-    
-    def get_staff_count(self, obj):
-        return obj.staff_members.count()
 
 
 class StaffMemberSerializer(serializers.ModelSerializer):
@@ -774,19 +781,13 @@ class EnhancedUserProfileSerializer(serializers.ModelSerializer):
 # Building and Flat Management Serializers
 class BuildingSerializer(serializers.ModelSerializer):
     """Serializer for Building model"""
-    total_flats = serializers.SerializerMethodField()
-    available_flats = serializers.SerializerMethodField()
+    total_flats = AnnotatedCountField('flats')
+    available_flats = AnnotatedCountField('flats', filter={'is_available': True})
     
     class Meta:
         model = Building
         fields = '__all__'
         read_only_fields = ('created_at',)
-    
-    def get_total_flats(self, obj):
-        return obj.flats.count()
-    
-    def get_available_flats(self, obj):
-        return obj.flats.filter(is_available=True).count()
 
 
 class EnhancedFlatSerializer(serializers.ModelSerializer):
@@ -799,6 +800,7 @@ class EnhancedFlatSerializer(serializers.ModelSerializer):
     class Meta:
         model = EnhancedFlat
         fields = '__all__'
+        related_paths = ('legacy_flat__owner', 'legacy_flat__tenant')
         read_only_fields = ('created_at',)
     
     def get_owner_name(self, obj):
@@ -823,6 +825,7 @@ class MemberRegistrationRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = MemberRegistrationRequest
         fields = '__all__'
+        related_paths = ('flat__building',)
         read_only_fields = ('requested_at', 'reviewed_by', 'reviewed_at', 'society_name', 
                            'building_name', 'flat_details', 'reviewed_by_name')
     
@@ -852,6 +855,7 @@ class MemberInvitationSerializer(serializers.ModelSerializer):
     class Meta:
         model = MemberInvitation
         fields = '__all__'
+        related_paths = ('flat__building',)
         read_only_fields = ('invited_by', 'invitation_token', 'created_at', 'expires_at',
                            'invited_by_name', 'society_name', 'building_name', 'flat_details')
     
@@ -868,8 +872,8 @@ class SocietySearchSerializer(serializers.Serializer):
 class SocietyListSerializer(serializers.ModelSerializer):
     """Simplified serializer for society list in search results"""
     full_address = serializers.SerializerMethodField()
-    total_flats = serializers.SerializerMethodField()
-    available_flats = serializers.SerializerMethodField()
+    total_flats = AnnotatedCountField('enhanced_flats')
+    available_flats = AnnotatedCountField('enhanced_flats', filter={'is_available': True})
     
     class Meta:
         model = Society
@@ -878,12 +882,6 @@ class SocietyListSerializer(serializers.ModelSerializer):
     
     def get_full_address(self, obj):
         return f"{obj.address}, {obj.city}, {obj.state} - {obj.pincode}"
-    
-    def get_total_flats(self, obj):
-        return obj.enhanced_flats.count()
-    
-    def get_available_flats(self, obj):
-        return obj.enhanced_flats.filter(is_available=True).count()
 
 
 # Staff Management Serializers
@@ -918,14 +916,11 @@ class SocietyProfileSerializer(serializers.ModelSerializer):
 # Helpdesk Management Serializers
 class HelpdeskDesignationSerializer(serializers.ModelSerializer):
     """Serializer for helpdesk designations"""
-    contacts_count = serializers.SerializerMethodField()
+    contacts_count = AnnotatedCountField('contacts', filter={'is_active': True})
     
     class Meta:
         model = HelpdeskDesignation
         fields = '__all__'
-    
-    def get_contacts_count(self, obj):
-        return obj.contacts.filter(is_active=True).count()
 
 
 class HelpdeskContactSerializer(serializers.ModelSerializer):
@@ -948,14 +943,11 @@ class HelpdeskContactSerializer(serializers.ModelSerializer):
 # Enhanced Billing Serializers
 class BillTypeSerializer(serializers.ModelSerializer):
     """Serializer for bill types"""
-    bills_count = serializers.SerializerMethodField()
+    bills_count = AnnotatedCountField('bills')
     
     class Meta:
         model = BillType
         fields = '__all__'
-    
-    def get_bills_count(self, obj):
-        return obj.bills.count()
 
 
 class EnhancedBillSerializer(serializers.ModelSerializer):
@@ -968,7 +960,7 @@ class EnhancedBillSerializer(serializers.ModelSerializer):
     class Meta:
         model = EnhancedBill
         fields = '__all__'
-        read_only_fields = ('bill_number', 'total_amount', 'created_by', 'created_at', 
+        read_only_fields = ('bill_number', 'total_amount', 'outstanding_amount', 'created_by', 'created_at', 
                            'updated_at', 'society_name', 'bill_type_name', 
                            'created_by_name', 'paid_by_name')
     
@@ -985,6 +977,7 @@ class BillDistributionSerializer(serializers.ModelSerializer):
     class Meta:
         model = BillDistribution
         fields = '__all__'
+        related_paths = ('flat__building',)
         read_only_fields = ('bill_title', 'flat_details')
 
 
@@ -992,7 +985,17 @@ class BillSplitSerializer(serializers.Serializer):
     """Serializer for splitting bills among flats"""
     bill_id = serializers.IntegerField()
     split_equally = serializers.BooleanField(default=True)
-    custom_allocations = serializers.JSONField(required=False, help_text='Custom allocation per flat')
+    custom_allocations = serializers.DictField(
+        child=serializers.DecimalField(max_digits=None, decimal_places=None, min_value=Decimal('0')),
+        required=False, help_text='Custom allocation weight per flat id'
+    )
+    mode = serializers.ChoiceField(choices=['EQUAL', 'AREA', 'TYPE', 'CUSTOM'], required=False,
+                                   help_text='Defaults to CUSTOM when custom allocations are given, else EQUAL')
+    type_weights = serializers.DictField(
+        child=serializers.DecimalField(max_digits=None, decimal_places=None, min_value=Decimal('0')),
+        required=False, help_text='Weight per flat type, e.g. {"2BHK": 2}'
+    )
+    weights_csv = serializers.CharField(required=False, help_text='"flat_id,weight" lines for a custom split')
     
     def validate_bill_id(self, value):
         try:
@@ -1002,6 +1005,36 @@ class BillSplitSerializer(serializers.Serializer):
             return value
         except EnhancedBill.DoesNotExist:  # type: ignore
             raise serializers.ValidationError("Bill not found")
+    
+    def validate(self, attrs):
+        if 'mode' not in attrs:
+            custom = attrs.get('custom_allocations') or attrs.get('weights_csv') or not attrs['split_equally']
+            attrs['mode'] = 'CUSTOM' if custom else 'EQUAL'
+        if attrs['mode'] == 'CUSTOM' and attrs.get('weights_csv'):
+            try:
+                attrs['custom_allocations'] = parse_weights_csv(attrs['weights_csv'])
+            except ValueError as e:
+                raise serializers.ValidationError({'weights_csv': str(e)})
+        return attrs
+
+
+class BillPaymentSerializer(serializers.Serializer):
+    """Serializer for a payment against a flat's share of a bill"""
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False,
+                                      help_text='Defaults to the outstanding share')
+    payment_mode = serializers.ChoiceField(choices=EnhancedBill.PAYMENT_MODE_CHOICES, required=False)
+    transaction_id = serializers.CharField(max_length=255, required=False)
+
+
+class StatementImportSerializer(serializers.Serializer):
+    """Serializer for bank/UPI statement reconciliation uploads"""
+    file = serializers.FileField(help_text='Statement CSV with a credit column, or an amount and a Dr/Cr column')
+    society = serializers.PrimaryKeyRelatedField(queryset=Society.objects.all())  # type: ignore
+    payment_mode = serializers.ChoiceField(choices=['BANK_TRANSFER', 'UPI'], default='BANK_TRANSFER')
+    dry_run = serializers.BooleanField(default=False)
+    unmatched_csv = serializers.BooleanField(
+        default=False, help_text='Respond with every unmatched line as a CSV download instead of the JSON summary'
+    )
 
 
 # Security and Gate Management Serializers
@@ -1016,6 +1049,7 @@ class VisitorPassSerializer(serializers.ModelSerializer):
     class Meta:
         model = VisitorPass
         fields = '__all__'
+        related_paths = ('flat_to_visit__building',)
         read_only_fields = ('pass_number', 'qr_code', 'created_by', 'created_at',
                            'society_name', 'flat_details', 'created_by_name',
                            'gate_entry_staff_name', 'gate_exit_staff_name')
@@ -1209,6 +1243,28 @@ class BulkUserImportSerializer(serializers.Serializer):
     send_welcome_email = serializers.BooleanField(default=True)
 
 
+class BulkUserExportSerializer(serializers.Serializer):
+    """Serializer for a background export of a society's users"""
+    society = serializers.PrimaryKeyRelatedField(queryset=Society.objects.all())  # type: ignore
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    role = serializers.ChoiceField(choices=User.ROLE_CHOICES, required=False)
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class BulkUserDeleteSerializer(serializers.Serializer):
+    """Serializer for bulk deactivation of users"""
+    society = serializers.PrimaryKeyRelatedField(queryset=Society.objects.all())  # type: ignore
+    user_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class BulkRoleChangeSerializer(serializers.Serializer):
+    """Serializer for bulk role changes"""
+    society = serializers.PrimaryKeyRelatedField(queryset=Society.objects.all())  # type: ignore
+    user_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    to_role = serializers.ChoiceField(choices=User.ROLE_CHOICES)
+    reason = serializers.CharField(required=False, allow_blank=True)
+
+
 class BulkUserUpdateSerializer(serializers.Serializer):
     """Serializer for bulk user updates"""
     user_ids = serializers.ListField(
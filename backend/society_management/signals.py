@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, ledger, permission_matrix
+from .models import (
+    AdminSociety, BillDistribution, CommonExpenseSplit, Complaint, Flat, MaintenanceBill, Permission,
+    RolePermission, Society, User
+)
+from .tenancy import invalidate_accessible_societies
+
+
+# Permission matrix invalidation, once the change is visible to other connections
+@receiver(post_save, sender=RolePermission)
+def invalidate_saved_role_permission(sender, instance, created, **kwargs):
+    if created:
+        role, society_id = instance.role, instance.society_id
+        transaction.on_commit(lambda: permission_matrix.invalidate(role=role, society=society_id))
+    else:
+        # The row may have moved to another role or society
+        transaction.on_commit(permission_matrix.invalidate)
+
+
+@receiver(post_delete, sender=RolePermission)
+def invalidate_deleted_role_permission(sender, instance, **kwargs):
+    role, society_id = instance.role, instance.society_id
+    transaction.on_commit(lambda: permission_matrix.invalidate(role=role, society=society_id))
+
+
+@receiver([post_save, post_delete], sender=Permission)
+def invalidate_permission(sender, instance, **kwargs):
+    transaction.on_commit(permission_matrix.invalidate)
+
+
+# Accessible society cache
+@receiver([post_save, post_delete], sender=AdminSociety)
+def invalidate_admin_societies(sender, instance, **kwargs):
+    # Dropped now and again on commit, as a request may re-cache the old set meanwhile
+    admin_id = instance.admin_id
+    invalidate_accessible_societies(admin_id)
+    transaction.on_commit(lambda: invalidate_accessible_societies(admin_id))
+
+
+# Flat ledger
+def _deleted_directly(sender, origin):
+    # Rows removed because their flat or society is being deleted take their ledger
+    # with them; posting reversals there would reference rows about to disappear
+    origin_model = getattr(origin, 'model', type(origin))
+    return origin_model is sender
+
+
+@receiver(post_save, sender=MaintenanceBill)
+def sync_maintenance_bill(sender, instance, **kwargs):
+    charged = instance.amount + instance.late_fee
+    ledger.sync_source(
+        instance.flat_id, ledger.MAINTENANCE_BILL, instance.pk, charged,
+        charged if instance.status == 'PAID' else 0, ledger.maintenance_bill_description(instance)
+    )
+
+
+@receiver(post_save, sender=CommonExpenseSplit)
+def sync_expense_split(sender, instance, **kwargs):
+    ledger.sync_source(
+        instance.flat_id, ledger.EXPENSE_SPLIT, instance.pk, instance.amount_due,
+        instance.amount_due if instance.status == 'PAID' else 0, 'Common expense'
+    )
+
+
+@receiver(post_save, sender=BillDistribution)
+def sync_bill_distribution(sender, instance, **kwargs):
+    flat_id = ledger.legacy_flat_ids([instance.flat_id]).get(instance.flat_id)
+    ledger.sync_source(
+        flat_id, ledger.BILL_DISTRIBUTION, instance.pk, instance.allocated_amount,
+        instance.paid_amount, 'Bill share'
+    )
+
+
+@receiver(post_delete, sender=MaintenanceBill)
+@receiver(post_delete, sender=CommonExpenseSplit)
+@receiver(post_delete, sender=BillDistribution)
+def reverse_deleted_source(sender, instance, origin=None, **kwargs):
+    if not _deleted_directly(sender, origin):
+        return
+    source_type = {
+        MaintenanceBill: ledger.MAINTENANCE_BILL,
+        CommonExpenseSplit: ledger.EXPENSE_SPLIT,
+        BillDistribution: ledger.BILL_DISTRIBUTION,
+    }[sender]
+    ledger.sync_source(None, source_type, instance.pk, 0, 0, 'Deleted')
+
+
+# Dashboard counters
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Flat)
+@receiver(pre_save, sender=Complaint)
+@receiver(pre_save, sender=MaintenanceBill)
+def remember_counted_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._counted_before = None
+    if not raw and not instance._state.adding and counters.affects(sender, update_fields):
+        instance._counted_before = counters.state_before_save(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Flat)
+@receiver(post_save, sender=Complaint)
+@receiver(post_save, sender=MaintenanceBill)
+def count_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not (created or counters.affects(sender, update_fields)):
+        return
+    before = getattr(instance, '_counted_before', None)
+    if before is not counters.UNCHANGED:
+        counters.adjust(counters.changes(before, counters.counted(instance, before)))
+    # The row now holds these values, for the next save of the same instance
+    counters.remember_saved(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Flat)
+@receiver(post_delete, sender=Complaint)
+@receiver(post_delete, sender=MaintenanceBill)
+def count_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Society):
+        # The counters row is deleted along with the society
+        return
+    counters.adjust(counters.changes(counters.counted(instance), None))
@@ -0,0 +1,222 @@
+"""
+CommonExpense and EnhancedBill split engines.
+
+Shares are computed in paise for all participating flats in one pass and the
+rounding remainder is handed out one paisa at a time using the largest-remainder
+method, ties broken by flat id. The splits therefore always add up exactly to
+``total_amount``. An expense or bill is split once; a second split is refused rather
+than topped up, as shares for flats added since would no longer add up to the total.
+
+Modes:
+
+* ``EQUAL`` - every flat of the society pays the same share
+* ``AREA`` - proportional to ``Flat.area_sqft``
+* ``TYPE`` - proportional to a weight per ``Flat.type``, e.g. ``{'2BHK': 2, '3BHK': 3}``
+* ``OCCUPIED`` - equal shares among flats with an owner or tenant
+
+Splitable ``EnhancedBill``s are distributed across the society's ``EnhancedFlat``s by
+``distribute_bill`` using ``EQUAL``, ``AREA`` (carpet plus balcony area), ``TYPE``
+(per ``flat_type`` weight) or ``CUSTOM`` weights, e.g. parsed from a CSV upload.
+"""
+import csv
+import io
+from decimal import Decimal
+from fractions import Fraction
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import ledger
+
+
+EQUAL = 'EQUAL'
+AREA = 'AREA'
+TYPE = 'TYPE'
+OCCUPIED = 'OCCUPIED'
+
+CUSTOM = 'CUSTOM'
+
+SPLIT_MODES = (EQUAL, AREA, TYPE, OCCUPIED)
+BILL_SPLIT_MODES = (EQUAL, AREA, TYPE, CUSTOM)
+
+
+def allocate(total, weights):
+    """
+    Split a decimal amount across weighted keys.
+
+    ``weights`` is a list of ``(key, weight)`` pairs; returns ``{key: Decimal}``
+    with two decimal places summing exactly to ``total``.
+    """
+    total_paise = int((Decimal(total) * 100).to_integral_value())
+    if total_paise < 0:
+        raise ValueError('Cannot split a negative amount')
+    if any(Fraction(weight) < 0 for _, weight in weights):
+        raise ValueError('Split weights cannot be negative')
+    weight_sum = sum(Fraction(weight) for _, weight in weights)
+    if not weights or weight_sum <= 0:
+        raise ValueError('Nothing to split the expense across')
+
+    shares, remainders = {}, []
+    for key, weight in weights:
+        quotient, remainder = divmod(total_paise * Fraction(weight), weight_sum)
+        shares[key] = int(quotient)
+        remainders.append((-remainder, key))
+
+    leftover = total_paise - sum(shares.values())
+    for _, key in sorted(remainders)[:leftover]:
+        shares[key] += 1
+    return {key: Decimal(paise).scaleb(-2) for key, paise in shares.items()}
+
+
+def _type_weight_rows(rows, type_weights):
+    """Map (flat id, flat type) rows to (flat id, weight) using per-type weights"""
+    if not type_weights:
+        raise ValueError('type_weights are required to split by flat type')
+    try:
+        type_weights = {flat_type: Fraction(str(weight)) for flat_type, weight in type_weights.items()}
+    except (AttributeError, ValueError):
+        raise ValueError('type_weights must map flat types to numbers')
+    unknown = sorted({flat_type for _, flat_type in rows} - set(type_weights))
+    if unknown:
+        raise ValueError(f'No weight given for flat type(s): {", ".join(unknown)}')
+    return [(flat_id, type_weights[flat_type]) for flat_id, flat_type in rows]
+
+
+def _flat_weights(expense, mode, type_weights=None):
+    from .models import Flat
+
+    flats = Flat.objects.filter(society_id=expense.society_id).order_by('id')  # type: ignore
+
+    if mode == EQUAL:
+        return [(flat_id, 1) for flat_id in flats.values_list('id', flat=True)]
+
+    if mode == OCCUPIED:
+        flats = flats.filter(Q(owner__isnull=False) | Q(tenant__isnull=False))
+        return [(flat_id, 1) for flat_id in flats.values_list('id', flat=True)]
+
+    if mode == AREA:
+        rows = list(flats.values_list('id', 'area_sqft'))
+        missing = sum(1 for _, area in rows if not area)
+        if missing:
+            raise ValueError(f'{missing} flat(s) have no area_sqft; cannot split by area')
+        return rows
+
+    if mode == TYPE:
+        return _type_weight_rows(list(flats.values_list('id', 'type')), type_weights)
+
+    raise ValueError(f'Unknown split mode "{mode}", expected one of {", ".join(SPLIT_MODES)}')
+
+
+def split_common_expense(expense, mode=EQUAL, type_weights=None):
+    """
+    Create the CommonExpenseSplit rows for an expense.
+
+    An expense that already has splits is left alone. Returns the number of flats
+    the expense was divided across.
+    """
+    from .models import CommonExpense, CommonExpenseSplit
+
+    shares = allocate(expense.total_amount, _flat_weights(expense, mode, type_weights))
+    splits = [
+        CommonExpenseSplit(common_expense_id=expense.pk, flat_id=flat_id, amount_due=amount)
+        for flat_id, amount in shares.items()
+    ]
+    with transaction.atomic():
+        # Serialise concurrent split requests for the same expense
+        list(CommonExpense.objects.select_for_update().filter(pk=expense.pk).values_list('pk', flat=True))  # type: ignore
+        if CommonExpenseSplit.objects.filter(common_expense_id=expense.pk).exists():  # type: ignore
+            raise ValueError('This expense has already been split')
+        CommonExpenseSplit.objects.bulk_create(splits)  # type: ignore
+        ledger.post([
+            ledger.entry(split.flat_id, ledger.CHARGE, split.amount_due, ledger.EXPENSE_SPLIT,
+                         split.pk, f'Common expense: {expense.title}')
+            for split in splits
+        ])
+    return len(shares)
+
+
+def parse_weights_csv(text):
+    """
+    Parse ``flat_id,weight`` lines (an optional header row is skipped) into a
+    ``{flat_id: weight}`` dict for CUSTOM bill splits.
+    """
+    weights = {}
+    for line_number, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row or not ''.join(row).strip():
+            continue
+        if len(row) < 2:
+            raise ValueError(f'Line {line_number}: expected "flat_id,weight"')
+        try:
+            flat_id, weight = int(row[0]), Fraction(row[1].strip())
+        except ValueError:
+            if line_number == 1:
+                continue
+            raise ValueError(f'Line {line_number}: expected "flat_id,weight"')
+        weights[flat_id] = weight
+    return weights
+
+
+def _bill_flat_weights(bill, mode, type_weights=None, custom_weights=None):
+    from .models import EnhancedFlat
+
+    flats = EnhancedFlat.objects.filter(society_id=bill.society_id).order_by('id')  # type: ignore
+
+    if mode == EQUAL:
+        return [(flat_id, 1) for flat_id in flats.values_list('id', flat=True)]
+
+    if mode == AREA:
+        return [
+            (flat_id, Fraction(carpet or 0) + Fraction(balcony or 0))
+            for flat_id, carpet, balcony in flats.values_list('id', 'carpet_area', 'balcony_area')
+        ]
+
+    if mode == TYPE:
+        return _type_weight_rows(list(flats.values_list('id', 'flat_type')), type_weights)
+
+    if mode == CUSTOM:
+        if not custom_weights:
+            raise ValueError('Custom weights are required for a custom split')
+        try:
+            custom_weights = {int(flat_id): Fraction(str(weight)) for flat_id, weight in custom_weights.items()}
+        except (AttributeError, ValueError):
+            raise ValueError('Custom weights must map flat ids to numbers')
+        known = set(flats.filter(id__in=list(custom_weights)).values_list('id', flat=True))
+        unknown = sorted(set(custom_weights) - known)
+        if unknown:
+            raise ValueError(f'Flats not in this society: {", ".join(map(str, unknown))}')
+        return sorted(custom_weights.items())
+
+    raise ValueError(f'Unknown split mode "{mode}", expected one of {", ".join(BILL_SPLIT_MODES)}')
+
+
+def distribute_bill(bill, mode=EQUAL, type_weights=None, custom_weights=None):
+    """
+    Create the BillDistribution rows for a splitable bill.
+
+    The whole ``total_amount`` is allocated in one pass and written with one
+    ``bulk_create``; a bill that already has distributions is left alone. Returns
+    the number of distributions created.
+    """
+    from .models import BillDistribution, EnhancedBill
+
+    if not bill.bill_type.is_splitable:
+        raise ValueError('This bill type is not splitable')
+    shares = allocate(bill.total_amount, _bill_flat_weights(bill, mode, type_weights, custom_weights))
+    distributions = [
+        BillDistribution(bill_id=bill.pk, flat_id=flat_id, allocated_amount=amount)
+        for flat_id, amount in shares.items() if amount > 0
+    ]
+
+    with transaction.atomic():
+        # Serialise concurrent split requests for the same bill
+        list(EnhancedBill.objects.select_for_update().filter(pk=bill.pk).values_list('pk', flat=True))  # type: ignore
+        if BillDistribution.objects.filter(bill_id=bill.pk).exists():  # type: ignore
+            raise ValueError('This bill has already been distributed')
+        BillDistribution.objects.bulk_create(distributions)  # type: ignore
+        flat_ids = ledger.legacy_flat_ids(d.flat_id for d in distributions)
+        ledger.post([
+            ledger.entry(flat_ids[d.flat_id], ledger.CHARGE, d.allocated_amount, ledger.BILL_DISTRIBUTION,
+                         d.pk, f'{bill.bill_number}: {bill.title}')
+            for d in distributions if d.flat_id in flat_ids
+        ])
+    return len(distributions)
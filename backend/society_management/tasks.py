@@ -0,0 +1,81 @@
+"""
+Tasks run by the background job layer (see ``jobs.py``).
+
+Request handlers queue these with ``.delay(...)``; the periodic ones are listed in
+``TASK_SCHEDULE``. Tasks take ids rather than model instances so their arguments stay
+JSON, and return a small JSON summary that is kept on the job row.
+"""
+from .jobs import task
+
+
+@task(queue='bulk', max_attempts=1)
+def import_users(operation_id, default_role='MEMBER'):
+    """Process the file of a bulk user import"""
+    from .user_import import run_import
+
+    operation = run_import(operation_id, default_role)
+    return {'status': operation.status, 'successful': operation.successful_records, 'failed': operation.failed_records}
+
+
+@task(queue='bulk')
+def run_bulk_operation(operation_id):
+    """Run or resume an export, bulk deactivation or role change; retries resume from the checkpoint"""
+    from .bulk_jobs import run_operation
+
+    operation = run_operation(operation_id)
+    return {'status': operation.status, 'successful': operation.successful_records, 'failed': operation.failed_records}
+
+
+@task(queue='bulk', max_attempts=1)
+def resume_bulk_operations():
+    """Queue bulk operations that were abandoned by a worker"""
+    from .bulk_jobs import stalled_operations
+
+    operation_ids = stalled_operations()
+    for operation_id in operation_ids:
+        run_bulk_operation.delay(operation_id)
+    return {'queued': operation_ids}
+
+
+@task(priority=3)
+def split_common_expense(expense_id, mode='EQUAL', type_weights=None):
+    """Divide a common expense across its society's flats"""
+    from .models import CommonExpense
+    from .splitting import split_common_expense as split
+
+    expense = CommonExpense.objects.get(pk=expense_id)  # type: ignore
+    return {'splits_count': split(expense, mode, type_weights)}
+
+
+@task(queue='billing', max_attempts=1)
+def sweep_overdue_bills():
+    """Mark bills past their due date overdue and charge late fees"""
+    from .billing import sweep_overdue_bills as sweep
+
+    return sweep()
+
+
+@task(queue='billing', max_attempts=1)
+def materialize_recurring_bills():
+    """Create the recurring bill occurrences that have come due"""
+    from .billing import materialize_recurring_bills as materialize
+
+    result = materialize()
+    result['errors'] = result['errors'][:100]
+    return result
+
+
+@task(queue='reports', max_attempts=2)
+def rollup_daily_stats():
+    """Rebuild the analytics rollups of the last ANALYTICS_ROLLUP_LOOKBACK_DAYS days"""
+    from .analytics import rollup_daily_stats as rollup
+
+    return rollup()
+
+
+@task(queue='maintenance', max_attempts=2)
+def sweep_expired_records():
+    """Expire and purge stale OTPs, invitations, visitor passes and finished jobs"""
+    from .lifecycle import sweep_expired_records as sweep
+
+    return sweep()
@@ -0,0 +1,80 @@
+"""
+Accessible-society resolution for the current caller.
+
+An ADMIN reaches every society linked through ``AdminSociety``; every other role is
+confined to ``user.society``. Admin sets are cached per user in the shared Django
+cache and dropped by the ``AdminSociety`` handlers in ``signals.py``, again once the
+change commits.
+
+``SocietyScopeMiddleware`` attaches a ``TenantContext`` to each request so the set is
+resolved at most once per request, however many querysets are scoped with it.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+CACHE_KEY = 'society_management:accessible_societies:{user_id}'
+
+
+def _cache_timeout():
+    return getattr(settings, 'ACCESSIBLE_SOCIETIES_CACHE_TIMEOUT', 300)
+
+
+def get_accessible_society_ids(user):
+    """Tuple of society ids the user may act on"""
+    if not user.is_authenticated:
+        return ()
+    if user.role != 'ADMIN':
+        return (user.society_id,) if user.society_id else ()
+
+    key = CACHE_KEY.format(user_id=user.pk)
+    society_ids = cache.get(key)
+    if society_ids is None:
+        from .models import AdminSociety
+        society_ids = tuple(sorted(
+            AdminSociety.objects.filter(admin_id=user.pk).values_list('society_id', flat=True)  # type: ignore
+        ))
+        cache.set(key, society_ids, _cache_timeout())
+    return society_ids
+
+
+def invalidate_accessible_societies(user_id):
+    cache.delete(CACHE_KEY.format(user_id=user_id))
+
+
+class TenantContext:
+    """Per-request memo of the caller's accessible societies"""
+
+    def __init__(self, request):
+        self._request = request
+        self._resolved = None
+
+    @property
+    def society_ids(self):
+        # DRF authenticates inside the view and then sets request.user, so resolve
+        # lazily and never memoise the anonymous answer
+        user = self._request.user
+        if not user.is_authenticated:
+            return ()
+        if self._resolved is None or self._resolved[0] != user.pk:
+            self._resolved = (user.pk, get_accessible_society_ids(user))
+        return self._resolved[1]
+
+
+class SocietyScopeMiddleware:
+    """Attach a TenantContext as ``request.tenant``"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.tenant = TenantContext(request)
+        return self.get_response(request)
+
+
+def accessible_society_ids(request):
+    """Accessible societies for a (Django or DRF) request"""
+    tenant = getattr(request, 'tenant', None)
+    if tenant is None:
+        return get_accessible_society_ids(request.user)
+    return tenant.society_ids
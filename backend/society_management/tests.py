@@ -1,3 +1,1108 @@
-from django.test import TestCase
+import contextlib
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.cache.backends import locmem
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import TokenError
+
+from . import billing, bulk_jobs, counters, jobs, ledger, otp_store, revocation, throttling, user_import
+from .billing import materialize_recurring_bills, sweep_overdue_bills
+from .models import (
+    OTP, AdminSociety, BackgroundJob, BillDistribution, BillType, Building, BulkUserOperation, CommonExpense,
+    CommonExpenseSplit, EnhancedBill, EnhancedFlat, FeeStructure, Flat, FlatBalance, GateUpdateLog, LedgerEntry,
+    MaintenanceBill, Society, SocietyCounters, SocietySettings, User, UserRoleTransition
+)
+from .pagination import KeysetPagination
+from .reconciliation import StatementRow, read_statement, reconcile_statement
+from .splitting import allocate, distribute_bill, split_common_expense
+from .token_auth import RefreshToken
+
+
+def make_society(name='Green Acres'):
+    return Society.objects.create(name=name, address='1 Main Road', city='Pune', state='MH', pincode='411001')  # type: ignore
+
+
+def make_user(phone_number, role='MEMBER', society=None, **fields):
+    return User.objects.create_user(  # type: ignore
+        username=phone_number, email=f'{phone_number}@example.com', phone_number=phone_number,
+        password='secret-pass-1', role=role, society=society, **fields
+    )
+
+
+def make_flats(society, count, block='A', **fields):
+    return [
+        Flat.objects.create(society=society, block_number=block, flat_number=str(101 + i), type='2BHK', **fields)  # type: ignore
+        for i in range(count)
+    ]
+
+
+def make_enhanced_flats(society, count):
+    """EnhancedFlats with linked legacy Flats, as the ledger is kept against Flat"""
+    building = Building.objects.create(society=society, name='Tower 1', total_floors=4, flats_per_floor=4)  # type: ignore
+    flats = []
+    for i in range(count):
+        enhanced = EnhancedFlat.objects.create(  # type: ignore
+            society=society, building=building, floor_number=1, flat_number=str(101 + i), flat_type='2BHK',
+            carpet_area=800,
+        )
+        Flat.objects.create(  # type: ignore
+            society=society, block_number='T1', flat_number=str(101 + i), type='2BHK', enhanced_flat=enhanced
+        )
+        flats.append(enhanced)
+    return flats
+
+
+@jobs.task(name='tests.add', queue='tests')
+def add_numbers(a, b):
+    return a + b
+
+
+@jobs.task(name='tests.heartbeat', queue='tests')
+def report_heartbeat():
+    return jobs.heartbeat()
+
+
+@jobs.task(name='tests.fail', queue='tests', max_attempts=2)
+def always_fail():
+    raise RuntimeError('boom')
+
+
+class AllocateTests(TestCase):
+    def test_shares_add_up_to_the_total(self):
+        shares = allocate(Decimal('100.00'), [(1, 1), (2, 1), (3, 1)])
+        self.assertEqual(sum(shares.values()), Decimal('100.00'))
+        self.assertEqual(sorted(shares.values()), [Decimal('33.33'), Decimal('33.33'), Decimal('33.34')])
+
+    def test_remainder_goes_to_the_largest_remainders_then_lowest_key(self):
+        # 0.05 over weights 1:1:1 -> 1.67 paise each, so two flats get the extra paisa
+        shares = allocate(Decimal('0.05'), [(3, 1), (1, 1), (2, 1)])
+        self.assertEqual(shares, {1: Decimal('0.02'), 2: Decimal('0.02'), 3: Decimal('0.01')})
+
+    def test_weighted_split(self):
+        shares = allocate(Decimal('1000'), [('a', 2), ('b', 3)])
+        self.assertEqual(shares, {'a': Decimal('400.00'), 'b': Decimal('600.00')})
+
+    def test_rejects_negative_totals_and_weights(self):
+        with self.assertRaises(ValueError):
+            allocate(Decimal('-1'), [(1, 1)])
+        with self.assertRaises(ValueError):
+            allocate(Decimal('1'), [(1, -1), (2, 2)])
+        with self.assertRaises(ValueError):
+            allocate(Decimal('1'), [])
+
+
+class SplitCommonExpenseTests(TestCase):
+    def setUp(self):
+        self.society = make_society()
+        self.flats = make_flats(self.society, 3)
+        self.expense = CommonExpense.objects.create(  # type: ignore
+            society=self.society, title='Festival', total_amount=Decimal('1000.00'),
+            created_by=make_user('9000000001', role='ADMIN', society=self.society),
+        )
+
+    def test_splits_add_up_to_the_total(self):
+        self.assertEqual(split_common_expense(self.expense), 3)
+        amounts = CommonExpenseSplit.objects.filter(common_expense=self.expense).values_list('amount_due', flat=True)  # type: ignore
+        self.assertEqual(sum(amounts), Decimal('1000.00'))
+
+    def test_refuses_to_split_again_after_flats_are_added(self):
+        split_common_expense(self.expense)
+        make_flats(self.society, 1, block='B')
+        with self.assertRaises(ValueError):
+            split_common_expense(self.expense)
+        self.assertEqual(CommonExpenseSplit.objects.filter(common_expense=self.expense).count(), 3)  # type: ignore
+
+
+class MaintenanceBillRunTests(TestCase):
+    def setUp(self):
+        self.society = make_society()
+        self.flats = make_flats(self.society, 3)
+        self.large = Flat.objects.create(society=self.society, block_number='B', flat_number='101', type='3BHK')  # type: ignore
+        self.period = billing.parse_period('2026-02')
+
+    def bills(self):
+        return {
+            bill.flat_id: bill
+            for bill in MaintenanceBill.objects.filter(flat__society=self.society)  # type: ignore
+        }
+
+    def test_fee_structure_then_society_default(self):
+        FeeStructure.objects.create(society=self.society, flat_type='2BHK', maintenance_amount=Decimal('1500'))  # type: ignore
+        FeeStructure.objects.create(  # type: ignore
+            society=self.society, flat_type='3BHK', maintenance_amount=Decimal('2500'), is_active=False,
+        )
+        SocietySettings.objects.create(  # type: ignore
+            society=self.society, default_maintenance_amount=Decimal('1000'), maintenance_due_day=10,
+        )
+
+        result = billing.generate_maintenance_bills(self.society, self.period)
+
+        self.assertEqual((result.created, result.skipped, result.errors), (4, 0, []))
+        bills = self.bills()
+        self.assertEqual([bills[flat.pk].amount for flat in self.flats], [Decimal('1500')] * 3)
+        # An inactive fee structure falls back to the society default
+        self.assertEqual(bills[self.large.pk].amount, Decimal('1000'))
+        self.assertEqual(
+            {(bill.due_date, bill.billing_period_start, bill.billing_period_end) for bill in bills.values()},
+            {(datetime.date(2026, 2, 10), datetime.date(2026, 2, 1), datetime.date(2026, 2, 28))},
+        )
+
+    def test_due_day_is_clamped_to_the_month(self):
+        SocietySettings.objects.create(  # type: ignore
+            society=self.society, default_maintenance_amount=Decimal('1000'), maintenance_due_day=31,
+        )
+        billing.generate_maintenance_bills(self.society, self.period)
+        billing.generate_maintenance_bills(self.society, billing.parse_period('2026-03'))
+        self.assertEqual(
+            sorted(set(MaintenanceBill.objects.values_list('due_date', flat=True))),  # type: ignore
+            [datetime.date(2026, 2, 28), datetime.date(2026, 3, 31)],
+        )
+
+    def test_rerunning_a_period_bills_each_flat_once(self):
+        FeeStructure.objects.create(society=self.society, flat_type='2BHK', maintenance_amount=Decimal('1500'))  # type: ignore
+        FeeStructure.objects.create(society=self.society, flat_type='3BHK', maintenance_amount=Decimal('2500'))  # type: ignore
+        first = billing.generate_maintenance_bills(self.society, self.period, batch_size=2)
+        extra = make_flats(self.society, 1, block='C')[0]
+        second = billing.generate_maintenance_bills(self.society, self.period, batch_size=2)
+
+        self.assertEqual((first.created, first.skipped), (4, 0))
+        self.assertEqual((second.created, second.skipped), (1, 4))
+        self.assertEqual(sorted(self.bills()), sorted([flat.pk for flat in self.flats] + [self.large.pk, extra.pk]))
+
+    def test_flats_without_an_amount_are_reported(self):
+        FeeStructure.objects.create(society=self.society, flat_type='2BHK', maintenance_amount=Decimal('1500'))  # type: ignore
+
+        result = billing.generate_maintenance_bills(self.society, self.period)
+
+        # No SocietySettings row: no default amount, and the due day is DEFAULT_DUE_DAY
+        self.assertEqual(result.created, 3)
+        self.assertEqual(result.errors, [{'flat': self.large.pk, 'error': 'No maintenance amount configured for flat type "3BHK"'}])
+        bills = self.bills()
+        self.assertNotIn(self.large.pk, bills)
+        self.assertEqual({bill.due_date for bill in bills.values()}, {datetime.date(2026, 2, billing.DEFAULT_DUE_DAY)})
+
+    def test_dry_run_writes_nothing(self):
+        SocietySettings.objects.create(society=self.society, default_maintenance_amount=Decimal('1000'))  # type: ignore
+        result = billing.generate_maintenance_bills(self.society, self.period, dry_run=True)
+        self.assertEqual(result.created, 4)
+        self.assertFalse(MaintenanceBill.objects.exists())  # type: ignore
+
+
+class RecurringBillTests(TestCase):
+    def setUp(self):
+        self.society = make_society()
+        self.admin = make_user('9000000060', role='ADMIN', society=self.society)
+
+    def make_template(self, next_due, recurrence_period='monthly'):
+        bill_type = BillType.objects.create(  # type: ignore
+            society=self.society, name=f'Water {recurrence_period}', is_recurring=True,
+            recurrence_period=recurrence_period,
+        )
+        return EnhancedBill.objects.create(  # type: ignore
+            society=self.society, bill_type=bill_type, title='Water', amount=Decimal('300.00'),
+            due_date=next_due, next_due_date=next_due, is_recurring=True, status='PENDING', created_by=self.admin,
+        )
+
+    def occurrences(self, template):
+        return list(EnhancedBill.objects.filter(parent_bill=template).order_by('due_date').values_list(  # type: ignore
+            'due_date', flat=True
+        ))
+
+    def test_occurrences_follow_the_due_day_and_repeated_runs_add_none(self):
+        template = self.make_template(datetime.date(2026, 1, 31))
+        result = materialize_recurring_bills(as_of=datetime.date(2026, 3, 31))
+        self.assertEqual((result['created'], result['errors']), (3, []))
+        self.assertEqual(self.occurrences(template),
+                         [datetime.date(2026, 1, 31), datetime.date(2026, 2, 28), datetime.date(2026, 3, 31)])
+        template.refresh_from_db()
+        self.assertEqual(template.next_due_date, datetime.date(2026, 4, 30))
+
+        self.assertEqual(materialize_recurring_bills(as_of=datetime.date(2026, 3, 31))['created'], 0)
+        self.assertEqual(len(self.occurrences(template)), 3)
+        numbers = EnhancedBill.objects.filter(parent_bill=template).values_list('bill_number', flat=True)  # type: ignore
+        self.assertEqual(len(set(numbers) | {template.bill_number}), 4)
+
+    def test_long_overdue_templates_catch_up_a_capped_number_per_batch(self):
+        template = self.make_template(datetime.date(2024, 1, 5))
+        as_of = datetime.date(2025, 6, 10)
+        self.assertEqual(billing._materialize_batch([template.pk], as_of, []), billing.MAX_OCCURRENCES_PER_TEMPLATE)
+        template.refresh_from_db()
+        self.assertEqual(template.next_due_date, datetime.date(2025, 1, 5))
+
+        self.assertEqual(materialize_recurring_bills(as_of=as_of)['created'], 6)
+        self.assertEqual(len(self.occurrences(template)), 18)
+        template.refresh_from_db()
+        self.assertEqual(template.next_due_date, datetime.date(2025, 7, 5))
+
+    def test_unknown_recurrence_period_is_reported(self):
+        template = self.make_template(datetime.date(2026, 1, 5), recurrence_period='fortnightly')
+        quarterly = self.make_template(datetime.date(2026, 1, 5), recurrence_period='Quarterly')
+        result = materialize_recurring_bills(as_of=datetime.date(2026, 3, 10))
+        self.assertEqual(result['errors'], [{'bill': template.pk, 'error': 'Unknown recurrence period "fortnightly"'}])
+        self.assertEqual((result['templates'], result['created']), (1, 1))
+        self.assertEqual(self.occurrences(template), [])
+        template.refresh_from_db()
+        self.assertEqual(template.next_due_date, datetime.date(2026, 1, 5))
+        self.assertEqual(self.occurrences(quarterly), [datetime.date(2026, 1, 5)])
+
+
+class OverdueSweepTests(TestCase):
+    def setUp(self):
+        self.society = make_society()
+        SocietySettings.objects.create(society=self.society, late_fee_percentage=Decimal('10'))  # type: ignore
+        self.admin = make_user('9000000002', role='ADMIN', society=self.society)
+        self.as_of = datetime.date(2026, 3, 10)
+
+    def test_maintenance_bill_goes_overdue_with_a_late_fee_once(self):
+        flat = make_flats(self.society, 1)[0]
+        bill = MaintenanceBill.objects.create(  # type: ignore
+            flat=flat, amount=Decimal('1500.00'), due_date=datetime.date(2026, 3, 5),
+            billing_period_start=datetime.date(2026, 3, 1), billing_period_end=datetime.date(2026, 3, 31),
+        )
+
+        report = sweep_overdue_bills(as_of=self.as_of)
+        self.assertEqual(report['maintenance_bills']['rows'], 1)
+        bill.refresh_from_db()
+        self.assertEqual((bill.status, bill.late_fee), ('OVERDUE', Decimal('150.00')))
+        self.assertEqual(FlatBalance.objects.get(flat=flat).balance, Decimal('1650.00'))  # type: ignore
+
+        self.assertEqual(sweep_overdue_bills(as_of=self.as_of)['maintenance_bills']['rows'], 0)
+        self.assertEqual(FlatBalance.objects.get(flat=flat).balance, Decimal('1650.00'))  # type: ignore
+
+    def test_dry_run_changes_nothing(self):
+        flat = make_flats(self.society, 1)[0]
+        MaintenanceBill.objects.create(  # type: ignore
+            flat=flat, amount=Decimal('1000.00'), due_date=datetime.date(2026, 3, 5),
+            billing_period_start=datetime.date(2026, 3, 1), billing_period_end=datetime.date(2026, 3, 31),
+        )
+        report = sweep_overdue_bills(as_of=self.as_of, dry_run=True)
+        self.assertEqual(report['maintenance_bills'], {'rows': 1, 'late_fees': Decimal('100.00')})
+        self.assertEqual(MaintenanceBill.objects.get().status, 'PENDING')  # type: ignore
+
+    def test_split_bill_late_fee_is_spread_over_unpaid_shares(self):
+        flats = make_enhanced_flats(self.society, 3)
+        bill_type = BillType.objects.create(society=self.society, name='Repairs', is_splitable=True)  # type: ignore
+        bill = EnhancedBill.objects.create(  # type: ignore
+            society=self.society, bill_type=bill_type, title='Lift repair', amount=Decimal('900.00'),
+            due_date=datetime.date(2026, 3, 5), status='PENDING', created_by=self.admin,
+        )
+        distribute_bill(bill)
+        paid_share = BillDistribution.objects.get(bill=bill, flat=flats[0])  # type: ignore
+        paid_share.record_payment(Decimal('300.00'))
+
+        sweep_overdue_bills(as_of=self.as_of)
+        bill.refresh_from_db()
+        self.assertEqual((bill.status, bill.late_fee, bill.total_amount), ('OVERDUE', Decimal('90.00'), Decimal('990.00')))
+        shares = BillDistribution.objects.filter(bill=bill).order_by('flat_id')  # type: ignore
+        self.assertEqual([share.allocated_amount for share in shares],
+                         [Decimal('300.00'), Decimal('345.00'), Decimal('345.00')])
+        legacy_flat = Flat.objects.get(enhanced_flat=flats[1])  # type: ignore
+        self.assertEqual(FlatBalance.objects.get(flat=legacy_flat).balance, Decimal('345.00'))  # type: ignore
+
+        # Residents paying their full shares settle the bill
+        for share in shares[1:]:
+            share.record_payment(share.allocated_amount - share.paid_amount)
+        bill.refresh_from_db()
+        self.assertEqual((bill.status, bill.outstanding_amount), ('PAID', Decimal('0.00')))
+
+
+class BillDistributionPaymentTests(TestCase):
+    def setUp(self):
+        society = make_society()
+        self.flats = make_enhanced_flats(society, 2)
+        bill_type = BillType.objects.create(society=society, name='Repairs', is_splitable=True)  # type: ignore
+        self.bill = EnhancedBill.objects.create(  # type: ignore
+            society=society, bill_type=bill_type, title='Painting', amount=Decimal('500.00'),
+            due_date=datetime.date(2026, 3, 5), status='PENDING',
+            created_by=make_user('9000000003', role='ADMIN', society=society),
+        )
+        distribute_bill(self.bill)
+        self.share = BillDistribution.objects.get(bill=self.bill, flat=self.flats[0])  # type: ignore
+
+    def test_rejects_amounts_that_are_not_positive_numbers(self):
+        for amount in ([1], {'amount': 1}, 'abc', True, 'NaN', 'Infinity', '0', '-5'):
+            with self.subTest(amount=amount), self.assertRaises(ValueError):
+                self.share.record_payment(amount)
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.paid_amount, Decimal('0'))
+
+    def test_rejects_overpayment_and_rolls_payments_into_the_bill(self):
+        with self.assertRaises(ValueError):
+            self.share.record_payment('250.01')
+        self.share.record_payment('100')
+        self.share.record_payment('150.00')
+        self.bill.refresh_from_db()
+        self.assertEqual((self.share.status, self.bill.paid_amount, self.bill.outstanding_amount),
+                         ('PAID', Decimal('250.00'), Decimal('250.00')))
+
+
+class SocietyCounterTests(TestCase):
+    def setUp(self):
+        self.society = make_society()
+        self.user = make_user('9000000010', society=self.society)
+        counters.recount([self.society.pk])
+
+    def counter_row(self):
+        return SocietyCounters.objects.values('users', 'members', 'staff').get(pk=self.society.pk)  # type: ignore
+
+    def test_saving_without_changing_counted_fields_runs_only_the_update(self):
+        user = User.objects.get(pk=self.user.pk)  # type: ignore
+        user.first_name = 'Asha'
+        with self.assertNumQueries(1):
+            user.save()
+        self.assertEqual(self.counter_row(), {'users': 1, 'members': 1, 'staff': 0})
+
+    def test_role_and_society_changes_move_the_counts(self):
+        user = User.objects.get(pk=self.user.pk)  # type: ignore
+        user.role = 'STAFF'
+        user.save()
+        self.assertEqual(self.counter_row(), {'users': 1, 'members': 0, 'staff': 1})
+        user.role = 'MEMBER'
+        user.save()
+        self.assertEqual(self.counter_row(), {'users': 1, 'members': 1, 'staff': 0})
+
+        other = make_society('Blue Hills')
+        counters.recount([other.pk])
+        user.society = other
+        user.save()
+        self.assertEqual(self.counter_row(), {'users': 0, 'members': 0, 'staff': 0})
+        self.assertEqual(SocietyCounters.objects.get(pk=other.pk).members, 1)  # type: ignore
+
+
+@override_settings(TASK_BACKEND='database', TASK_RETRY_BACKOFF=60)
+class BackgroundJobTests(TestCase):
+    def test_claims_ready_jobs_by_priority_and_each_only_once(self):
+        later = add_numbers.enqueue((1, 1), countdown=3600)
+        low = add_numbers.enqueue((1, 2), priority=9)
+        high = add_numbers.enqueue((1, 3), priority=0)
+        other_queue = add_numbers.enqueue((1, 4), queue='elsewhere')
+
+        claimed = [jobs.claim_next(['tests'], worker='w1'), jobs.claim_next(['tests'], worker='w2')]
+        self.assertEqual([job.pk for job in claimed], [high.pk, low.pk])
+        self.assertEqual([(job.status, job.attempts, job.locked_by) for job in claimed],
+                         [(jobs.RUNNING, 1, 'w1'), (jobs.RUNNING, 1, 'w2')])
+        self.assertIsNone(jobs.claim_next(['tests'], worker='w3'))
+        self.assertEqual(BackgroundJob.objects.get(pk=later.pk).status, jobs.QUEUED)  # type: ignore
+        self.assertEqual(BackgroundJob.objects.get(pk=other_queue.pk).status, jobs.QUEUED)  # type: ignore
+
+        jobs.run(claimed[0])
+        high.refresh_from_db()
+        self.assertEqual((high.status, high.result), (jobs.SUCCEEDED, 4))
+
+    def test_failed_job_is_retried_after_backoff_until_attempts_run_out(self):
+        job = always_fail.delay()
+        with self.assertLogs('society_management.jobs', 'WARNING'):
+            jobs.run(jobs.claim_next(['tests']))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (jobs.QUEUED, 1))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + datetime.timedelta(seconds=50))
+        self.assertIsNone(jobs.claim_next(['tests']))
+
+        BackgroundJob.objects.filter(pk=job.pk).update(run_at=timezone.now())  # type: ignore
+        with self.assertLogs('society_management.jobs', 'WARNING'):
+            jobs.run(jobs.claim_next(['tests']))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (jobs.FAILED, 2))
+        self.assertIsNone(jobs.claim_next(['tests']))
+
+    def test_only_jobs_whose_heartbeat_stopped_are_queued_again(self):
+        job = add_numbers.delay(2, 2)
+        slow = jobs.claim_next(['tests'], worker='w1')
+        an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+        BackgroundJob.objects.filter(pk=job.pk).update(started_at=an_hour_ago)  # type: ignore
+        with override_settings(TASK_JOB_TIMEOUT=60):
+            self.assertEqual(jobs.requeue_stale(), 0)
+            BackgroundJob.objects.filter(pk=job.pk).update(heartbeat_at=an_hour_ago)  # type: ignore
+            self.assertEqual(jobs.requeue_stale(), 1)
+
+        again = jobs.claim_next(['tests'], worker='w2')
+        # The first worker was only slow; its outcome must not overwrite the new attempt
+        with self.assertLogs('society_management.jobs', 'WARNING'):
+            jobs.run(slow)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.attempts), (jobs.RUNNING, 'w2', 2))
+        jobs.run(again)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (jobs.SUCCEEDED, 4))
+
+    @override_settings(TASK_JOB_TIMEOUT=60)
+    def test_requeued_jobs_are_handed_back_to_the_backend(self):
+        job = add_numbers.delay(3, 4)
+        jobs.claim_next(['tests'])
+        BackgroundJob.objects.filter(pk=job.pk).update(  # type: ignore
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        # The immediate backend, like Celery, runs a job only when it is handed over
+        with override_settings(TASK_BACKEND='immediate'):
+            self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.attempts), (jobs.SUCCEEDED, 7, 2))
+
+    @override_settings(TASK_HEARTBEAT_INTERVAL=0)
+    def test_running_task_refreshes_its_heartbeat(self):
+        job = report_heartbeat.delay()
+        claimed = jobs.claim_next(['tests'])
+        BackgroundJob.objects.filter(pk=job.pk).update(  # type: ignore
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        jobs.run(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (jobs.SUCCEEDED, True))
+        self.assertGreater(job.heartbeat_at, timezone.now() - datetime.timedelta(minutes=1))
+        self.assertTrue(jobs.heartbeat())
+
+
+class WorkerDied(BaseException):
+    """Stands in for a worker process dying mid-operation"""
+
+
+@override_settings(TASK_BACKEND='database')
+class BulkOperationTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.society = make_society()
+        self.admin = make_user('9000000040', role='ADMIN', society=self.society)
+
+    def make_operation(self, operation_type, **parameters):
+        return BulkUserOperation.objects.create(  # type: ignore
+            operation_type=operation_type, initiated_by=self.admin, society=self.society, parameters=parameters,
+        )
+
+    def die_at_checkpoint(self, number):
+        """Patch the operation checkpoint so the worker dies while writing checkpoint ``number``"""
+        real, calls = bulk_jobs._checkpoint, []
+
+        def checkpoint(*args):
+            real(*args)
+            calls.append(args)
+            if len(calls) == number:
+                raise WorkerDied
+        return mock.patch.object(bulk_jobs, '_checkpoint', checkpoint)
+
+    def resume(self, operation):
+        """Run an operation again once its dead worker's heartbeat is stale"""
+        BulkUserOperation.objects.filter(pk=operation.pk).update(  # type: ignore
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        self.assertEqual(bulk_jobs.stalled_operations(), [operation.pk])
+        return bulk_jobs.run_operation(operation.pk, size=2)
+
+    def test_resumed_role_change_applies_each_chunk_once(self):
+        members = [make_user(f'900000008{i}', society=self.society) for i in range(5)]
+        counters.recount([self.society.pk])
+        operation = self.make_operation(bulk_jobs.ROLE_CHANGE, to_role='STAFF', reason='Gate duty')
+        # Dies inside the second chunk's transaction, after the first chunk committed
+        with self.die_at_checkpoint(2), self.assertRaises(WorkerDied):
+            bulk_jobs.run_operation(operation.pk, size=2)
+        operation.refresh_from_db()
+        self.assertEqual((operation.status, operation.successful_records, operation.checkpoint['last_id']),
+                         ('PROCESSING', 2, members[1].pk))
+        self.assertEqual(User.objects.filter(role='STAFF').count(), 2)  # type: ignore
+
+        operation = self.resume(operation)
+        self.assertEqual((operation.status, operation.total_records, operation.successful_records,
+                          operation.failed_records), ('COMPLETED', 5, 5, 0))
+        transitions = UserRoleTransition.objects.order_by('user_id')  # type: ignore
+        self.assertEqual(
+            list(transitions.values_list('user_id', 'from_role', 'to_role', 'status', 'reason', 'approved_by_id')),
+            [(member.pk, 'MEMBER', 'STAFF', 'APPROVED', 'Gate duty', self.admin.pk) for member in members],
+        )
+        self.assertEqual(
+            SocietyCounters.objects.values('members', 'staff').get(pk=self.society.pk),  # type: ignore
+            {'members': 0, 'staff': 5},
+        )
+
+    def test_resumed_bulk_delete_deactivates_the_remaining_users(self):
+        members = [make_user(f'900000009{i}', society=self.society) for i in range(5)]
+        operation = self.make_operation(bulk_jobs.BULK_DELETE, user_ids=[member.pk for member in members])
+        with self.die_at_checkpoint(3), self.assertRaises(WorkerDied):
+            bulk_jobs.run_operation(operation.pk, size=2)
+        self.assertEqual(User.objects.filter(pk__in=[m.pk for m in members], is_active=False).count(), 4)  # type: ignore
+
+        operation = self.resume(operation)
+        self.assertEqual((operation.status, operation.successful_records), ('COMPLETED', 5))
+        self.assertFalse(User.objects.filter(pk__in=[m.pk for m in members], is_active=True).exists())  # type: ignore
+
+    def test_resumed_export_drops_rows_written_after_the_checkpoint(self):
+        for i in range(4):
+            make_user(f'900000010{i}', society=self.society)
+        operation = self.make_operation(bulk_jobs.EXPORT)
+        with self.die_at_checkpoint(1), self.assertRaises(WorkerDied):
+            bulk_jobs.run_operation(operation.pk, size=2)
+        operation.refresh_from_db()
+        path = default_storage.path(operation.file_path)
+        with open(path, 'a', encoding='utf-8') as artifact:
+            artifact.write('half a row written after the checkpoint')
+
+        operation = self.resume(operation)
+        with open(path, encoding='utf-8') as artifact:
+            lines = artifact.read().splitlines()
+        self.assertEqual(operation.checkpoint['offset'], os.path.getsize(path))
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'first_name'])
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]],
+                         list(User.objects.filter(society=self.society).order_by('pk').values_list('pk', flat=True)))  # type: ignore
+
+    def test_only_operations_without_a_live_worker_or_job_count_as_stalled(self):
+        queued = self.make_operation(bulk_jobs.BULK_DELETE)
+        bulk_jobs.start_operation(queued)
+        never_queued = self.make_operation(bulk_jobs.BULK_DELETE)
+        running = self.make_operation(bulk_jobs.EXPORT)
+        abandoned = self.make_operation(bulk_jobs.EXPORT)
+        BulkUserOperation.objects.filter(pk=running.pk).update(  # type: ignore
+            status='PROCESSING', heartbeat_at=timezone.now()
+        )
+        BulkUserOperation.objects.filter(pk=abandoned.pk).update(  # type: ignore
+            status='PROCESSING', heartbeat_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        self.assertEqual(bulk_jobs.stalled_operations(), [never_queued.pk, abandoned.pk])
+
+    def test_deletes_and_role_changes_leave_out_users_the_initiator_cannot_manage(self):
+        sub_admin = make_user('9000000041', role='SUB_ADMIN', society=self.society)
+        peer = make_user('9000000042', role='SUB_ADMIN', society=self.society)
+        members = [make_user(f'900000005{i}', society=self.society) for i in range(2)]
+        requested = [self.admin.pk, peer.pk] + [member.pk for member in members]
+        for operation_type, parameters in ((bulk_jobs.ROLE_CHANGE, {'to_role': 'STAFF'}), (bulk_jobs.BULK_DELETE, {})):
+            with self.subTest(operation_type=operation_type):
+                operation = BulkUserOperation.objects.create(  # type: ignore
+                    operation_type=operation_type, initiated_by=sub_admin, society=self.society,
+                    parameters={'user_ids': requested, **parameters},
+                )
+                operation = bulk_jobs.run_operation(operation.pk)
+                self.assertEqual((operation.status, operation.total_records, operation.successful_records),
+                                 ('COMPLETED', 2, 2))
+                self.assertIn(f'Skipped users whose role you cannot manage: {self.admin.pk}, {peer.pk}',
+                              operation.error_log)
+        self.assertEqual(
+            list(User.objects.filter(pk__in=requested).order_by('pk').values_list('role', 'is_active')),  # type: ignore
+            [('ADMIN', True), ('SUB_ADMIN', True), ('STAFF', False), ('STAFF', False)],
+        )
+
+
+@override_settings(BULK_IMPORT_HASH_WORKERS=1)
+class UserImportTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.society = make_society()
+        self.admin = make_user('9000000070', role='ADMIN', society=self.society)
+        counters.recount([self.society.pk])
+
+    def run_import(self, text, size=2):
+        path = default_storage.save('imports/users.csv', ContentFile(text.encode()))
+        operation = BulkUserOperation.objects.create(  # type: ignore
+            operation_type='IMPORT', initiated_by=self.admin, society=self.society, file_path=path, status='PENDING',
+        )
+        return user_import.run_import(operation.pk, size=size)
+
+    def test_imports_aliased_columns_and_reports_rejected_rows(self):
+        make_user('9000000071')
+        operation = self.run_import(
+            'Mobile No,E-mail ID,First Name,Surname,User Type,Password\n'
+            '98765 43210,Asha@Example.com,Asha,Rao,,pass-word-1\n'
+            '12ab,,Bad,Phone,,\n'
+            '9876543210,,Same,Phone,,\n'
+            '9123456780,9000000071@Example.com,Taken,Email,,\n'
+            '9123456781,,Not,Allowed,admin,\n'
+            '9123456782,,Gate,Keeper,staff,\n'
+        )
+        self.assertEqual((operation.status, operation.total_records, operation.successful_records,
+                          operation.failed_records), ('COMPLETED', 6, 2, 4))
+        self.assertEqual(operation.error_log.splitlines(), [
+            'Row 3: Invalid phone number "12ab"',
+            'Row 4: Phone number 9876543210 already exists',
+            'Row 5: Email 9000000071@example.com already exists',
+            'Row 6: Role ADMIN cannot be imported',
+        ])
+        asha = User.objects.get(phone_number='9876543210')  # type: ignore
+        self.assertEqual((asha.email, asha.last_name, asha.role, asha.society_id), (
+            'asha@example.com', 'Rao', 'MEMBER', self.society.pk))
+        self.assertTrue(asha.check_password('pass-word-1'))
+        self.assertFalse(User.objects.get(phone_number='9123456782').has_usable_password())  # type: ignore
+        self.assertEqual(
+            SocietyCounters.objects.values('users', 'members', 'staff').get(pk=self.society.pk),  # type: ignore
+            {'users': 3, 'members': 1, 'staff': 1},
+        )
+
+    def test_error_log_is_capped_but_failures_are_all_counted(self):
+        with mock.patch.object(user_import, 'MAX_LOGGED_ERRORS', 2):
+            operation = self.run_import('phone\n' + 'x\n' * 5)
+        self.assertEqual((operation.failed_records, len(operation.error_log.splitlines())), (5, 2))
+
+    def test_clash_with_a_concurrent_insert_falls_back_to_row_by_row(self):
+        make_user('9123456780')
+        # As if the clashing user was inserted after the batch was checked
+        unchecked = {field: set() for field in user_import.UNIQUE_FIELDS}
+        with mock.patch.object(user_import, '_existing', return_value=unchecked):
+            operation = self.run_import('phone\n9123456780\n9123456781\n')
+        self.assertEqual((operation.successful_records, operation.failed_records), (1, 1))
+        self.assertEqual(operation.error_log, 'Row 2: Phone number, email, Aadhaar or PAN already exists\n')
+        self.assertTrue(User.objects.filter(phone_number='9123456781').exists())  # type: ignore
+
+    def test_file_without_a_phone_column_fails_the_operation(self):
+        operation = self.run_import('name,email\nAsha,asha@example.com\n')
+        self.assertEqual((operation.status, operation.error_log), ('FAILED', 'The file has no phone number column\n'))
+
+
+class OTPStoreTests:
+    """Behaviour both OTP stores must share; mixed into a TestCase per backend"""
+
+    def setUp(self):
+        cache.clear()
+        codes = iter(['111111', '222222', '333333'])
+        self.enterContext(mock.patch.object(OTP, 'generate_otp', side_effect=lambda *args: next(codes)))
+
+    def later(self, seconds):
+        """Move both clocks the stores read ``seconds`` ahead"""
+        stack = contextlib.ExitStack()
+        now, wall = timezone.now(), time.time()
+        stack.enter_context(mock.patch('django.utils.timezone.now', return_value=now + datetime.timedelta(seconds=seconds)))
+        stack.enter_context(mock.patch.object(locmem.time, 'time', return_value=wall + seconds))
+        return stack
+
+    def test_code_verifies_once(self):
+        issued = otp_store.issue('9000000110', 'LOGIN')
+        verified = otp_store.verify('9000000110', issued.otp_code, 'LOGIN')
+        self.assertEqual((verified.phone_number, verified.purpose), ('9000000110', 'LOGIN'))
+        self.assertIsNotNone(verified.verified_at)
+        self.assertIsNone(otp_store.verify('9000000110', issued.otp_code, 'LOGIN'))
+
+    def test_wrong_code_purpose_or_phone_is_rejected(self):
+        issued = otp_store.issue('9000000110', 'LOGIN')
+        self.assertIsNone(otp_store.verify('9000000110', '999999', 'LOGIN'))
+        self.assertIsNone(otp_store.verify('9000000110', issued.otp_code, 'FORGOT_PASSWORD'))
+        self.assertIsNone(otp_store.verify('9000000111', issued.otp_code, 'LOGIN'))
+        self.assertIsNotNone(otp_store.verify('9000000110', issued.otp_code, 'LOGIN'))
+
+    def test_new_code_invalidates_the_previous_one(self):
+        first = otp_store.issue('9000000110', 'LOGIN')
+        second = otp_store.issue('9000000110', 'LOGIN')
+        self.assertIsNone(otp_store.verify('9000000110', first.otp_code, 'LOGIN'))
+        self.assertIsNotNone(otp_store.verify('9000000110', second.otp_code, 'LOGIN'))
+
+    def test_expired_code_is_rejected(self):
+        issued = otp_store.issue('9000000110', 'LOGIN')
+        with self.later(otp_store.ttl_seconds() + 1):
+            self.assertIsNone(otp_store.verify('9000000110', issued.otp_code, 'LOGIN'))
+
+
+@override_settings(OTP_BACKEND='database')
+class DatabaseOTPStoreTests(OTPStoreTests, TestCase):
+    pass
+
+
+@override_settings(OTP_BACKEND='cache')
+class CacheOTPStoreTests(OTPStoreTests, TestCase):
+    def test_codes_never_touch_the_database(self):
+        with self.assertNumQueries(0):
+            issued = otp_store.issue('9000000110', 'LOGIN')
+            self.assertIsNotNone(otp_store.verify('9000000110', issued.otp_code, 'LOGIN'))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.society = make_society()
+        self.staff = make_user('9000000120', role='STAFF', society=self.society)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.staff)
+        first, second = timezone.now() - datetime.timedelta(hours=1), timezone.now()
+        for index in range(7):
+            log = GateUpdateLog.objects.create(  # type: ignore
+                society=self.society, update_type='ENTRY', person_name=f'Visitor {index}', logged_by=self.staff,
+            )
+            # Several rows per timestamp, so pages split inside a tie
+            GateUpdateLog.objects.filter(pk=log.pk).update(timestamp=first if index < 3 else second)  # type: ignore
+        self.expected = list(GateUpdateLog.objects.order_by('-timestamp', '-id').values_list('pk', flat=True))  # type: ignore
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_walks_forward_and_back_across_timestamp_ties(self):
+        forward = self.walk('/api/gate-logs/?page_size=2', 'next')
+        self.assertEqual([len(page) for page in forward], [2, 2, 2, 1])
+        self.assertEqual(sum(forward, []), self.expected)
+
+        last = self.client.get('/api/gate-logs/?page_size=2')
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        backward = self.walk(last.data['previous'], 'previous')
+        self.assertEqual(sum(reversed(backward), []), self.expected[:6])
+
+    def test_orders_by_created_at_with_ties_by_default(self):
+        societies = [self.society] + [make_society(f'Society {index}') for index in range(4)]
+        Society.objects.update(created_at=timezone.now())  # type: ignore
+        factory, paginator, seen, cursor = APIRequestFactory(), KeysetPagination(), [], ''
+        while True:
+            request = Request(factory.get('/', {'page_size': 2, 'cursor': cursor} if cursor else {'page_size': 2}))
+            seen += [society.pk for society in paginator.paginate_queryset(Society.objects.all(), request)]  # type: ignore
+            if paginator.next_key is None:
+                break
+            cursor = paginator.encode_cursor(paginator.next_key, False)
+        self.assertEqual(seen, sorted((society.pk for society in societies), reverse=True))
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ('not-a-cursor', 'eyJrIjpbMV0sInIiOjB9'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/api/gate-logs/?cursor={cursor}').status_code, 404)
+        request = Request(APIRequestFactory().get('/', {'cursor': 'x'}))
+        with self.assertRaises(NotFound):
+            KeysetPagination().paginate_queryset(Society.objects.all(), request)  # type: ignore
+
+    def test_page_parameter_keeps_the_page_number_response(self):
+        response = self.client.get('/api/gate-logs/?page=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual([row['id'] for row in response.data['results']], self.expected)
+        self.assertEqual(self.client.get('/api/gate-logs/?page=2').status_code, 404)
+
+    def test_approximate_count(self):
+        response = self.client.get('/api/gate-logs/?page_size=2&count=approximate')
+        self.assertEqual((response.data['approximate_count'], len(response.data['results'])), (7, 2))
+        self.assertNotIn('approximate_count', self.client.get('/api/gate-logs/').data)
+
+
+class OTPThrottleTests(TestCase):
+    url = '/api/auth/login-otp-step1/'
+
+    def setUp(self):
+        cache.clear()
+        throttling.clear_local_blocks()
+        self.addCleanup(throttling.clear_local_blocks)
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def rates(self, **rates):
+        return override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates},
+        })
+
+    def send(self, phone_number, ip='10.0.0.1'):
+        return self.client.post(self.url, {'phone_number': phone_number}, REMOTE_ADDR=ip)
+
+    def assertThrottled(self, response, budget_seconds):
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= budget_seconds)
+
+    def test_phone_budget(self):
+        with self.rates(otp_send_ip='100/hour', otp_send_phone='2/hour'):
+            self.assertEqual([self.send('98765 43210').status_code for _ in range(2)], [404, 404])
+            # The same number reformatted or from another address shares the budget
+            self.assertThrottled(self.send('9876543210', ip='10.0.0.2'), 1800)
+            with self.assertNumQueries(0):
+                self.assertThrottled(self.send('9876543210'), 1800)
+            self.assertEqual(self.send('9876500000').status_code, 404)
+
+    def test_ip_budget(self):
+        with self.rates(otp_send_ip='3/hour', otp_send_phone='100/hour'):
+            self.assertEqual([self.send(f'900000000{index}').status_code for index in range(3)], [404] * 3)
+            with self.assertNumQueries(0):
+                self.assertThrottled(self.send('9000000009'), 1200)
+                # Turned away from the local blocklist this time
+                self.assertThrottled(self.send('9000000008'), 1200)
+            self.assertEqual(self.send('9000000009', ip='10.0.0.2').status_code, 404)
+
+    def test_bucket_refills(self):
+        with self.rates(otp_send_ip='100/hour', otp_send_phone='1/hour'):
+            with mock.patch.object(throttling.TokenBucketThrottle, 'timer', return_value=1000.0):
+                self.assertEqual(self.send('9000000001').status_code, 404)
+                self.assertThrottled(self.send('9000000001'), 3600)
+            with mock.patch.object(throttling.TokenBucketThrottle, 'timer', return_value=1000.0 + 3600):
+                self.assertEqual(self.send('9000000001').status_code, 404)
+
+
+class TokenVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.society = make_society()
+        self.user = make_user('9000000020', society=self.society)
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def get_profile(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return self.client.get('/api/auth/profile/')
+
+    def use_refresh(self, refresh):
+        return self.client.post('/api/auth/token/refresh/', {'refresh': str(refresh)}, format='json')
+
+    def test_role_change_applies_to_tokens_already_issued(self):
+        access = str(self.refresh.access_token)
+        self.assertEqual(self.get_profile(access).data['role'], 'MEMBER')
+
+        user = User.objects.get(pk=self.user.pk)  # type: ignore
+        user.role = 'ADMIN'
+        user.save()
+        self.assertEqual(user.token_version, self.user.token_version + 1)
+        self.assertEqual(self.get_profile(access).data['role'], 'ADMIN')
+
+        refreshed = self.use_refresh(self.refresh)
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertEqual(RefreshToken(refreshed.data['refresh'])['role'], 'ADMIN')
+
+    def test_password_change_rejects_tokens_already_issued(self):
+        access = str(self.refresh.access_token)
+        self.assertEqual(self.get_profile(access).status_code, 200)
+
+        user = User.objects.get(pk=self.user.pk)  # type: ignore
+        user.set_password('another-pass-2')
+        user.save()
+        self.assertEqual(self.get_profile(access).status_code, 401)
+        self.client.credentials()
+        self.assertEqual(self.use_refresh(self.refresh).status_code, 401)
+
+        fresh = RefreshToken.for_user(user)
+        self.assertEqual(self.get_profile(str(fresh.access_token)).status_code, 200)
+
+    def test_saves_that_leave_claims_and_password_alone_keep_tokens_current(self):
+        user = User.objects.get(pk=self.user.pk)  # type: ignore
+        user.first_name = 'Ravi'
+        user.save()
+        user.set_password('another-pass-2')
+        user.save(update_fields=['first_name'])
+        user.refresh_from_db()
+        self.assertEqual(user.token_version, self.user.token_version)
+
+
+class RevocationTests(TestCase):
+    def setUp(self):
+        revocation._store = None
+        self.user = make_user('9000000030', society=make_society())
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def tearDown(self):
+        revocation._store = None
+
+    def use_refresh(self, refresh):
+        return self.client.post('/api/auth/token/refresh/', {'refresh': str(refresh)}, format='json')
+
+    def test_rotated_refresh_token_cannot_be_replayed(self):
+        refresh = RefreshToken.for_user(self.user)
+        rotated = self.use_refresh(refresh)
+        self.assertEqual(rotated.status_code, 200)
+        self.assertEqual(self.use_refresh(refresh).status_code, 401)
+        self.assertEqual(self.use_refresh(rotated.data['refresh']).status_code, 200)
+
+    def test_logged_out_refresh_token_is_rejected(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post('/api/auth/logout/', {'refresh': str(refresh)}, format='json').status_code, 200)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.use_refresh(refresh).status_code, 401)
+
+    @override_settings(REVOCATION_SYNC_INTERVAL=30)
+    def test_filters_pick_up_tokens_revoked_by_another_process(self):
+        here, other = revocation.RevocationStore(), revocation.RevocationStore()
+        refresh = RefreshToken.for_user(self.user)
+        jti, expires = refresh['jti'], refresh['exp']
+        self.assertFalse(here.is_revoked(jti, expires))
+
+        other.revoke(jti, expires)
+        self.assertTrue(other.is_revoked(jti, expires))
+        # Until its next sync this process does not know; rotation still fails on the insert
+        self.assertFalse(here.is_revoked(jti, expires))
+        with self.assertRaises(TokenError):
+            here.revoke(jti, expires)
+
+        here._synced_at -= here.sync_interval
+        self.assertTrue(here.is_revoked(jti, expires))
+        unrevoked = RefreshToken.for_user(self.user)
+        with self.assertNumQueries(0):
+            self.assertFalse(here.is_revoked(unrevoked['jti'], unrevoked['exp']))
+
+
+class FlatLedgerTests(TestCase):
+    def setUp(self):
+        self.society = make_society()
+        self.owner = make_user('9000000004', society=self.society)
+        self.flat = make_flats(self.society, 1, owner=self.owner)[0]
+
+    def make_bill(self, amount='2000.00', month=3):
+        return MaintenanceBill.objects.create(  # type: ignore
+            flat=self.flat, amount=Decimal(amount), due_date=datetime.date(2026, month, 5),
+            billing_period_start=datetime.date(2026, month, 1), billing_period_end=datetime.date(2026, month, 28),
+        )
+
+    def balance(self):
+        return FlatBalance.objects.get(flat=self.flat)  # type: ignore
+
+    def entries(self):
+        return list(LedgerEntry.objects.filter(flat=self.flat).order_by('id').values_list('entry_type', 'amount'))  # type: ignore
+
+    def test_bill_saves_post_only_the_difference(self):
+        bill = self.make_bill()
+        bill.amount = Decimal('2500.00')
+        bill.save()
+        bill.status = 'PAID'
+        bill.save()
+        bill.save()
+
+        self.assertEqual(self.entries(), [
+            ('CHARGE', Decimal('2000.00')), ('ADJUSTMENT', Decimal('500.00')), ('PAYMENT', Decimal('-2500.00')),
+        ])
+        balance = self.balance()
+        self.assertEqual((balance.balance, balance.total_charged, balance.total_paid),
+                         (Decimal('0.00'), Decimal('2500.00'), Decimal('2500.00')))
+
+    def test_balance_after_is_a_running_balance(self):
+        self.make_bill('1000.00')
+        self.make_bill('500.00', month=4)
+        self.assertEqual(
+            list(LedgerEntry.objects.filter(flat=self.flat).order_by('id').values_list('balance_after', flat=True)),  # type: ignore
+            [Decimal('1000.00'), Decimal('1500.00')]
+        )
+
+    def test_deleting_a_bill_reverses_its_entries(self):
+        bill = self.make_bill()
+        bill.status = 'PAID'
+        bill.save()
+        bill.delete()
+        self.assertEqual(self.balance().balance, Decimal('0.00'))
+        self.assertEqual(self.balance().total_charged, Decimal('0.00'))
+
+    def test_rebuild_matches_the_incremental_ledger(self):
+        bill = self.make_bill()
+        bill.late_fee = Decimal('100.00')
+        bill.save()
+        before = self.balance()
+        ledger.rebuild([self.flat.pk])
+        after = self.balance()
+        self.assertEqual((after.balance, after.total_charged, after.total_paid),
+                         (before.balance, before.total_charged, before.total_paid))
+        self.assertEqual(after.balance, Decimal('2100.00'))
+
+    def test_statement_rejects_bad_dates(self):
+        self.make_bill()
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(self.owner)
+        url = f'/api/flats/{self.flat.pk}/statement/'
+        self.assertEqual(client.get(url, {'from': 'yesterday'}).status_code, 400)
+        self.assertEqual(client.get(url, {'to': '2026-02-30'}).status_code, 400)
+        response = client.get(url, {'from': '2000-01-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class ReadStatementTests(TestCase):
+    def credits(self, text):
+        return [(row.amount, row.transaction_id) for _, row in read_statement(io.StringIO(text))
+                if isinstance(row, StatementRow)]
+
+    def test_reads_only_the_credit_column(self):
+        text = 'Date,Narration,Ref No,Debit,Credit\n' \
+               '01/03/2026,NEFT A-101,UTR1,,"2,000.00"\n' \
+               '02/03/2026,Lift AMC,UTR2,5000.00,\n'
+        self.assertEqual(self.credits(text), [(Decimal('2000.00'), 'UTR1')])
+
+    def test_plain_amount_column_needs_a_dr_cr_indicator(self):
+        with self.assertRaises(ValueError):
+            list(read_statement(io.StringIO('Date,Narration,Amount\n01/03/2026,A-101,2000\n')))
+
+        text = 'Date,Narration,Ref No,Amount,Dr/Cr\n' \
+               '01/03/2026,A-101,UTR1,2000.00,CR\n' \
+               '02/03/2026,A-102,UTR2,2000.00,DR\n' \
+               '03/03/2026,A-103,UTR3,2000.00,\n'
+        self.assertEqual(self.credits(text), [(Decimal('2000.00'), 'UTR1')])
+
+    def test_malformed_csv_is_a_value_error(self):
+        with self.assertRaises(ValueError):
+            # A field over the csv module's size limit
+            list(read_statement(io.StringIO('Date,Narration,Credit\n01/03/2026,"%s",10\n' % ('x' * 200000))))
+
+
+class ReconcileStatementTests(TestCase):
+    def setUp(self):
+        self.society = make_society()
+        self.flat = make_flats(self.society, 1)[0]
+        self.bills = [
+            MaintenanceBill.objects.create(  # type: ignore
+                flat=self.flat, amount=Decimal('2000.00'), due_date=datetime.date(2026, month, 5),
+                billing_period_start=datetime.date(2026, month, 1), billing_period_end=datetime.date(2026, month, 28),
+            )
+            for month in (3, 4)
+        ]
+
+    def reconcile(self, text):
+        return reconcile_statement(self.society, io.StringIO(text))
+
+    def test_pays_the_bill_due_first_and_posts_the_payment(self):
+        result = self.reconcile('Date,Narration,Ref No,Credit\n10/03/2026,MAINT A-101,UTR 555,2000\n')
+        self.assertEqual(result.matched['reference'], 1)
+        first, second = (MaintenanceBill.objects.get(pk=bill.pk) for bill in self.bills)  # type: ignore
+        self.assertEqual((first.status, first.payment_mode, first.transaction_id), ('PAID', 'ONLINE', 'UTR 555'))
+        self.assertEqual(second.status, 'PENDING')
+        self.assertEqual(FlatBalance.objects.get(flat=self.flat).balance, Decimal('2000.00'))  # type: ignore
+
+    def test_reimporting_a_statement_pays_nothing_twice(self):
+        statement = 'Date,Narration,Ref No,Credit\n10/03/2026,MAINT A-101,UTR 555,2000\n'
+        self.reconcile(statement)
+        # Same credit, reference formatted differently by another export
+        result = self.reconcile(statement.replace('UTR 555', 'utr-555'))
+        self.assertEqual((result.already_reconciled, sum(result.matched.values())), (1, 0))
+        self.assertEqual(MaintenanceBill.objects.get(pk=self.bills[1].pk).status, 'PENDING')  # type: ignore
+
+    def test_transaction_id_recorded_on_a_paid_bill_is_not_reused(self):
+        MaintenanceBill.objects.filter(pk=self.bills[0].pk).update(status='PAID', transaction_id='UTR-777')  # type: ignore
+        result = self.reconcile('Date,Narration,Ref No,Credit\n10/03/2026,A-101,utr 777,2000\n')
+        self.assertEqual(result.already_reconciled, 1)
+        self.assertEqual(MaintenanceBill.objects.get(pk=self.bills[1].pk).status, 'PENDING')  # type: ignore
+
+    def test_debits_never_pay_bills(self):
+        result = self.reconcile('Date,Narration,Ref No,Amount,Dr/Cr\n10/03/2026,A-101,UTR9,2000,DR\n')
+        self.assertEqual((result.credits, sum(result.matched.values())), (0, 0))
+        self.assertFalse(MaintenanceBill.objects.filter(status='PAID').exists())  # type: ignore
+
+    def test_upload_returns_unmatched_rows_and_rejects_malformed_files(self):
+        admin = make_user('9000000005', role='ADMIN', society=self.society)
+        AdminSociety.objects.create(admin=admin, society=self.society)  # type: ignore
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(admin)
+
+        upload = SimpleUploadedFile('statement.csv', b'Date,Narration,Ref No,Credit\n10/03/2026,Z-999,UTR1,12\n')
+        response = client.post('/api/bills/reconcile/', {'file': upload, 'society': self.society.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('unmatched_report', response.data)
+        self.assertEqual(response.data['unmatched_columns'], ['Date', 'Narration', 'Ref No', 'Credit', 'reason'])
+        self.assertEqual(response.data['unmatched_rows'][0][:4], ['10/03/2026', 'Z-999', 'UTR1', '12'])
+        self.assertFalse(response.data['unmatched_rows_truncated'])
+
+        lines = ''.join(f'10/03/2026,Z-{i},UTR{i},12\n' for i in range(150))
+        upload = SimpleUploadedFile('statement.csv', ('Date,Narration,Ref No,Credit\n' + lines).encode())
+        response = client.post('/api/bills/reconcile/', {'file': upload, 'society': self.society.pk})
+        self.assertEqual((len(response.data['unmatched_rows']), response.data['unmatched_rows_truncated']), (100, True))
+
+        upload = SimpleUploadedFile('statement.csv', ('Date,Narration,Ref No,Credit\n' + lines).encode())
+        response = client.post('/api/bills/reconcile/', {'file': upload, 'society': self.society.pk, 'unmatched_csv': True})
+        self.assertEqual((response.status_code, response['Content-Type'], response['X-Unmatched-Rows']),
+                         (200, 'text/csv', '150'))
+        report = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual((report[0], len(report)), ('Date,Narration,Ref No,Credit,reason', 151))
+        response.close()
+
+        upload = SimpleUploadedFile('statement.csv', b'Date,Narration,Credit\n01/03/2026,"%s",10\n' % (b'x' * 200000))
+        response = client.post('/api/bills/reconcile/', {'file': upload, 'society': self.society.pk})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,171 @@
+"""
+Token bucket throttles for the public (``AllowAny``) auth, registration and search views.
+
+Each endpoint class has two budgets, one per client IP and one per phone number in the
+request body, set as DRF rates in ``DEFAULT_THROTTLE_RATES``: ``'5/hour'`` is a bucket
+of 5 tokens that refills at 5 per hour, so short bursts pass while sustained traffic is
+held to the rate. Buckets live in the ``THROTTLE_CACHE_ALIAS`` cache, which must be
+shared between processes (e.g. Redis) for the budgets to be global.
+
+A rejected key is also remembered in the process until its bucket has a token again;
+repeated requests from it are turned away without a cache round trip. Buckets only
+ever gain tokens with time, so this never rejects a request the shared bucket would
+have let through.
+
+Reading and updating a bucket are two cache calls, so concurrent requests may overdraw
+it by a token or two, as with DRF's own throttles.
+
+Throttles run before the view body, so rejected requests do no ORM work, and DRF
+answers them with 429 and a ``Retry-After`` header. A scope whose rate is None is not
+throttled.
+"""
+import math
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+LOCAL_BLOCKLIST_SIZE = 10000
+
+_blocked = OrderedDict()
+_blocked_lock = threading.Lock()
+
+
+def _blocked_for(key, now):
+    """Seconds ``key`` is still known to be out of tokens in this process"""
+    until = _blocked.get(key)
+    if until is None:
+        return 0
+    if until <= now:
+        with _blocked_lock:
+            _blocked.pop(key, None)
+        return 0
+    return until - now
+
+
+def _block(key, until):
+    with _blocked_lock:
+        _blocked[key] = until
+        _blocked.move_to_end(key)
+        while len(_blocked) > LOCAL_BLOCKLIST_SIZE:
+            _blocked.popitem(last=False)
+
+
+def clear_local_blocks():
+    with _blocked_lock:
+        _blocked.clear()
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """A bucket of ``num_requests`` tokens refilled evenly over ``duration`` seconds"""
+
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+    def get_rate(self):
+        # Read the rates on every request rather than once at import, so they follow
+        # settings overrides
+        self.THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+        return super().get_rate()
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        self.retry_after = _blocked_for(self.key, self.now)
+        if self.retry_after:
+            return False
+
+        refill = self.num_requests / self.duration
+        state = self.cache.get(self.key)
+        if state is None:
+            tokens = self.num_requests
+        else:
+            tokens = min(self.num_requests, state[0] + (self.now - state[1]) * refill)
+        if tokens < 1:
+            self.retry_after = (1 - tokens) / refill
+            _block(self.key, self.now + self.retry_after)
+            return False
+        # An untouched bucket is full again after ``duration``, so it can be forgotten then
+        self.cache.set(self.key, (tokens - 1, self.now), math.ceil(self.duration))
+        return True
+
+    def wait(self):
+        return getattr(self, 'retry_after', None)
+
+
+class IPThrottle(TokenBucketThrottle):
+    """Budget per client IP"""
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class PhoneNumberThrottle(TokenBucketThrottle):
+    """Budget per phone number in the request body; requests without one are not counted"""
+
+    def get_cache_key(self, request, view):
+        try:
+            phone_number = request.data.get('phone_number')
+        except AttributeError:
+            return None
+        phone_number = re.sub(r'[\s\-().]', '', str(phone_number or ''))
+        if not phone_number:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': phone_number[:32]}
+
+
+class OTPSendIPThrottle(IPThrottle):
+    scope = 'otp_send_ip'
+
+
+class OTPSendPhoneThrottle(PhoneNumberThrottle):
+    scope = 'otp_send_phone'
+
+
+class OTPVerifyIPThrottle(IPThrottle):
+    scope = 'otp_verify_ip'
+
+
+class OTPVerifyPhoneThrottle(PhoneNumberThrottle):
+    scope = 'otp_verify_phone'
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = 'login_ip'
+
+
+class LoginPhoneThrottle(PhoneNumberThrottle):
+    scope = 'login_phone'
+
+
+class RegistrationIPThrottle(IPThrottle):
+    scope = 'registration_ip'
+
+
+class RegistrationPhoneThrottle(PhoneNumberThrottle):
+    scope = 'registration_phone'
+
+
+class SearchIPThrottle(IPThrottle):
+    scope = 'search_ip'
+
+
+# Throttles per endpoint class, for @throttle_classes
+OTP_SEND_THROTTLES = [OTPSendIPThrottle, OTPSendPhoneThrottle]
+OTP_VERIFY_THROTTLES = [OTPVerifyIPThrottle, OTPVerifyPhoneThrottle]
+LOGIN_THROTTLES = [LoginIPThrottle, LoginPhoneThrottle]
+REGISTRATION_THROTTLES = [RegistrationIPThrottle, RegistrationPhoneThrottle]
+SEARCH_THROTTLES = [SearchIPThrottle]
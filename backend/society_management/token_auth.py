@@ -0,0 +1,177 @@
+"""
+JWT authentication from token claims, without loading the user row per request.
+
+Tokens issued through ``RefreshToken.for_user`` here carry the user's role, society id,
+approval and staff/superuser flags, ``User.token_version`` as ``ver`` and a digest of the
+password hash as ``pwd``. The version is bumped whenever one of those changes, the
+password is changed or the user is deactivated: ``User.save()`` does it for instance
+saves, and bulk ``update()`` callers use ``bump_token_versions``.
+
+``ClaimsJWTAuthentication`` compares a token's ``ver`` with the user's current version,
+which is cached in the shared Django cache for ``TOKEN_VERSION_CACHE_TIMEOUT`` seconds
+(and dropped when bumped). When they match, ``request.user`` is a ``User`` built from the
+claims: it works for permission checks, foreign key assignment and ``society_id``
+filters without a query, and loads the rest of its row in one query the first time any
+other field is read. Saving it only writes the fields it has loaded. When the version is
+stale, or the token predates these claims, the user is loaded from the database as
+before, so role changes and deactivations apply to existing tokens at once. A loaded
+user whose password digest no longer matches the token's is rejected, as Django drops
+sessions on a password change.
+
+``ClaimsTokenRefreshSerializer`` re-reads stale claims when a refresh token is used, so
+a refreshed access token is current again; refresh tokens issued before a password
+change are rejected the same way. Refresh tokens are revoked on rotation and
+logout through ``revocation.py``.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import F
+from django.utils.crypto import constant_time_compare
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+from . import revocation
+
+
+VERSION_CLAIM = 'ver'
+
+PASSWORD_CLAIM = 'pwd'
+
+# Token claim -> User attribute
+CLAIMS = {
+    'role': 'role',
+    'society_id': 'society_id',
+    'approved': 'is_approved',
+    'staff': 'is_staff',
+    'superuser': 'is_superuser',
+    VERSION_CLAIM: 'token_version',
+}
+
+# User attributes whose change makes issued tokens stale
+VERSIONED_FIELDS = ('role', 'society_id', 'is_active', 'is_approved', 'is_staff', 'is_superuser')
+
+VERSION_CACHE_KEY = 'user-token-version:{user_id}'
+
+
+def _cache_timeout():
+    return getattr(settings, 'TOKEN_VERSION_CACHE_TIMEOUT', 300)
+
+
+def password_digest(user):
+    """Short HMAC of the user's password hash; changes whenever the password does"""
+    return user.get_session_auth_hash()[:16]
+
+
+def user_claims(user):
+    claims = {claim: getattr(user, attname) for claim, attname in CLAIMS.items()}
+    claims[PASSWORD_CLAIM] = password_digest(user)
+    return claims
+
+
+def check_password_claim(token, user):
+    """``AuthenticationFailed`` if the password of ``user`` changed after ``token`` was issued"""
+    issued = token.get(PASSWORD_CLAIM)
+    if issued is not None and not constant_time_compare(issued, password_digest(user)):
+        raise AuthenticationFailed('Password changed since the token was issued', code='password_changed')
+
+
+def bump_token_versions(user_ids):
+    """Make every token issued to ``user_ids`` so far stale"""
+    from .models import User
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    User.objects.filter(pk__in=user_ids).update(token_version=F('token_version') + 1)  # type: ignore
+    keys = [VERSION_CACHE_KEY.format(user_id=user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    # A request that read the old version before the commit may have cached it again
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def claims_user(token):
+    """The token's user with only its claims loaded; other fields load on first use"""
+    from .models import User
+
+    values = {attname: token[claim] for claim, attname in CLAIMS.items()}
+    values.update(id=token[api_settings.USER_ID_CLAIM], is_active=True)
+    fields = [f.attname for f in User._meta.concrete_fields if f.attname in values]  # type: ignore
+    user = User.from_db(router.db_for_read(User), fields, [values[attname] for attname in fields])
+    user._from_claims = True
+    return user
+
+
+class RefreshToken(BaseRefreshToken):
+    """Refresh token whose access tokens carry the user's claims, revocable through ``revocation.py``"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.payload.update(user_claims(user))
+        return token
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if revocation.is_revoked(self.payload[api_settings.JTI_CLAIM], self.payload['exp']):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        """Revoke this token; ``TokenError`` if it already was"""
+        revocation.revoke(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that trusts current claims instead of selecting the user"""
+
+    def get_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token or any(claim not in validated_token for claim in CLAIMS):
+            return self.load_user(validated_token)
+
+        key = VERSION_CACHE_KEY.format(user_id=validated_token[api_settings.USER_ID_CLAIM])
+        version = cache.get(key)
+        if version is None:
+            user = self.load_user(validated_token)
+            cache.set(key, user.token_version, _cache_timeout())
+            return user
+        if version != validated_token[VERSION_CLAIM]:
+            return self.load_user(validated_token)
+        # A password change bumps the version, so current claims mean the same password
+        return claims_user(validated_token)
+
+    def load_user(self, validated_token):
+        user = super().get_user(validated_token)
+        check_password_claim(validated_token, user)
+        return user
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that re-reads the user's claims when the token's are stale"""
+
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        from .models import User
+
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        current = User.objects.filter(pk=user_id).first()  # type: ignore
+        if current is None or not current.is_active:
+            raise AuthenticationFailed('User is inactive or no longer exists', code='user_inactive')
+        check_password_claim(refresh.payload, current)
+        if refresh.payload.get(VERSION_CLAIM) != current.token_version:
+            refresh.payload.update(user_claims(current))
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                # Fails if the token was already rotated, also by a concurrent request
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
@@ -87,7 +87,23 @@ urlpatterns = [
     # Enhanced user management endpoints
     path('users/bulk-import/', views.bulk_user_import, name='bulk_user_import'),
     path('users/bulk-update/', views.bulk_user_update, name='bulk_user_update'),
+    path('users/bulk-export/', views.bulk_user_export, name='bulk_user_export'),
+    path('users/bulk-delete/', views.bulk_user_delete, name='bulk_user_delete'),
+    path('users/bulk-role-change/', views.bulk_role_change, name='bulk_role_change'),
+    path('background-jobs/metrics/', views.job_metrics, name='job_metrics'),
+    path('background-jobs/<int:job_id>/', views.job_status, name='job_status'),
     path('dashboard/stats/', views.user_dashboard_stats, name='dashboard_stats'),
+    path('me/capabilities/', views.my_capabilities, name='my_capabilities'),
+    path('me/dues/', views.my_dues, name='my_dues'),
+    
+    # Billing endpoints
+    path('bills/split/', views.split_bill, name='split_bill'),
+    path('bills/reconcile/', views.import_bank_statement, name='import_bank_statement'),
+    
+    # Report endpoints (read from the daily rollup tables)
+    path('reports/billing/', views.billing_report, name='billing_report'),
+    path('reports/gates/', views.gate_report, name='gate_report'),
+    path('reports/amenities/', views.amenity_report, name='amenity_report'),
     
     # API endpoints
     path('', include(router.urls)),
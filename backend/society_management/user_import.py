@@ -0,0 +1,388 @@
+"""
+Bulk user import.
+
+``run_import`` processes the file of an IMPORT ``BulkUserOperation``. The CSV or XLSX
+file is streamed row by row (XLSX through openpyxl's read-only mode), so memory is
+bounded by ``BULK_IMPORT_BATCH_SIZE`` rows rather than the size of the file.
+
+Each batch is validated, checked for clashes with existing users in a single query
+over phone numbers, emails, Aadhaar and PAN numbers, and the clean rows are inserted
+with one ``bulk_create``. Passwords given in the file are hashed in a process pool of
+``BULK_IMPORT_HASH_WORKERS`` processes, since hashing dominates the cost of an import;
+rows without one get an unusable password and set it through the forgot-password OTP.
+
+The operation row is updated after every batch (records, successes, failures and an
+``error_log`` line per rejected row) so clients can poll progress on the
+``bulk-operations`` endpoint. ``bulk_create`` skips the User signals, so the society
+counters are adjusted here.
+"""
+import codecs
+import csv
+import datetime
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import counters, jobs
+
+
+# Header names as spreadsheets spell them, compared on lowercase alphanumerics only
+COLUMNS = {
+    'phone_number': ('phonenumber', 'phone', 'phoneno', 'mobile', 'mobileno', 'mobilenumber', 'contact'),
+    'email': ('email', 'emailid', 'emailaddress', 'mail'),
+    'first_name': ('firstname', 'first', 'givenname', 'name'),
+    'last_name': ('lastname', 'last', 'surname', 'familyname'),
+    'role': ('role', 'usertype'),
+    'password': ('password',),
+    'ownership_type': ('ownershiptype', 'ownership', 'ownertenant'),
+    'occupation': ('occupation', 'profession'),
+    'date_of_birth': ('dateofbirth', 'dob', 'birthdate'),
+    'emergency_contact_name': ('emergencycontactname', 'emergencycontact'),
+    'emergency_contact_phone': ('emergencycontactphone', 'emergencyphone'),
+    'aadhaar_number': ('aadhaarnumber', 'aadhaar', 'aadharnumber', 'aadhar', 'aadhaarno'),
+    'pan_number': ('pannumber', 'pan', 'panno'),
+}
+UNIQUE_FIELDS = ('phone_number', 'email', 'aadhaar_number', 'pan_number')
+DATE_FORMATS = ('%d-%m-%Y', '%d/%m/%Y')
+
+# Roles each initiator may create
+IMPORTABLE_ROLES = {
+    'ADMIN': ('SUB_ADMIN', 'MEMBER', 'STAFF'),
+    'SUB_ADMIN': ('MEMBER', 'STAFF'),
+}
+
+# error_log keeps the first rejections; the counts cover all of them
+MAX_LOGGED_ERRORS = 1000
+
+
+def batch_size():
+    return getattr(settings, 'BULK_IMPORT_BATCH_SIZE', 1000)
+
+
+def hash_workers():
+    return getattr(settings, 'BULK_IMPORT_HASH_WORKERS', os.cpu_count() or 1)
+
+
+def _init_hash_worker():
+    import django
+    django.setup()
+
+
+def _normalize(name):
+    return re.sub(r'[^a-z0-9]', '', str(name or '').lower())
+
+
+def _header_map(header):
+    """Column index per user field, from a header row"""
+    names = [_normalize(name) for name in header]
+    found = {}
+    for field, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                found[field] = names.index(alias)
+                break
+    if 'phone_number' not in found:
+        raise ValueError('The file has no phone number column')
+    return found
+
+
+def _csv_rows(path):
+    with default_storage.open(path, 'rb') as handle:
+        yield from csv.reader(codecs.iterdecode(handle, 'utf-8-sig'))
+
+
+def _xlsx_rows(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('Excel import needs openpyxl; upload the file as CSV instead')
+    with default_storage.open(path, 'rb') as handle:
+        workbook = load_workbook(handle, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield ['' if value is None else value for value in row]
+        finally:
+            workbook.close()
+
+
+def read_rows(path):
+    """Yield ``(line_number, {field: value})`` for each non-empty data row of an import file"""
+    rows = _xlsx_rows(path) if path.lower().endswith(('.xlsx', '.xlsm')) else _csv_rows(path)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('The file is empty')
+    columns = _header_map(header)
+    for line_number, raw in enumerate(rows, start=2):
+        if not any(str(value).strip() for value in raw):
+            continue
+        yield line_number, {
+            field: raw[index] if index < len(raw) else '' for field, index in columns.items()
+        }
+
+
+def count_rows(path):
+    return sum(1 for _ in read_rows(path))
+
+
+def _text(value):
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheet cells hold phone and ID numbers as floats
+        value = int(value)
+    return str(value if value is not None else '').strip()
+
+
+def _date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    value = _text(value)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    for date_format in DATE_FORMATS:
+        if parsed:
+            break
+        try:
+            parsed = datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    if parsed is None:
+        raise ValueError(f'Invalid date of birth "{value}"')
+    return parsed
+
+
+def clean_row(values, default_role, allowed_roles):
+    """Validated model field values for one row; raises ValueError with the reason"""
+    row = {field: _text(values.get(field)) for field in COLUMNS if field != 'date_of_birth'}
+    row['phone_number'] = re.sub(r'[\s\-()]', '', row['phone_number'])
+    if not re.fullmatch(r'\+?\d{7,15}', row['phone_number']):
+        raise ValueError(f'Invalid phone number "{row["phone_number"]}"')
+    row['email'] = row['email'].lower()
+    if row['email']:
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            raise ValueError(f'Invalid email "{row["email"]}"')
+    row['role'] = row['role'].upper().replace(' ', '_') or default_role
+    if row['role'] not in allowed_roles:
+        raise ValueError(f'Role {row["role"]} cannot be imported')
+    row['ownership_type'] = row['ownership_type'].upper()
+    if row['ownership_type'] not in ('', 'OWNER', 'TENANT'):
+        raise ValueError(f'Invalid ownership type "{row["ownership_type"]}"')
+    row['aadhaar_number'] = re.sub(r'\s', '', row['aadhaar_number'])
+    if row['aadhaar_number'] and not re.fullmatch(r'\d{12}', row['aadhaar_number']):
+        raise ValueError('Aadhaar number must be 12 digits')
+    row['pan_number'] = row['pan_number'].upper()
+    if row['pan_number'] and not re.fullmatch(r'[A-Z]{5}\d{4}[A-Z]', row['pan_number']):
+        raise ValueError(f'Invalid PAN "{row["pan_number"]}"')
+    row['date_of_birth'] = _date(values.get('date_of_birth'))
+    for field in ('first_name', 'last_name'):
+        row[field] = row[field][:150]
+    for field in ('ownership_type', 'occupation', 'emergency_contact_name', 'emergency_contact_phone',
+                  'aadhaar_number', 'pan_number'):
+        row[field] = row[field] or None
+    return row
+
+
+def _existing(rows):
+    """Unique values among ``rows`` already taken by users, in one query"""
+    from .models import User
+
+    wanted = {field: {row[field] for row in rows if row[field]} for field in UNIQUE_FIELDS}
+    condition = Q(phone_number__in=wanted['phone_number']) | Q(username__in=wanted['phone_number'])
+    for field in ('email', 'aadhaar_number', 'pan_number'):
+        if wanted[field]:
+            condition |= Q(**{f'{field}__in': wanted[field]})
+    taken = {field: set() for field in UNIQUE_FIELDS}
+    for found in User.objects.filter(condition).values_list('username', *UNIQUE_FIELDS):  # type: ignore
+        username, values = found[0], dict(zip(UNIQUE_FIELDS, found[1:]))
+        taken['phone_number'].update({username, values['phone_number']})
+        for field in ('email', 'aadhaar_number', 'pan_number'):
+            if values[field]:
+                taken[field].add(values[field].lower() if field == 'email' else values[field])
+    return taken
+
+
+def _hash_passwords(rows, get_pool):
+    passwords = [row.pop('password') for row in rows]
+    to_hash = [password for password in passwords if password]
+    pool = get_pool() if len(to_hash) > 1 else None
+    if pool is not None:
+        hashed = iter(pool.map(make_password, to_hash, chunksize=max(1, len(to_hash) // (hash_workers() * 4))))
+    else:
+        hashed = iter(make_password(password) for password in to_hash)
+    for row, password in zip(rows, passwords):
+        row['password'] = next(hashed) if password else make_password(None)
+
+
+def _insert(users):
+    """Insert a batch; on a clash with a concurrent insert, fall back to row by row"""
+    from .models import User
+
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create(users)  # type: ignore
+        return users, []
+    except IntegrityError:
+        pass
+    created, failed = [], []
+    for user in users:
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user])  # type: ignore
+            created.append(user)
+        except IntegrityError:
+            failed.append(user)
+    return created, failed
+
+
+class ImportRun:
+    """State of one import while its batches are processed"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.pool = None
+        self.allowed_roles = IMPORTABLE_ROLES.get(operation.initiated_by.role, ())
+        self.seen = {field: set() for field in UNIQUE_FIELDS}
+        self.logged_errors = 0
+
+    def get_pool(self):
+        # Started on the first batch with passwords; spawned rather than forked so the
+        # processes do not inherit the job worker's threads and database connections
+        if self.pool is None and hash_workers() > 1:
+            self.pool = ProcessPoolExecutor(
+                max_workers=hash_workers(), mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_hash_worker,
+            )
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def process(self, batch, default_role):
+        """Validate and insert one batch; returns ``(created, [(line, reason)])``"""
+        from .models import User
+
+        errors, clean = [], []
+        for line_number, values in batch:
+            try:
+                clean.append((line_number, clean_row(values, default_role, self.allowed_roles)))
+            except ValueError as e:
+                errors.append((line_number, str(e)))
+
+        taken = _existing([row for _, row in clean])
+        accepted = []
+        for line_number, row in clean:
+            clash = next((field for field in UNIQUE_FIELDS
+                          if row[field] and (row[field] in taken[field] or row[field] in self.seen[field])), None)
+            if clash:
+                errors.append((line_number, f'{clash.replace("_", " ").capitalize()} {row[clash]} already exists'))
+                continue
+            for field in UNIQUE_FIELDS:
+                if row[field]:
+                    self.seen[field].add(row[field])
+            accepted.append((line_number, row))
+
+        _hash_passwords([row for _, row in accepted], self.get_pool)
+        users = [
+            User(username=row['phone_number'], society_id=self.operation.society_id, is_approved=True,
+                 approved_by_id=self.operation.initiated_by_id, approval_date=timezone.now(), **row)
+            for _, row in accepted
+        ]
+        lines = {id(user): line_number for user, (line_number, _) in zip(users, accepted)}
+        created, failed = _insert(users)
+        errors.extend((lines[id(user)], 'Phone number, email, Aadhaar or PAN already exists') for user in failed)
+
+        counts = {'users': len(created)}
+        for role, field in (('MEMBER', 'members'), ('STAFF', 'staff')):
+            counts[field] = sum(1 for user in created if user.role == role)
+        counters.adjust({self.operation.society_id: counts})
+        return len(created), sorted(errors)
+
+    def record(self, created, errors):
+        """Add one batch's results to the operation row"""
+        from .models import BulkUserOperation
+
+        updates = {
+            'successful_records': F('successful_records') + created,
+            'failed_records': F('failed_records') + len(errors),
+        }
+        logged = errors[:max(0, MAX_LOGGED_ERRORS - self.logged_errors)]
+        self.logged_errors += len(errors)
+        if logged:
+            text = ''.join(f'Row {line_number}: {reason}\n' for line_number, reason in logged)
+            updates['error_log'] = Concat(F('error_log'), Value(text))
+        BulkUserOperation.objects.filter(pk=self.operation.pk).update(**updates)  # type: ignore
+        jobs.heartbeat()
+
+
+def _finish(operation_id, status, message=''):
+    from .models import BulkUserOperation
+
+    updates = {'status': status, 'completed_at': timezone.now()}
+    if message:
+        updates['error_log'] = Concat(F('error_log'), Value(message + '\n'))
+    BulkUserOperation.objects.filter(pk=operation_id).update(**updates)  # type: ignore
+
+
+def run_import(operation_id, default_role='MEMBER', size=None):
+    """
+    Import the file of a PENDING import operation; returns the finished operation.
+
+    Rows are committed batch by batch, so a failure part-way leaves the earlier
+    batches imported and the operation FAILED with the reason in ``error_log``.
+    """
+    from .models import BulkUserOperation
+
+    claimed = BulkUserOperation.objects.filter(  # type: ignore
+        pk=operation_id, operation_type='IMPORT', status='PENDING'
+    ).update(status='PROCESSING')
+    if not claimed:
+        raise ValueError(f'Import {operation_id} is not pending')
+    operation = BulkUserOperation.objects.select_related('initiated_by').get(pk=operation_id)  # type: ignore
+
+    size = size or batch_size()
+    run = ImportRun(operation)
+    try:
+        total = count_rows(operation.file_path)
+        BulkUserOperation.objects.filter(pk=operation_id).update(total_records=total)  # type: ignore
+        batch = []
+        for item in read_rows(operation.file_path):
+            batch.append(item)
+            if len(batch) >= size:
+                run.record(*run.process(batch, default_role))
+                batch = []
+        if batch:
+            run.record(*run.process(batch, default_role))
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        _finish(operation_id, 'FAILED', str(e))
+    except Exception as e:
+        _finish(operation_id, 'FAILED', f'Import stopped: {e}')
+        raise
+    else:
+        _finish(operation_id, 'COMPLETED')
+    finally:
+        run.close()
+    operation.refresh_from_db()
+    return operation
+
+
+def start_import(operation_id, default_role='MEMBER'):
+    """Queue the import for a background worker"""
+    from .tasks import import_users
+
+    return import_users.delay(operation_id, default_role)
@@ -1,19 +1,48 @@
 from rest_framework import status, generics, permissions, viewsets
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.response import Response
 from rest_framework import status, permissions, generics, viewsets
-from rest_framework_simplejwt.tokens import RefreshToken
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth import authenticate
+from django.core.files.storage import default_storage
+from django.http import FileResponse
+from decimal import Decimal
+import codecs
+import csv
+import datetime
+import io
+import itertools
+import os
+import tempfile
 from .models import *
 from .serializers import *
+from .mixins import ExportMixin, RelationPlannerMixin, SocietyScopedMixin
+from .pagination import KeysetPagination
+from .planner import plan_for_serializer
+from .permission_matrix import resolve_capabilities
+from .tenancy import accessible_society_ids
+from .token_auth import VERSIONED_FIELDS, RefreshToken, bump_token_versions
+from .throttling import (
+    LOGIN_THROTTLES, OTP_SEND_THROTTLES, OTP_VERIFY_THROTTLES, REGISTRATION_THROTTLES, SEARCH_THROTTLES,
+)
+from .billing import generate_maintenance_bills, parse_period
+from .splitting import distribute_bill
+from .reconciliation import UNMATCHED_PREVIEW_ROWS, reconcile_statement
+from .user_import import start_import as start_user_import
+from .bulk_jobs import ASSIGNABLE_ROLES, start_operation as start_bulk_operation
+from . import jobs, otp_store
+from .tasks import split_common_expense as split_common_expense_task
+from . import analytics
+from .analytics import GROUPINGS as REPORT_GROUPINGS
+from .counters import count_subquery, recount as recount_society_counters, totals as society_totals
 
 
 # Authentication Views
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(REGISTRATION_THROTTLES)
 def register(request):
     """User registration endpoint - SECURITY: Only creates MEMBER accounts"""
     serializer = UserRegistrationSerializer(data=request.data)
@@ -31,7 +60,7 @@ def register(request):
             tokens = None
         
         # Generate registration OTP for testing purposes
-        otp = OTP.create_otp(
+        otp = otp_store.issue(
             phone_number=user.phone_number,  # type: ignore
             purpose='REGISTRATION',
             user=user,
@@ -104,6 +133,7 @@ def create_staff_user(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(LOGIN_THROTTLES)
 def login_with_password(request):
     """User login with phone number and password"""
     serializer = UserLoginSerializer(data=request.data)
@@ -124,6 +154,7 @@ def login_with_password(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(OTP_SEND_THROTTLES)
 def login_with_otp_step1(request):
     """Step 1: Send OTP to phone number for login"""
     phone_number = request.data.get('phone_number')
@@ -139,7 +170,7 @@ def login_with_otp_step1(request):
                            status=status.HTTP_400_BAD_REQUEST)
         
         # Create OTP for login
-        otp = OTP.create_otp(
+        otp = otp_store.issue(
             phone_number=phone_number,
             purpose='LOGIN',
             user=user,
@@ -161,15 +192,12 @@ def login_with_otp_step1(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(OTP_VERIFY_THROTTLES)
 def login_with_otp_step2(request):
     """Step 2: Verify OTP and complete login"""
     serializer = OTPLoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']  # type: ignore
-        otp = serializer.validated_data['otp']  # type: ignore
-        
-        # Mark OTP as used
-        otp.mark_as_used()
         
         # Generate tokens
         refresh = RefreshToken.for_user(user)  # type: ignore
@@ -188,6 +216,7 @@ def login_with_otp_step2(request):
 # Legacy login endpoint (for backward compatibility)
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(LOGIN_THROTTLES)
 def login(request):
     """Legacy login endpoint with OTP generation"""
     serializer = UserLoginSerializer(data=request.data)
@@ -196,7 +225,7 @@ def login(request):
         refresh = RefreshToken.for_user(user)  # type: ignore
         
         # Generate login OTP for testing purposes
-        otp = OTP.create_otp(
+        otp = otp_store.issue(
             phone_number=user.phone_number,  # type: ignore
             purpose='LOGIN',
             user=user,
@@ -235,6 +264,7 @@ def logout(request):
 # OTP Authentication Views
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(OTP_SEND_THROTTLES)
 def forgot_password(request):
     """Initiate forgot password process by sending OTP"""
     serializer = ForgotPasswordSerializer(data=request.data)
@@ -245,7 +275,7 @@ def forgot_password(request):
             user = User.objects.get(phone_number=phone_number)  # type: ignore
             
             # Create OTP
-            otp = OTP.create_otp(
+            otp = otp_store.issue(
                 phone_number=phone_number,
                 purpose='FORGOT_PASSWORD',
                 user=user,
@@ -271,6 +301,7 @@ def forgot_password(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(OTP_VERIFY_THROTTLES)
 def verify_otp(request):
     """Verify OTP for any purpose"""
     serializer = OTPVerificationSerializer(data=request.data)
@@ -289,17 +320,14 @@ def verify_otp(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(OTP_VERIFY_THROTTLES)
 def reset_password(request):
     """Reset password using OTP verification"""
     serializer = PasswordResetSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']  # type: ignore
-        otp = serializer.validated_data['otp']  # type: ignore
         new_password = serializer.validated_data['new_password']  # type: ignore
         
-        # Mark OTP as used
-        otp.mark_as_used()
-        
         # Set new password
         user.set_password(new_password)
         user.save()
@@ -321,6 +349,7 @@ def reset_password(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(OTP_SEND_THROTTLES)
 def send_otp(request):
     """Send OTP for various purposes (registration, login, etc.)"""
     phone_number = request.data.get('phone_number')
@@ -346,7 +375,7 @@ def send_otp(request):
                           status=status.HTTP_404_NOT_FOUND)
     
     # Create OTP
-    otp = OTP.create_otp(
+    otp = otp_store.issue(
         phone_number=phone_number,
         purpose=purpose,
         user=user
@@ -379,7 +408,7 @@ def create_subadmin_invitation(request):
         invitation = serializer.save(invited_by=request.user)
         
         # Send OTP to invited phone number
-        otp = OTP.create_otp(
+        otp = otp_store.issue(
             phone_number=invitation.phone_number,  # type: ignore
             purpose='REGISTRATION',
             email=invitation.email  # type: ignore
@@ -401,15 +430,12 @@ def create_subadmin_invitation(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(OTP_VERIFY_THROTTLES)
 def verify_invitation_otp(request):
     """Step 1: Verify OTP for SUB_ADMIN invitation"""
     serializer = InvitationOTPVerificationSerializer(data=request.data)
     if serializer.is_valid():
         invitation = serializer.validated_data['invitation']  # type: ignore
-        otp = serializer.validated_data['otp']  # type: ignore
-        
-        # Mark OTP as used
-        otp.mark_as_used()
         
         # Mark invitation as OTP verified
         invitation.otp_verified = True
@@ -428,6 +454,7 @@ def verify_invitation_otp(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(REGISTRATION_THROTTLES)
 def complete_subadmin_registration(request):
     """Step 2: Complete SUB_ADMIN registration with details and password"""
     serializer = CompleteSubAdminRegistrationSerializer(data=request.data)
@@ -492,7 +519,7 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 
 
 # Core ViewSets
-class SocietyViewSet(viewsets.ModelViewSet):
+class SocietyViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Society model"""
     queryset = Society.objects.all()  # type: ignore
     serializer_class = SocietySerializer
@@ -502,7 +529,7 @@ class SocietyViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'city']
 
 
-class FlatViewSet(viewsets.ModelViewSet):
+class FlatViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Flat model"""
     queryset = Flat.objects.all()  # type: ignore
     serializer_class = FlatSerializer
@@ -510,9 +537,46 @@ class FlatViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['society', 'block_number', 'type']
     search_fields = ['flat_number', 'block_number']
+    
+    def _can_view_account(self, flat):
+        user = self.request.user
+        if user.role in ['ADMIN', 'SUB_ADMIN']:
+            return flat.society_id in accessible_society_ids(self.request)
+        return user.id in (flat.owner_id, flat.tenant_id)
+    
+    @action(detail=True, methods=['get'])
+    def balance(self, request, pk=None):
+        """Current dues of a flat"""
+        flat = self.get_object()
+        if not self._can_view_account(flat):
+            return Response({'error': 'You do not have access to this flat'}, status=status.HTTP_403_FORBIDDEN)
+        balance = FlatBalance.objects.filter(flat=flat).first() or FlatBalance(flat=flat)  # type: ignore
+        return Response(FlatBalanceSerializer(balance).data)
+    
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Ledger entries of a flat, newest first (optionally ?from=YYYY-MM-DD&to=YYYY-MM-DD)"""
+        flat = self.get_object()
+        if not self._can_view_account(flat):
+            return Response({'error': 'You do not have access to this flat'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            start = datetime.date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+            end = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+        except ValueError:
+            return Response({'error': 'from and to must be dates (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        entries = LedgerEntry.objects.filter(flat=flat).order_by('-created_at', '-id')  # type: ignore
+        if start:
+            entries = entries.filter(created_at__date__gte=start)
+        if end:
+            entries = entries.filter(created_at__date__lte=end)
+        
+        page = self.paginate_queryset(entries)
+        return self.get_paginated_response(LedgerEntrySerializer(page, many=True).data)
 
 
-class VehicleViewSet(viewsets.ModelViewSet):
+class VehicleViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Vehicle model"""
     queryset = Vehicle.objects.all()  # type: ignore
     serializer_class = VehicleSerializer
@@ -523,7 +587,7 @@ class VehicleViewSet(viewsets.ModelViewSet):
 
 
 # Billing ViewSets
-class MaintenanceBillViewSet(viewsets.ModelViewSet):
+class MaintenanceBillViewSet(ExportMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for MaintenanceBill model"""
     queryset = MaintenanceBill.objects.all()  # type: ignore
     serializer_class = MaintenanceBillSerializer
@@ -531,6 +595,15 @@ class MaintenanceBillViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['flat', 'status', 'payment_mode']
     ordering = ['-created_at']
+    export_name = 'maintenance-bills'
+    export_ordering = ('-billing_period_start', 'flat__flat_number', 'id')
+    export_columns = (
+        ('id', 'id'), ('society', 'flat__society__name'), ('block', 'flat__block_number'), ('flat', 'flat__flat_number'),
+        ('billing_period_start', 'billing_period_start'), ('billing_period_end', 'billing_period_end'),
+        ('due_date', 'due_date'), ('amount', 'amount'), ('late_fee', 'late_fee'), ('status', 'status'),
+        ('payment_mode', 'payment_mode'), ('transaction_id', 'transaction_id'), ('paid_date', 'paid_date'),
+        ('created_at', 'created_at'),
+    )
     
     def get_queryset(self):
         user = self.request.user
@@ -540,9 +613,36 @@ class MaintenanceBillViewSet(viewsets.ModelViewSet):
         return MaintenanceBill.objects.filter(  # type: ignore
             models.Q(flat__owner=user) | models.Q(flat__tenant=user)
         )
+    
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        """Generate the month's maintenance bills for every flat of a society"""
+        if request.user.role not in ['ADMIN', 'SUB_ADMIN']:
+            return Response({'error': 'Only admins can generate bills'}, status=status.HTTP_403_FORBIDDEN)
+        
+        society_id = request.data.get('society') or request.user.society_id
+        if not society_id:
+            return Response({'error': 'society is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            society_id = int(society_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'society must be a society id'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            period_start = parse_period(request.data.get('period', ''))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if society_id not in accessible_society_ids(request):
+            return Response({'error': 'You do not have access to this society'}, 
+                           status=status.HTTP_403_FORBIDDEN)
+        
+        result = generate_maintenance_bills(
+            society_id, period_start, dry_run=str(request.data.get('dry_run', '')).lower() in ['1', 'true']
+        )
+        return Response(result.as_dict())
 
 
-class CommonExpenseViewSet(viewsets.ModelViewSet):
+class CommonExpenseViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for CommonExpense model"""
     queryset = CommonExpense.objects.all()  # type: ignore
     serializer_class = CommonExpenseSerializer
@@ -556,11 +656,23 @@ class CommonExpenseViewSet(viewsets.ModelViewSet):
     def split_expense(self, request, pk=None):
         """Split the expense among all flats"""
         expense = self.get_object()
-        expense.split_expense()
-        return Response({'message': 'Expense split successfully'})
+        if str(request.data.get('background', '')).lower() in ['1', 'true']:
+            # Large societies: split on a worker and poll background-jobs/<id>/
+            job = split_common_expense_task.delay(
+                expense.pk, request.data.get('mode', 'EQUAL'), request.data.get('type_weights')
+            )
+            return Response({'message': 'Expense split queued', 'job_id': job.pk}, status=status.HTTP_202_ACCEPTED)
+        try:
+            splits_count = expense.split_expense(
+                mode=request.data.get('mode', 'EQUAL'),
+                type_weights=request.data.get('type_weights')
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'message': 'Expense split successfully', 'splits_count': splits_count})
 
 
-class CommonExpenseSplitViewSet(viewsets.ModelViewSet):
+class CommonExpenseSplitViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for CommonExpenseSplit model"""
     queryset = CommonExpenseSplit.objects.all()  # type: ignore
     serializer_class = CommonExpenseSplitSerializer
@@ -570,7 +682,7 @@ class CommonExpenseSplitViewSet(viewsets.ModelViewSet):
 
 
 # Community ViewSets
-class NoticeViewSet(viewsets.ModelViewSet):
+class NoticeViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Notice model"""
     queryset = Notice.objects.all()  # type: ignore
     serializer_class = NoticeSerializer
@@ -579,9 +691,10 @@ class NoticeViewSet(viewsets.ModelViewSet):
     filterset_fields = ['society', 'posted_by']
     search_fields = ['title', 'content']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
 
 
-class AmenityViewSet(viewsets.ModelViewSet):
+class AmenityViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Amenity model"""
     queryset = Amenity.objects.all()  # type: ignore
     serializer_class = AmenitySerializer
@@ -591,7 +704,7 @@ class AmenityViewSet(viewsets.ModelViewSet):
     search_fields = ['name']
 
 
-class AmenityBookingViewSet(viewsets.ModelViewSet):
+class AmenityBookingViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for AmenityBooking model"""
     queryset = AmenityBooking.objects.all()  # type: ignore
     serializer_class = AmenityBookingSerializer
@@ -607,7 +720,7 @@ class AmenityBookingViewSet(viewsets.ModelViewSet):
 
 
 # Security ViewSets
-class VisitorLogViewSet(viewsets.ModelViewSet):
+class VisitorLogViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for VisitorLog model"""
     queryset = VisitorLog.objects.all()  # type: ignore
     serializer_class = VisitorLogSerializer
@@ -616,9 +729,10 @@ class VisitorLogViewSet(viewsets.ModelViewSet):
     filterset_fields = ['flat_to_visit', 'status']
     search_fields = ['name', 'phone_number']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
 
 
-class ComplaintViewSet(viewsets.ModelViewSet):
+class ComplaintViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Complaint model"""
     queryset = Complaint.objects.all()  # type: ignore
     serializer_class = ComplaintSerializer
@@ -627,6 +741,7 @@ class ComplaintViewSet(viewsets.ModelViewSet):
     filterset_fields = ['flat', 'status', 'assigned_to']
     search_fields = ['title', 'description']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         user = self.request.user
@@ -638,7 +753,7 @@ class ComplaintViewSet(viewsets.ModelViewSet):
 
 
 # Marketplace ViewSets
-class MarketplaceListingViewSet(viewsets.ModelViewSet):
+class MarketplaceListingViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for MarketplaceListing model"""
     queryset = MarketplaceListing.objects.all()  # type: ignore
     serializer_class = MarketplaceListingSerializer
@@ -658,7 +773,7 @@ class MarketplaceListingViewSet(viewsets.ModelViewSet):
         )
 
 
-class JobListingViewSet(viewsets.ModelViewSet):
+class JobListingViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for JobListing model"""
     queryset = JobListing.objects.all()  # type: ignore
     serializer_class = JobListingSerializer
@@ -678,7 +793,7 @@ class JobListingViewSet(viewsets.ModelViewSet):
         )
 
 
-class AdBannerViewSet(viewsets.ModelViewSet):
+class AdBannerViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for AdBanner model"""
     queryset = AdBanner.objects.all()  # type: ignore
     serializer_class = AdBannerSerializer
@@ -690,7 +805,7 @@ class AdBannerViewSet(viewsets.ModelViewSet):
 # ===== NEW VIEWS FOR ENHANCED SOCIETY MANAGEMENT =====
 
 # Admin → Sub-Admin (Chairman) Management
-class ChairmanInvitationViewSet(viewsets.ModelViewSet):
+class ChairmanInvitationViewSet(SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Chairman Invitations"""
     queryset = ChairmanInvitation.objects.all()  # type: ignore
     serializer_class = ChairmanInvitationSerializer
@@ -702,9 +817,8 @@ class ChairmanInvitationViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.role == 'ADMIN':
             # Admins can see invitations for their managed societies
-            managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
             return ChairmanInvitation.objects.filter(  # type: ignore
-                models.Q(invited_by=user) | models.Q(society_id__in=managed_society_ids)
+                models.Q(invited_by=user) | models.Q(society_id__in=self.get_society_ids())
             )
         return ChairmanInvitation.objects.none()  # type: ignore
     
@@ -759,41 +873,28 @@ class ChairmanInvitationViewSet(viewsets.ModelViewSet):
 
 
 # Staff Management
-class StaffCategoryViewSet(viewsets.ModelViewSet):
+class StaffCategoryViewSet(SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Staff Categories"""
     queryset = StaffCategory.objects.all()  # type: ignore
     serializer_class = StaffCategorySerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['society']
-    
-    def get_queryset(self):
-        user = self.request.user
-        if user.role in ['ADMIN', 'SUB_ADMIN']:
-            if user.role == 'ADMIN':
-                managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
-                return StaffCategory.objects.filter(society_id__in=managed_society_ids)  # type: ignore
-            else:
-                return StaffCategory.objects.filter(society=user.society)  # type: ignore
-        return StaffCategory.objects.none()  # type: ignore
 
 
-class StaffMemberViewSet(viewsets.ModelViewSet):
+class StaffMemberViewSet(SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Staff Members"""
     queryset = StaffMember.objects.all()  # type: ignore
     serializer_class = StaffMemberSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['category', 'is_active']
+    society_path = 'category__society'
     
     def get_queryset(self):
         user = self.request.user
-        if user.role in ['ADMIN', 'SUB_ADMIN']:
-            if user.role == 'ADMIN':
-                managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
-                return StaffMember.objects.filter(category__society_id__in=managed_society_ids)  # type: ignore
-            else:
-                return StaffMember.objects.filter(category__society=user.society)  # type: ignore
+        if user.role in self.society_roles:
+            return self.scope_to_societies(StaffMember.objects.all())  # type: ignore
         elif user.role == 'STAFF':
             return StaffMember.objects.filter(user=user)  # type: ignore
         return StaffMember.objects.none()  # type: ignore
@@ -844,26 +945,19 @@ class StaffMemberViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class DutyScheduleViewSet(viewsets.ModelViewSet):
+class DutyScheduleViewSet(SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Duty Schedules"""
     queryset = DutySchedule.objects.all()  # type: ignore
     serializer_class = DutyScheduleSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['staff_member', 'date', 'status']
+    society_path = 'staff_member__category__society'
     
     def get_queryset(self):
         user = self.request.user
-        if user.role in ['ADMIN', 'SUB_ADMIN']:
-            if user.role == 'ADMIN':
-                managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
-                return DutySchedule.objects.filter(  # type: ignore
-                    staff_member__category__society_id__in=managed_society_ids
-                )
-            else:
-                return DutySchedule.objects.filter(  # type: ignore
-                    staff_member__category__society=user.society
-                )
+        if user.role in self.society_roles:
+            return self.scope_to_societies(DutySchedule.objects.all())  # type: ignore
         elif user.role == 'STAFF':
             try:
                 staff_member = user.staff_profile  # type: ignore
@@ -884,7 +978,7 @@ class DutyScheduleViewSet(viewsets.ModelViewSet):
 
 
 # Permission Management
-class PermissionViewSet(viewsets.ModelViewSet):
+class PermissionViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Permissions"""
     queryset = Permission.objects.all()  # type: ignore
     serializer_class = PermissionSerializer
@@ -899,7 +993,7 @@ class PermissionViewSet(viewsets.ModelViewSet):
         return Permission.objects.filter(is_active=True)  # type: ignore
 
 
-class RolePermissionViewSet(viewsets.ModelViewSet):
+class RolePermissionViewSet(SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Role Permissions"""
     queryset = RolePermission.objects.all()  # type: ignore
     serializer_class = RolePermissionSerializer
@@ -909,20 +1003,16 @@ class RolePermissionViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
-        if user.role == 'ADMIN':
-            managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
+        if user.role in self.society_roles:
+            # Global rows apply to every society
             return RolePermission.objects.filter(  # type: ignore
-                models.Q(society_id__in=managed_society_ids) | models.Q(society__isnull=True)
-            )
-        elif user.role == 'SUB_ADMIN':
-            return RolePermission.objects.filter(  # type: ignore
-                models.Q(society=user.society) | models.Q(society__isnull=True)
+                models.Q(society_id__in=self.get_society_ids()) | models.Q(society__isnull=True)
             )
         return RolePermission.objects.none()  # type: ignore
 
 
 # User Management
-class UserRoleTransitionViewSet(viewsets.ModelViewSet):
+class UserRoleTransitionViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for User Role Transitions"""
     queryset = UserRoleTransition.objects.all()  # type: ignore
     serializer_class = UserRoleTransitionSerializer
@@ -964,44 +1054,27 @@ class UserRoleTransitionViewSet(viewsets.ModelViewSet):
 
 
 # Society Settings
-class SocietySettingsViewSet(viewsets.ModelViewSet):
+class SocietySettingsViewSet(SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Society Settings"""
     queryset = SocietySettings.objects.all()  # type: ignore
     serializer_class = SocietySettingsSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['society']
-    
-    def get_queryset(self):
-        user = self.request.user
-        if user.role == 'ADMIN':
-            managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
-            return SocietySettings.objects.filter(society_id__in=managed_society_ids)  # type: ignore
-        elif user.role == 'SUB_ADMIN':
-            return SocietySettings.objects.filter(society=user.society)  # type: ignore
-        return SocietySettings.objects.none()  # type: ignore
 
 
-class FeeStructureViewSet(viewsets.ModelViewSet):
+class FeeStructureViewSet(SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Fee Structures"""
     queryset = FeeStructure.objects.all()  # type: ignore
     serializer_class = FeeStructureSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['society', 'flat_type', 'is_active']
-    
-    def get_queryset(self):
-        user = self.request.user
-        if user.role == 'ADMIN':
-            managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
-            return FeeStructure.objects.filter(society_id__in=managed_society_ids)  # type: ignore
-        elif user.role in ['SUB_ADMIN', 'MEMBER']:
-            return FeeStructure.objects.filter(society=user.society)  # type: ignore
-        return FeeStructure.objects.none()  # type: ignore
+    society_roles = ('ADMIN', 'SUB_ADMIN', 'MEMBER')
 
 
 # Bulk Operations
-class BulkUserOperationViewSet(viewsets.ModelViewSet):
+class BulkUserOperationViewSet(SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Bulk User Operations"""
     queryset = BulkUserOperation.objects.all()  # type: ignore
     serializer_class = BulkUserOperationSerializer
@@ -1009,17 +1082,17 @@ class BulkUserOperationViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['operation_type', 'status', 'society']
     
-    def get_queryset(self):
-        user = self.request.user
-        if user.role == 'ADMIN':
-            managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
-            return BulkUserOperation.objects.filter(society_id__in=managed_society_ids)  # type: ignore
-        elif user.role == 'SUB_ADMIN':
-            return BulkUserOperation.objects.filter(society=user.society)  # type: ignore
-        return BulkUserOperation.objects.none()  # type: ignore
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the file produced by a completed export"""
+        operation = self.get_object()
+        if operation.operation_type != 'EXPORT' or operation.status != 'COMPLETED':
+            return Response({'error': 'No completed export for this operation'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(default_storage.open(operation.file_path, 'rb'), as_attachment=True,
+                            filename=os.path.basename(operation.file_path))
 
 
-class AdminSocietyViewSet(viewsets.ModelViewSet):
+class AdminSocietyViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Admin Society relationships"""
     queryset = AdminSociety.objects.all()  # type: ignore
     serializer_class = AdminSocietySerializer
@@ -1040,23 +1113,76 @@ def bulk_user_import(request):
     """Import users in bulk from CSV/Excel file"""
     serializer = BulkUserImportSerializer(data=request.data)
     if serializer.is_valid():
-        # Process file and create bulk operation record
+        society = serializer.validated_data['society']  # type: ignore
+        if request.user.role not in ['ADMIN', 'SUB_ADMIN'] or society.id not in accessible_society_ids(request):
+            return Response({'error': 'You do not have access to this society'}, status=status.HTTP_403_FORBIDDEN)
+        
+        upload = serializer.validated_data['file']  # type: ignore
+        file_path = default_storage.save(
+            f'bulk_imports/{society.id}/{timezone.now():%Y%m%d-%H%M%S}-{upload.name}', upload
+        )
         operation = BulkUserOperation.objects.create(  # type: ignore
             operation_type='IMPORT',
             initiated_by=request.user,
-            society=serializer.validated_data['society'],  # type: ignore
-            status='PROCESSING'
+            society=society,
+            file_path=file_path,
+            status='PENDING'
         )
-        
-        # TODO: Implement async file processing
+        # Progress is polled on bulk-operations/<id>/
+        start_user_import(operation.id, serializer.validated_data['default_role'])  # type: ignore
         return Response({
             'message': 'Import process started',
             'operation_id': operation.id
-        })
+        }, status=status.HTTP_202_ACCEPTED)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _start_bulk_operation(request, serializer_class, operation_type, parameters):
+    """Validate a bulk operation request, record it and run it in the background"""
+    serializer = serializer_class(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    society = data['society']  # type: ignore
+    if request.user.role not in ['ADMIN', 'SUB_ADMIN'] or society.id not in accessible_society_ids(request):
+        return Response({'error': 'You do not have access to this society'}, status=status.HTTP_403_FORBIDDEN)
+    
+    operation = BulkUserOperation.objects.create(  # type: ignore
+        operation_type=operation_type,
+        initiated_by=request.user,
+        society=society,
+        parameters={name: data[name] for name in parameters if data.get(name)},  # type: ignore
+        status='PENDING'
+    )
+    start_bulk_operation(operation)
+    return Response({
+        'message': f'{operation.get_operation_type_display()} started',
+        'operation_id': operation.id
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['POST'])
+def bulk_user_export(request):
+    """Export a society's users to a CSV/NDJSON file in the background"""
+    return _start_bulk_operation(request, BulkUserExportSerializer, 'EXPORT', ['format', 'role', 'user_ids'])
+
+
+@api_view(['POST'])
+def bulk_user_delete(request):
+    """Deactivate users in the background"""
+    return _start_bulk_operation(request, BulkUserDeleteSerializer, 'BULK_DELETE', ['user_ids'])
+
+
+@api_view(['POST'])
+def bulk_role_change(request):
+    """Change the role of users in the background, recording each transition"""
+    if request.data.get('to_role') not in ASSIGNABLE_ROLES.get(request.user.role, ()):
+        return Response({'error': 'You cannot assign this role'}, status=status.HTTP_403_FORBIDDEN)
+    return _start_bulk_operation(request, BulkRoleChangeSerializer, 'ROLE_CHANGE', ['user_ids', 'to_role', 'reason'])
+
+
 @api_view(['POST'])
 def bulk_user_update(request):
     """Update multiple users at once"""
@@ -1066,7 +1192,18 @@ def bulk_user_update(request):
         updates = serializer.validated_data['updates']  # type: ignore
         
         # Update users
-        updated_count = User.objects.filter(id__in=user_ids).update(**updates)  # type: ignore
+        users = User.objects.filter(id__in=user_ids)  # type: ignore
+        recount_societies = set()
+        if {'role', 'society', 'society_id'} & set(updates):
+            recount_societies = set(users.values_list('society_id', flat=True))
+        updated_count = users.update(**updates)
+        if {*VERSIONED_FIELDS, 'society'} & set(updates):
+            # update() bypasses User.save(), which makes tokens with the old claims stale
+            bump_token_versions(user_ids)
+        if recount_societies:
+            # update() bypasses the counter signals
+            recount_societies.update(users.values_list('society_id', flat=True))
+            recount_society_counters(recount_societies)
         
         return Response({
             'message': f'Successfully updated {updated_count} users',
@@ -1082,69 +1219,97 @@ def user_dashboard_stats(request):
     user = request.user
     stats = {}
     
+    # Society-wide figures come from the cached per-society counters; per-user
+    # figures are counted with one query of scalar subqueries on the user row
     if user.role == 'ADMIN':
-        managed_societies = user.managed_societies.all()  # type: ignore
+        society_ids = accessible_society_ids(request)
+        totals = society_totals(society_ids)
         stats = {
-            'total_societies': managed_societies.count(),
-            'total_users': User.objects.filter(  # type: ignore
-                society_id__in=managed_societies.values_list('society_id', flat=True)
-            ).count(),
+            'total_societies': len(society_ids),
+            'total_users': totals['users'],
             'pending_invitations': ChairmanInvitation.objects.filter(  # type: ignore
                 invited_by=user, status='PENDING'
             ).count(),
-            'total_complaints': Complaint.objects.filter(  # type: ignore
-                flat__society_id__in=managed_societies.values_list('society_id', flat=True)
-            ).count()
+            'total_complaints': totals['complaints']
         }
     
     elif user.role == 'SUB_ADMIN':
+        totals = society_totals([user.society_id] if user.society_id else [])
         stats = {
-            'total_members': User.objects.filter(society=user.society, role='MEMBER').count(),  # type: ignore
-            'total_staff': User.objects.filter(society=user.society, role='STAFF').count(),  # type: ignore
-            'pending_complaints': Complaint.objects.filter(  # type: ignore
-                flat__society=user.society, status='OPEN'
-            ).count(),
-            'total_flats': Flat.objects.filter(society=user.society).count()  # type: ignore
+            'total_members': totals['members'],
+            'total_staff': totals['staff'],
+            'pending_complaints': totals['open_complaints'],
+            'total_flats': totals['flats'],
+            'pending_bills': totals['pending_bills']
         }
     
     elif user.role == 'MEMBER':
-        user_flats = Flat.objects.filter(  # type: ignore
-            models.Q(owner=user) | models.Q(tenant=user)
-        )
-        stats = {
-            'my_flats': user_flats.count(),
-            'pending_bills': MaintenanceBill.objects.filter(  # type: ignore
-                flat__in=user_flats, status='PENDING'
-            ).count(),
-            'my_complaints': Complaint.objects.filter(raised_by=user).count(),  # type: ignore
-            'my_bookings': AmenityBooking.objects.filter(booked_by=user).count()  # type: ignore
-        }
+        in_user_flats = models.Q(flat__owner=models.OuterRef('pk')) | models.Q(flat__tenant=models.OuterRef('pk'))
+        stats = User.objects.filter(pk=user.pk).values(  # type: ignore
+            my_flats=count_subquery(Flat.objects.filter(  # type: ignore
+                models.Q(owner=models.OuterRef('pk')) | models.Q(tenant=models.OuterRef('pk'))
+            )),
+            pending_bills=count_subquery(MaintenanceBill.objects.filter(in_user_flats, status='PENDING')),  # type: ignore
+            my_complaints=count_subquery(Complaint.objects.filter(raised_by=models.OuterRef('pk'))),  # type: ignore
+            my_bookings=count_subquery(AmenityBooking.objects.filter(booked_by=models.OuterRef('pk')))  # type: ignore
+        ).get()
     
     elif user.role == 'STAFF':
-        try:
-            staff_member = user.staff_profile  # type: ignore
-            today = timezone.now().date()
-            stats = {
-                'today_duties': DutySchedule.objects.filter(  # type: ignore
-                    staff_member=staff_member, date=today
-                ).count(),
-                'pending_duties': DutySchedule.objects.filter(  # type: ignore
-                    staff_member=staff_member, status='SCHEDULED'
-                ).count(),
-                'assigned_complaints': Complaint.objects.filter(  # type: ignore
-                    assigned_to=user, status__in=['OPEN', 'IN_PROGRESS']
-                ).count()
-            }
-        except StaffMember.DoesNotExist:  # type: ignore
-            stats = {'error': 'Staff profile not found'}
+        today = timezone.now().date()
+        duties = DutySchedule.objects.filter(staff_member=models.OuterRef('pk'))  # type: ignore
+        stats = StaffMember.objects.filter(user=user).values(  # type: ignore
+            today_duties=count_subquery(duties.filter(date=today)),
+            pending_duties=count_subquery(duties.filter(status='SCHEDULED')),
+            assigned_complaints=count_subquery(Complaint.objects.filter(  # type: ignore
+                assigned_to=models.OuterRef('user'), status__in=['OPEN', 'IN_PROGRESS']
+            ))
+        ).first() or {'error': 'Staff profile not found'}
     
     return Response(stats)
 
 
+@api_view(['GET'])
+def my_dues(request):
+    """Balances of the flats the current user owns or rents"""
+    user = request.user
+    balances = list(FlatBalance.objects.filter(  # type: ignore
+        models.Q(flat__owner=user) | models.Q(flat__tenant=user)
+    ).select_related('flat__society'))
+    return Response({
+        'total_due': str(sum((balance.balance for balance in balances), Decimal('0.00'))),
+        'flats': FlatBalanceSerializer(balances, many=True).data
+    })
+
+
+@api_view(['GET'])
+def my_capabilities(request):
+    """Resolved permission matrix for the current user in a single call"""
+    user = request.user
+    society_id = request.GET.get('society')
+    
+    if society_id:
+        try:
+            society_id = int(society_id)
+        except ValueError:
+            return Response({'error': 'Invalid society id'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if society_id not in accessible_society_ids(request):
+            return Response({'error': 'You do not have access to this society'}, 
+                           status=status.HTTP_403_FORBIDDEN)
+    else:
+        society_id = user.society_id
+    
+    return Response({
+        'role': user.role,
+        'society': society_id,
+        'permissions': resolve_capabilities(user.role, society_id)
+    })
+
+
 # ===== ENHANCED VIEWS FOR COMPREHENSIVE SOCIETY MANAGEMENT =====
 
 # Building and Flat Management Views
-class BuildingViewSet(viewsets.ModelViewSet):
+class BuildingViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Building management"""
     queryset = Building.objects.all()  # type: ignore
     serializer_class = BuildingSerializer
@@ -1157,7 +1322,7 @@ class BuildingViewSet(viewsets.ModelViewSet):
         return Building.objects.none()  # type: ignore
 
 
-class EnhancedFlatViewSet(viewsets.ModelViewSet):
+class EnhancedFlatViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Enhanced Flat management"""
     queryset = EnhancedFlat.objects.all()  # type: ignore
     serializer_class = EnhancedFlatSerializer
@@ -1171,7 +1336,7 @@ class EnhancedFlatViewSet(viewsets.ModelViewSet):
 
 
 # Member Management Views
-class MemberViewSet(viewsets.ModelViewSet):
+class MemberViewSet(ExportMixin, SocietyScopedMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for Member management - Full CRUD operations for SUB_ADMIN"""
     queryset = User.objects.filter(role='MEMBER')  # type: ignore
     serializer_class = UserProfileSerializer
@@ -1180,16 +1345,22 @@ class MemberViewSet(viewsets.ModelViewSet):
     filterset_fields = ['is_approved', 'society']
     search_fields = ['first_name', 'last_name', 'phone_number', 'email']
     ordering = ['-date_joined']
+    export_name = 'members'
+    export_ordering = ('society_id', 'first_name', 'last_name', 'id')
+    export_columns = (
+        ('id', 'id'), ('society', 'society__name'), ('first_name', 'first_name'), ('last_name', 'last_name'),
+        ('phone_number', 'phone_number'), ('email', 'email'), ('ownership_type', 'ownership_type'),
+        ('occupation', 'occupation'), ('emergency_contact_name', 'emergency_contact_name'),
+        ('emergency_contact_phone', 'emergency_contact_phone'), ('is_approved', 'is_approved'),
+        ('is_active', 'is_active'), ('date_joined', 'date_joined'),
+    )
     
     def get_queryset(self):
         """Filter members based on user role"""
         user = self.request.user
-        if user.role == 'SUB_ADMIN':
-            return User.objects.filter(role='MEMBER', society=user.society)  # type: ignore
-        elif user.role == 'ADMIN':
+        if user.role in self.society_roles:
             # Admin can see members from all societies they manage
-            managed_society_ids = user.managed_societies.values_list('society_id', flat=True)  # type: ignore
-            return User.objects.filter(role='MEMBER', society_id__in=managed_society_ids)  # type: ignore
+            return self.scope_to_societies(User.objects.filter(role='MEMBER'))  # type: ignore
         elif user.role == 'MEMBER':
             # Members can only see their own profile
             return User.objects.filter(id=user.id)  # type: ignore
@@ -1266,6 +1437,7 @@ class MemberViewSet(viewsets.ModelViewSet):
 # Member Registration Views
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(SEARCH_THROTTLES)
 def search_societies(request):
     """Search societies by address, city, or name"""
     search_query = request.GET.get('search', '')
@@ -1276,7 +1448,8 @@ def search_societies(request):
         models.Q(name__icontains=search_query) |  # type: ignore
         models.Q(address__icontains=search_query) |  # type: ignore
         models.Q(city__icontains=search_query)  # type: ignore
-    )[:10]  # type: ignore
+    )
+    societies = plan_for_serializer(SocietyListSerializer).apply(societies)[:10]  # type: ignore
     
     serializer = SocietyListSerializer(societies, many=True)
     return Response(serializer.data)
@@ -1284,6 +1457,7 @@ def search_societies(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes(REGISTRATION_THROTTLES)
 def self_register_member(request):
     """Self-registration for prospective members"""
     serializer = MemberRegistrationRequestSerializer(data=request.data)
@@ -1328,7 +1502,7 @@ def direct_add_member(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MemberRegistrationRequestViewSet(viewsets.ModelViewSet):
+class MemberRegistrationRequestViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for member registration requests"""
     queryset = MemberRegistrationRequest.objects.all()  # type: ignore
     serializer_class = MemberRegistrationRequestSerializer
@@ -1434,7 +1608,7 @@ class MemberRegistrationRequestViewSet(viewsets.ModelViewSet):
 
 
 # Enhanced Billing Views
-class BillTypeViewSet(viewsets.ModelViewSet):
+class BillTypeViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for bill types"""
     queryset = BillType.objects.all()  # type: ignore
     serializer_class = BillTypeSerializer
@@ -1447,11 +1621,21 @@ class BillTypeViewSet(viewsets.ModelViewSet):
         return BillType.objects.none()  # type: ignore
 
 
-class EnhancedBillViewSet(viewsets.ModelViewSet):
+class EnhancedBillViewSet(ExportMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for enhanced bills"""
     queryset = EnhancedBill.objects.all()  # type: ignore
     serializer_class = EnhancedBillSerializer
     permission_classes = [permissions.IsAuthenticated]
+    export_name = 'bills'
+    export_ordering = ('-created_at', '-id')
+    export_columns = (
+        ('bill_number', 'bill_number'), ('bill_type', 'bill_type__name'), ('title', 'title'),
+        ('amount', 'amount'), ('tax_amount', 'tax_amount'), ('total_amount', 'total_amount'),
+        ('late_fee', 'late_fee'), ('due_date', 'due_date'), ('status', 'status'),
+        ('paid_amount', 'paid_amount'), ('outstanding_amount', 'outstanding_amount'),
+        ('payment_mode', 'payment_mode'), ('transaction_id', 'transaction_id'), ('paid_date', 'paid_date'),
+        ('is_recurring', 'is_recurring'), ('created_by', 'created_by__phone_number'), ('created_at', 'created_at'),
+    )
     
     def get_queryset(self):
         user = self.request.user
@@ -1461,11 +1645,12 @@ class EnhancedBillViewSet(viewsets.ModelViewSet):
 
 
 # Security and Gate Management Views
-class VisitorPassViewSet(viewsets.ModelViewSet):
+class VisitorPassViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for visitor passes"""
     queryset = VisitorPass.objects.all()  # type: ignore
     serializer_class = VisitorPassSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         user = self.request.user
@@ -1474,11 +1659,22 @@ class VisitorPassViewSet(viewsets.ModelViewSet):
         return VisitorPass.objects.none()  # type: ignore
 
 
-class GateUpdateLogViewSet(viewsets.ModelViewSet):
+class GateUpdateLogViewSet(ExportMixin, RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for gate update logs"""
     queryset = GateUpdateLog.objects.all()  # type: ignore
     serializer_class = GateUpdateLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-timestamp', '-id')
+    export_name = 'gate-register'
+    export_ordering = ('-timestamp', '-id')
+    export_columns = (
+        ('timestamp', 'timestamp'), ('gate_number', 'gate_number'), ('update_type', 'update_type'),
+        ('person_name', 'person_name'), ('person_phone', 'person_phone'), ('id_proof_number', 'id_proof_number'),
+        ('vehicle_number', 'vehicle_number'), ('vehicle_type', 'vehicle_type'), ('flat_number', 'flat_number'),
+        ('purpose', 'purpose'), ('visitor_pass', 'visitor_pass__pass_number'), ('entry_method', 'entry_method'),
+        ('logged_by', 'logged_by__phone_number'), ('is_approved', 'is_approved'), ('notes', 'notes'),
+    )
     
     def get_queryset(self):
         user = self.request.user
@@ -1488,7 +1684,7 @@ class GateUpdateLogViewSet(viewsets.ModelViewSet):
 
 
 # Helpdesk Management Views
-class HelpdeskDesignationViewSet(viewsets.ModelViewSet):
+class HelpdeskDesignationViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for helpdesk designations"""
     queryset = HelpdeskDesignation.objects.all()  # type: ignore
     serializer_class = HelpdeskDesignationSerializer
@@ -1501,7 +1697,7 @@ class HelpdeskDesignationViewSet(viewsets.ModelViewSet):
         return HelpdeskDesignation.objects.none()  # type: ignore
 
 
-class HelpdeskContactViewSet(viewsets.ModelViewSet):
+class HelpdeskContactViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for helpdesk contacts"""
     queryset = HelpdeskContact.objects.all()  # type: ignore
     serializer_class = HelpdeskContactSerializer
@@ -1515,7 +1711,7 @@ class HelpdeskContactViewSet(viewsets.ModelViewSet):
 
 
 # Directory Management Views
-class DirectoryEntryViewSet(viewsets.ModelViewSet):
+class DirectoryEntryViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for directory entries"""
     queryset = DirectoryEntry.objects.all()  # type: ignore
     serializer_class = DirectoryEntrySerializer
@@ -1530,29 +1726,208 @@ class DirectoryEntryViewSet(viewsets.ModelViewSet):
 
 
 # Missing ViewSets that are registered in URLs
-class MemberInvitationViewSet(viewsets.ModelViewSet):
+class MemberInvitationViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for member invitations"""
     queryset = MemberInvitation.objects.all()  # type: ignore
     serializer_class = MemberInvitationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
-class StaffInvitationViewSet(viewsets.ModelViewSet):
+class StaffInvitationViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for staff invitations"""
     queryset = StaffInvitation.objects.all()  # type: ignore
     serializer_class = StaffInvitationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
-class SocietyProfileViewSet(viewsets.ModelViewSet):
+class SocietyProfileViewSet(RelationPlannerMixin, viewsets.ModelViewSet):
     """ViewSet for society profiles"""
     queryset = SocietyProfile.objects.all()  # type: ignore
     serializer_class = SocietyProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
-class BillDistributionViewSet(viewsets.ReadOnlyModelViewSet):
+class BillDistributionViewSet(RelationPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for bill distributions"""
     queryset = BillDistribution.objects.all()  # type: ignore
     serializer_class = BillDistributionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    
+    @action(detail=True, methods=['post'])
+    def record_payment(self, request, pk=None):
+        """Record a payment against a flat's share of a bill"""
+        distribution = self.get_object()
+        if request.user.role not in ['ADMIN', 'SUB_ADMIN']:
+            return Response({'error': 'Only admins can record payments'}, status=status.HTTP_403_FORBIDDEN)
+        if distribution.flat.society_id not in accessible_society_ids(request):
+            return Response({'error': 'You do not have access to this society'}, 
+                           status=status.HTTP_403_FORBIDDEN)
+        
+        serializer = BillPaymentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            distribution.record_payment(
+                data.get('amount', distribution.allocated_amount - distribution.paid_amount),  # type: ignore
+                payment_mode=data.get('payment_mode'),  # type: ignore
+                transaction_id=data.get('transaction_id')  # type: ignore
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(distribution).data)
+
+
+@api_view(['POST'])
+def split_bill(request):
+    """Distribute a splitable bill across the society's flats"""
+    serializer = BillSplitSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    bill = EnhancedBill.objects.select_related('bill_type').get(id=data['bill_id'])  # type: ignore
+    if request.user.role not in ['ADMIN', 'SUB_ADMIN'] or bill.society_id not in accessible_society_ids(request):
+        return Response({'error': 'You do not have access to this bill'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        created = distribute_bill(
+            bill, mode=data['mode'],  # type: ignore
+            type_weights=data.get('type_weights'),  # type: ignore
+            custom_weights=data.get('custom_allocations')  # type: ignore
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'message': 'Bill distributed successfully',
+        'distributions_created': created
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+def import_bank_statement(request):
+    """Reconcile an uploaded bank/UPI statement CSV against the society's open bills"""
+    serializer = StatementImportSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    society = data['society']  # type: ignore
+    if request.user.role not in ['ADMIN', 'SUB_ADMIN'] or society.id not in accessible_society_ids(request):
+        return Response({'error': 'You do not have access to this society'}, status=status.HTTP_403_FORBIDDEN)
+    
+    # Unmatched lines hold residents' bank details, so they go back to the caller rather
+    # than to storage MEDIA_URL would serve
+    report = io.TextIOWrapper(tempfile.TemporaryFile(), encoding='utf-8', newline='')
+    try:
+        result = reconcile_statement(
+            society, codecs.iterdecode(data['file'], 'utf-8-sig'), report=report,  # type: ignore
+            dry_run=data['dry_run'], payment_mode=data['payment_mode']  # type: ignore
+        )
+        report.seek(0)
+    except (UnicodeDecodeError, ValueError) as e:
+        report.close()
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception:
+        report.close()
+        raise
+    
+    if data['unmatched_csv']:  # type: ignore
+        # Streamed from the temporary file, which is deleted once the response is closed
+        response = FileResponse(report.detach(), as_attachment=True, filename='unmatched-lines.csv',
+                                content_type='text/csv')
+        response['X-Matched-Rows'] = sum(result.matched.values())
+        response['X-Unmatched-Rows'] = result.unmatched
+        return response
+    
+    with report:
+        response = result.as_dict()
+        lines = csv.reader(report)
+        response['unmatched_columns'] = next(lines, [])
+        response['unmatched_rows'] = list(itertools.islice(lines, UNMATCHED_PREVIEW_ROWS))
+        response['unmatched_rows_truncated'] = result.unmatched > len(response['unmatched_rows'])
+    return Response(response)
+
+
+# Reports
+def _report_request(request):
+    """Society and date range of a report request, or an error Response"""
+    try:
+        society_id = int(request.query_params.get('society') or request.user.society_id)
+    except (TypeError, ValueError):
+        return None, Response({'error': 'society is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if society_id not in accessible_society_ids(request) or not request.user.has_permission('view_reports', society_id):
+        return None, Response({'error': 'You do not have access to reports for this society'},
+                              status=status.HTTP_403_FORBIDDEN)
+    
+    group_by = request.query_params.get('group_by', 'day')
+    if group_by not in REPORT_GROUPINGS:
+        return None, Response({'error': f'group_by must be one of {", ".join(REPORT_GROUPINGS)}'},
+                              status=status.HTTP_400_BAD_REQUEST)
+    try:
+        end = datetime.date.fromisoformat(request.query_params['to']) if request.query_params.get('to') \
+            else timezone.localdate()
+        start = datetime.date.fromisoformat(request.query_params['from']) if request.query_params.get('from') \
+            else end - datetime.timedelta(days=29)
+    except ValueError:
+        return None, Response({'error': 'from and to must be dates (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+    if start > end:
+        return None, Response({'error': 'from must not be after to'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return {'society': society_id, 'from': start.isoformat(), 'to': end.isoformat(), 'group_by': group_by}, None
+
+
+def _report_response(request, build_report):
+    params, error = _report_request(request)
+    if error is not None:
+        return error
+    report = build_report(
+        params['society'], datetime.date.fromisoformat(params['from']),
+        datetime.date.fromisoformat(params['to']), params['group_by']
+    )
+    return Response({**params, **report})
+
+
+@api_view(['GET'])
+def billing_report(request):
+    """Bills raised, collected and overdue, and complaints opened and resolved, per period"""
+    return _report_response(request, analytics.billing_report)
+
+
+@api_view(['GET'])
+def gate_report(request):
+    """Visitor and vehicle traffic per gate and period"""
+    return _report_response(request, analytics.gate_report)
+
+
+@api_view(['GET'])
+def amenity_report(request):
+    """Amenity booking requests per amenity and period"""
+    return _report_response(request, analytics.amenity_report)
+
+
+# Background jobs
+@api_view(['GET'])
+def job_status(request, job_id):
+    """Status, attempts and result of a background job"""
+    if request.user.role not in ['ADMIN', 'SUB_ADMIN']:
+        return Response({'error': 'Only admins can view background jobs'}, status=status.HTTP_403_FORBIDDEN)
+    job = BackgroundJob.objects.filter(pk=job_id).values(  # type: ignore
+        'id', 'task', 'queue', 'priority', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at',
+        'started_at', 'heartbeat_at', 'finished_at', 'duration_ms', 'result', 'last_error'
+    ).first()
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if request.user.role != 'ADMIN':
+        # Tracebacks are for platform admins
+        job['last_error'] = job['last_error'].strip().splitlines()[-1] if job['last_error'] else ''
+    return Response(job)
+
+
+@api_view(['GET'])
+def job_metrics(request):
+    """Per-task job counts and timings and queue depth, for platform admins"""
+    if request.user.role != 'ADMIN':
+        return Response({'error': 'Only admins can view job metrics'}, status=status.HTTP_403_FORBIDDEN)
+    return Response(jobs.metrics())
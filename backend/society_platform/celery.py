@@ -0,0 +1,41 @@
+"""
+Celery app, used when TASK_BACKEND is "celery".
+
+Start workers with ``celery -A society_platform worker -Q default,bulk,billing,reports,maintenance``
+and the scheduler with ``celery -A society_platform beat``. Jobs are recorded in the
+BackgroundJob table either way (see society_management/jobs.py); Celery only carries
+job ids, and beat only triggers the TASK_SCHEDULE check, which also re-queues jobs
+whose worker died.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'society_platform.settings')
+
+app = Celery('society_platform')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@app.task(name='society_management.execute_job', acks_late=True, ignore_result=True)
+def execute_job(job_id):
+    from society_management.jobs import execute
+    execute(job_id, worker='celery', ignore_eta=True)
+
+
+@app.on_after_finalize.connect
+def setup_periodic_tasks(sender, **kwargs):
+    from django.conf import settings
+    sender.add_periodic_task(
+        settings.TASK_SCHEDULER_INTERVAL, sender.signature('society_management.check_schedule'),
+        name='Queue due TASK_SCHEDULE jobs',
+    )
+
+
+@app.task(name='society_management.check_schedule', ignore_result=True)
+def check_schedule():
+    from society_management.jobs import enqueue_due, requeue_stale
+    # No run_jobs worker does this under Celery
+    requeue_stale()
+    enqueue_due()
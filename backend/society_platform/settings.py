@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'society_management.tenancy.SocietyScopeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -140,7 +141,7 @@ AUTH_USER_MODEL = 'society_management.User'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'society_management.token_auth.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -153,16 +154,105 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Token buckets of the public endpoints (see society_management/throttling.py):
+    # 'N/period' is N requests in a burst, refilled at N per period
+    'DEFAULT_THROTTLE_RATES': {
+        'otp_send_ip': config('THROTTLE_OTP_SEND_IP', default='30/hour'),
+        'otp_send_phone': config('THROTTLE_OTP_SEND_PHONE', default='5/hour'),
+        'otp_verify_ip': config('THROTTLE_OTP_VERIFY_IP', default='60/hour'),
+        'otp_verify_phone': config('THROTTLE_OTP_VERIFY_PHONE', default='10/hour'),
+        'login_ip': config('THROTTLE_LOGIN_IP', default='60/hour'),
+        'login_phone': config('THROTTLE_LOGIN_PHONE', default='20/hour'),
+        'registration_ip': config('THROTTLE_REGISTRATION_IP', default='20/hour'),
+        'registration_phone': config('THROTTLE_REGISTRATION_PHONE', default='5/hour'),
+        'search_ip': config('THROTTLE_SEARCH_IP', default='60/min'),
+    },
 }
 
+# Cache shared by every process (throttle buckets, OTP codes, counters); without
+# CACHE_REDIS_URL each process has its own local memory cache
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+if CACHE_REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_REDIS_URL}}
+THROTTLE_CACHE_ALIAS = config('THROTTLE_CACHE_ALIAS', default='default')
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'society_management.token_auth.ClaimsTokenRefreshSerializer',
 }
 
+# Seconds a user's current token version stays cached (bumping it clears it); tokens
+# whose version matches are trusted without loading the user
+TOKEN_VERSION_CACHE_TIMEOUT = config('TOKEN_VERSION_CACHE_TIMEOUT', default=300, cast=int)
+
+# Refresh token revocation (see society_management/revocation.py): revoked tokens are
+# held in per-process Bloom filters, one per bucket of token expiry, so checking a token
+# that was never revoked costs no query. Each filter takes REVOCATION_FILTER_BITS / 8
+# bytes; at the defaults a bucket holds ~200k revocations at a 1% false positive rate.
+REVOCATION_BUCKET_SECONDS = config('REVOCATION_BUCKET_SECONDS', default=86400, cast=int)
+REVOCATION_FILTER_BITS = config('REVOCATION_FILTER_BITS', default=2 ** 21, cast=int)
+REVOCATION_FILTER_HASHES = config('REVOCATION_FILTER_HASHES', default=7, cast=int)
+# Seconds between catching up with tokens revoked by other processes
+REVOCATION_SYNC_INTERVAL = config('REVOCATION_SYNC_INTERVAL', default=5, cast=int)
+
+# Permission matrix: seconds between checks for invalidations made by other processes
+PERMISSION_MATRIX_CHECK_INTERVAL = config('PERMISSION_MATRIX_CHECK_INTERVAL', default=5, cast=int)
+# Seconds a compiled matrix is used before it is recompiled from the database
+PERMISSION_MATRIX_TTL = config('PERMISSION_MATRIX_TTL', default=300, cast=int)
+
+# Seconds an admin's accessible society ids stay cached (AdminSociety changes clear it)
+ACCESSIBLE_SOCIETIES_CACHE_TIMEOUT = config('ACCESSIBLE_SOCIETIES_CACHE_TIMEOUT', default=300, cast=int)
+
+# Dashboard counters: seconds a society's counters stay cached (changes clear them), and
+# seconds before a counters row is recounted from the tables to bound any drift
+SOCIETY_COUNTERS_CACHE_TIMEOUT = config('SOCIETY_COUNTERS_CACHE_TIMEOUT', default=60, cast=int)
+SOCIETY_COUNTERS_MAX_AGE = config('SOCIETY_COUNTERS_MAX_AGE', default=3600, cast=int)
+
+# Days the nightly analytics rollup rebuilds, ending today
+ANALYTICS_ROLLUP_LOOKBACK_DAYS = config('ANALYTICS_ROLLUP_LOOKBACK_DAYS', default=7, cast=int)
+
+# Rows fetched per round trip (and written per response chunk) by CSV/NDJSON exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Bulk user import: rows validated and inserted per batch, and processes hashing the
+# passwords given in the file (1 hashes inline)
+BULK_IMPORT_BATCH_SIZE = config('BULK_IMPORT_BATCH_SIZE', default=1000, cast=int)
+BULK_IMPORT_HASH_WORKERS = config('BULK_IMPORT_HASH_WORKERS', default=4, cast=int)
+
+# Background bulk operations (export, deactivation, role change): users per checkpointed
+# chunk, and seconds without progress before another worker may resume an operation
+BULK_OPERATION_CHUNK_SIZE = config('BULK_OPERATION_CHUNK_SIZE', default=500, cast=int)
+BULK_OPERATION_STALE_SECONDS = config('BULK_OPERATION_STALE_SECONDS', default=300, cast=int)
+
+# One-time passwords: "database" keeps OTP rows, "cache" keeps codes only in the
+# OTP_CACHE_ALIAS cache (it must be shared between processes, e.g. Redis); codes are
+# valid for OTP_TTL_SECONDS
+OTP_BACKEND = config('OTP_BACKEND', default='database')
+OTP_CACHE_ALIAS = config('OTP_CACHE_ALIAS', default='default')
+OTP_TTL_SECONDS = config('OTP_TTL_SECONDS', default=600, cast=int)
+
+# Lifecycle sweep: rows expired or purged per statement, days finished rows are kept
+# per policy (None keeps them), and hours after its expected entry that a pass without
+# an expected exit expires
+LIFECYCLE_SWEEP_CHUNK_SIZE = config('LIFECYCLE_SWEEP_CHUNK_SIZE', default=5000, cast=int)
+LIFECYCLE_RETENTION_DAYS = {
+    'otps': config('OTP_RETENTION_DAYS', default=7, cast=int),
+    'subadmin_invitations': 90,
+    'member_invitations': 90,
+    'staff_invitations': 90,
+    'chairman_invitations': 90,
+    # Gate logs point at passes, so they are kept unless a deployment opts in
+    'visitor_passes': None,
+    'background_jobs': config('BACKGROUND_JOB_RETENTION_DAYS', default=30, cast=int),
+    # Days past expiry; an expired refresh token is refused before its revocation is read
+    'revoked_tokens': 0,
+}
+VISITOR_PASS_GRACE_HOURS = config('VISITOR_PASS_GRACE_HOURS', default=24, cast=int)
+
 # CORS Settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -186,3 +276,27 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+# Let Redis honour job priorities 0-9
+CELERY_BROKER_TRANSPORT_OPTIONS = {'queue_order_strategy': 'priority', 'priority_steps': list(range(10))}
+
+# Background jobs (society_management/jobs.py): "database" runs them on manage.py run_jobs
+# workers, "celery" on Celery with the broker above, "immediate" in-process after commit
+TASK_BACKEND = config('TASK_BACKEND', default='database')
+TASK_WORKER_POLL_INTERVAL = config('TASK_WORKER_POLL_INTERVAL', default=1.0, cast=float)
+# Seconds without a heartbeat before a running job is taken to have lost its worker and
+# is queued again; long tasks call jobs.heartbeat() at most every TASK_HEARTBEAT_INTERVAL
+TASK_JOB_TIMEOUT = config('TASK_JOB_TIMEOUT', default=1800, cast=int)
+TASK_HEARTBEAT_INTERVAL = config('TASK_HEARTBEAT_INTERVAL', default=30, cast=int)
+# Retry delay doubles from TASK_RETRY_BACKOFF seconds up to TASK_RETRY_BACKOFF_MAX
+TASK_RETRY_BACKOFF = config('TASK_RETRY_BACKOFF', default=10, cast=int)
+TASK_RETRY_BACKOFF_MAX = config('TASK_RETRY_BACKOFF_MAX', default=3600, cast=int)
+# Seconds between checks for due scheduled jobs
+TASK_SCHEDULER_INTERVAL = config('TASK_SCHEDULER_INTERVAL', default=30, cast=int)
+TASK_SCHEDULE = {
+    'sweep-overdue-bills': {'task': 'society_management.sweep_overdue_bills', 'interval': 60 * 60},
+    'materialize-recurring-bills': {'task': 'society_management.materialize_recurring_bills', 'interval': 60 * 60},
+    'rollup-daily-stats': {'task': 'society_management.rollup_daily_stats', 'interval': 6 * 60 * 60},
+    'resume-bulk-operations': {'task': 'society_management.resume_bulk_operations', 'interval': 5 * 60},
+    'sweep-expired-records': {'task': 'society_management.sweep_expired_records', 'interval': 60 * 60},
+}